@@ -0,0 +1,91 @@
+"""
+persisted Bloom filter over the package names of one volume index.
+
+a miss is definite, so names that were never indexed can be ruled out without
+opening the index. at the default 1% false positive rate a filter costs about
+10 bits per package name.
+
+    header  magic, version, generation, bit count, hash count
+    bits    the filter, bit count / 8 bytes
+"""
+
+import hashlib
+import math
+import os
+import struct
+from pathlib import Path
+from typing import Iterable
+
+from repair_tools.compact_index import atomic_write
+
+MAGIC = b"RTBF"
+VERSION = 1
+HEADER = struct.Struct("<4sIQQI")
+ERROR_RATE = 0.01
+
+
+def read_generation(bloom_file: Path) -> int | None:
+    """generation of the index the filter was built from, None if unreadable or truncated"""
+    try:
+        with open(bloom_file, "rb") as f:
+            magic, version, generation, num_bits, _ = HEADER.unpack(f.read(HEADER.size))
+            size = os.fstat(f.fileno()).st_size
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC or version != VERSION or size != HEADER.size + (num_bits + 7) // 8:
+        return None
+    return generation
+
+
+class BloomFilter:
+    def __init__(self, num_bits: int, num_hashes: int, bits: bytearray | None = None, generation: int = 0):
+        self.num_bits = max(num_bits, 8)
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.generation = generation
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float = ERROR_RATE, generation: int = 0) -> "BloomFilter":
+        """size a filter for capacity names at the given false positive rate"""
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes, generation=generation)
+
+    @classmethod
+    def from_names(cls, names: Iterable[str], capacity: int, error_rate: float = ERROR_RATE, generation: int = 0):
+        bloom = cls.for_capacity(capacity, error_rate, generation)
+        for name in names:
+            bloom.add(name)
+        return bloom
+
+    def _positions(self, name: str) -> Iterable[int]:
+        # double hashing, two 64-bit halves of one digest stand in for k hash functions
+        digest = hashlib.blake2b(name.encode(), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, name: str):
+        for pos in self._positions(name):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, name: str) -> bool:
+        """False means the name is definitely not in the index"""
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(name))
+
+    def write(self, bloom_file: Path):
+        with atomic_write(bloom_file) as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.generation, self.num_bits, self.num_hashes))
+            f.write(self.bits)
+
+    @classmethod
+    def read(cls, bloom_file: Path) -> "BloomFilter | None":
+        """the filter stored in bloom_file, None if missing or unreadable"""
+        try:
+            data = Path(bloom_file).read_bytes()
+            magic, version, generation, num_bits, num_hashes = HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            return None
+        if magic != MAGIC or version != VERSION or len(data) - HEADER.size != (num_bits + 7) // 8:
+            return None
+        return cls(num_bits, num_hashes, bytearray(data[HEADER.size :]), generation)
@@ -0,0 +1,247 @@
+"""
+read-only snapshot of a package index, laid out so it can be memory-mapped.
+
+    header          magic, version, generation, entry/prefix counts, blob sizes
+    name_offsets    uint64 * (entries + 1), offsets into the names blob
+    entry_prefix    uint32 * entries, parent directory id of each entry
+    prefix_offsets  uint64 * (prefixes + 1), offsets into the prefixes blob
+    names blob      utf-8 package names, sorted
+    prefixes blob   utf-8 parent directories, each stored once
+
+an entry's path is its prefix joined with its name. nothing is decoded until a
+lookup touches it, and lookups binary search the sorted names.
+"""
+
+import fnmatch
+import mmap
+import os
+import re
+import struct
+import tempfile
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator
+
+MAGIC = b"RTCI"
+VERSION = 1
+HEADER = struct.Struct("<4sIQQQQQ")
+
+
+@contextmanager
+def atomic_write(path: Path) -> Iterator[BinaryIO]:
+    """
+    write path through a temp file of its own, moved into place once complete.
+    concurrent writers never interleave into one file, and replacing keeps the old
+    file valid for readers that still have it mapped
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name, suffix=".tmp", delete=False) as f:
+        try:
+            yield f
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    # NamedTemporaryFile creates it private, the index files are shared
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, path)
+
+
+def _pad(n: int) -> int:
+    return -n % 8
+
+
+def _size(n_entries: int, n_prefixes: int, names_len: int, prefixes_len: int) -> int:
+    """file size implied by a header's counts"""
+    return (
+        HEADER.size
+        + (n_entries + 1) * 8
+        + n_entries * 4
+        + _pad(n_entries * 4)
+        + (n_prefixes + 1) * 8
+        + names_len
+        + prefixes_len
+    )
+
+
+def write_compact(index_file: Path, items: Iterable[tuple[str, str]], generation: int = 0):
+    """write (name, path) items, which must already be sorted by name, to index_file"""
+    names = bytearray()
+    name_offsets = array("Q", [0])
+    entry_prefix = array("I")
+    prefix_ids = {}
+    prefixes = bytearray()
+    prefix_offsets = array("Q", [0])
+
+    for name, path in items:
+        prefix = os.path.dirname(path)
+        prefix_id = prefix_ids.get(prefix)
+        if prefix_id is None:
+            prefix_id = prefix_ids[prefix] = len(prefix_ids)
+            prefixes += prefix.encode()
+            prefix_offsets.append(len(prefixes))
+        names += name.encode()
+        name_offsets.append(len(names))
+        entry_prefix.append(prefix_id)
+
+    with atomic_write(index_file) as f:
+        f.write(
+            HEADER.pack(
+                MAGIC, VERSION, generation, len(entry_prefix), len(prefix_ids), len(names), len(prefixes)
+            )
+        )
+        f.write(name_offsets.tobytes())
+        f.write(entry_prefix.tobytes())
+        f.write(b"\0" * _pad(len(entry_prefix) * 4))
+        f.write(prefix_offsets.tobytes())
+        f.write(names)
+        f.write(prefixes)
+
+
+def read_generation(index_file: Path) -> int | None:
+    """generation of the index the snapshot was written from, None if unreadable or truncated"""
+    try:
+        with open(index_file, "rb") as f:
+            magic, version, generation, *counts = HEADER.unpack(f.read(HEADER.size))
+            size = os.fstat(f.fileno()).st_size
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC or version != VERSION or size != _size(*counts):
+        return None
+    return generation
+
+
+class CompactIndex:
+    """memory-mapped, lazily decoded view of a snapshot written by write_compact"""
+
+    def __init__(self, index_file: Path):
+        self.index_file = Path(index_file)
+        with open(self.index_file, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._mmap)
+        try:
+            magic, version, self.generation, n_entries, n_prefixes, names_len, prefixes_len = HEADER.unpack_from(view)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != VERSION or len(view) != _size(n_entries, n_prefixes, names_len, prefixes_len):
+            view.release()
+            self._mmap.close()
+            raise ValueError(f"{self.index_file} is not a compact index or is truncated")
+
+        offset = HEADER.size
+        self._name_offsets = view[offset : offset + (n_entries + 1) * 8].cast("Q")
+        offset += (n_entries + 1) * 8
+        self._entry_prefix = view[offset : offset + n_entries * 4].cast("I")
+        offset += n_entries * 4 + _pad(n_entries * 4)
+        self._prefix_offsets = view[offset : offset + (n_prefixes + 1) * 8].cast("Q")
+        offset += (n_prefixes + 1) * 8
+        self._names = view[offset : offset + names_len]
+        offset += names_len
+        self._prefixes = view[offset : offset + prefixes_len]
+        self._views = [view, self._name_offsets, self._entry_prefix, self._prefix_offsets, self._names, self._prefixes]
+        self._n = n_entries
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._n
+
+    def count(self) -> int:
+        return self._n
+
+    ########## decoding
+
+    def _name(self, i: int) -> str:
+        return bytes(self._names[self._name_offsets[i] : self._name_offsets[i + 1]]).decode()
+
+    def _path(self, i: int) -> str:
+        prefix_id = self._entry_prefix[i]
+        start, end = self._prefix_offsets[prefix_id], self._prefix_offsets[prefix_id + 1]
+        return os.path.join(bytes(self._prefixes[start:end]).decode(), self._name(i))
+
+    def _lower_bound(self, name: str, lo: int = 0) -> int:
+        """first entry whose name is >= name"""
+        hi = self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    ########## lookups
+
+    def get(self, name: str) -> list[str]:
+        paths = []
+        i = self._lower_bound(name)
+        while i < self._n and self._name(i) == name:
+            paths.append(self._path(i))
+            i += 1
+        return paths
+
+    def get_many(self, names: Iterable[str]) -> dict[str, list[str]]:
+        """return {name: [paths]} for the names that are in the index"""
+        found = {}
+        lo = 0
+        # sorted queries let each search start where the previous one stopped
+        for name in sorted(set(names)):
+            lo = self._lower_bound(name, lo)
+            i = lo
+            while i < self._n and self._name(i) == name:
+                found.setdefault(name, []).append(self._path(i))
+                i += 1
+        return found
+
+    def __contains__(self, name: str) -> bool:
+        i = self._lower_bound(name)
+        return i < self._n and self._name(i) == name
+
+    def items(self) -> Iterator[tuple[str, str]]:
+        """stream (name, path) for every package, sorted by name"""
+        for i in range(self._n):
+            yield self._name(i), self._path(i)
+
+    ########## sorted queries
+
+    def prefix(self, prefix: str) -> Iterator[tuple[str, str]]:
+        """(name, path) for every name starting with prefix"""
+        i = self._lower_bound(prefix)
+        while i < self._n:
+            name = self._name(i)
+            if not name.startswith(prefix):
+                return
+            yield name, self._path(i)
+            i += 1
+
+    def range(self, first: str, last: str) -> Iterator[tuple[str, str]]:
+        """
+        (name, path) for every name from first to last, inclusive.
+        AMI IDs are all six digits, so this is also a numeric range for them
+        """
+        i = self._lower_bound(first)
+        while i < self._n:
+            name = self._name(i)
+            if name > last:
+                return
+            yield name, self._path(i)
+            i += 1
+
+    def glob(self, pattern: str) -> Iterator[tuple[str, str]]:
+        """(name, path) for every name matching a shell-style pattern"""
+        literal = re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+        for name, path in self.prefix(literal):
+            if fnmatch.fnmatchcase(name, pattern):
+                yield name, path
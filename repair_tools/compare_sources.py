@@ -1,16 +1,22 @@
-import time
 from pathlib import Path
 import argparse
 import os
-import json
 import subprocess
 import logging
 import datetime
-import requests
-import re
 import shutil
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+import repair_tools.duplicates as duplicates
+import repair_tools.index_query as index_query
+import repair_tools.package_id as package_id
+import repair_tools.package_size as package_size
 import repair_tools.prsv_api as prsvapi
+import repair_tools.prsv_cache as prsv_cache
+import repair_tools.prsv_mirror as prsv_mirror
+import repair_tools.volume_index as volume_index
+import repair_tools.walker as walker
+from repair_tools.prsv_client import PreservicaClient
 
 def setup_logging(log_file: Path):
     logger = logging.getLogger()
@@ -42,12 +48,19 @@ def setup_logging(log_file: Path):
 
 ################# Variables
 
-CACHE_PATH = Path("/Users/emileebuytkins/Documents/Buytkins_Programming/compare_volumes_logs_index/target_index.json")
-SOURCE_CACHE_PATH = Path("/Users/emileebuytkins/Documents/Buytkins_Programming/index_files/source_index_reingest.json")
 DELETION_LIST_PATH = Path("/Users/emileebuytkins/Documents/Buytkins_Programming/complete_reingest.txt")
 
 NUM_THREADS = (os.cpu_count() - 2) if (os.cpu_count() - 2) > 0 else 1
 
+# Preservica lookups in flight at once, they spend nearly all their time waiting on the network
+CHECK_CONCURRENCY = 16
+
+# the test tenant has no AMI folder, so AMI packages can't be checked with test credentials
+NO_AMI_FOLDER = "no AMI folder for these credentials"
+
+# only AMI objects carrying this identifier are packages, in searches and in the mirror alike
+AMI_CONTAINER = "DigitizedAMIContainer"
+
 move_count = 0
 copy_count = 0
 failed_dict = {}
@@ -74,7 +87,8 @@ def parse_args():
         "--target",
         "-t",
         type=extant_dir,
-        help="""Complete path to volume to be searched in.""",
+        nargs="+",
+        help="""Complete path to volume(s) to be searched in. If multiple, separate by space.""",
         )
     parser.add_argument(
         "--copydir",
@@ -111,6 +125,60 @@ def parse_args():
         action="store_true",
         help="Flag to use cached source index",
         )
+    parser.add_argument(
+        "--check-duplicates",
+        action="store_true",
+        help="Flag to fingerprint source packages found at several paths and leave out the ones whose copies differ",
+        )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="Flag to rebuild the cached source and target indexes instead of refreshing them",
+        )
+    parser.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="Flag to use the cached source and target indexes without refreshing them",
+        )
+    parser.add_argument(
+        "--validate-index",
+        action="store_true",
+        help="Flag to only check the cached target paths of the packages being compared instead of refreshing the whole target index",
+        )
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=CHECK_CONCURRENCY,
+        help=f"Number of packages checked against Preservica at once, default {CHECK_CONCURRENCY}",
+        )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=prsv_cache.TTL / 3600,
+        help=f"Hours a cached Preservica answer for a found package is trusted, default {prsv_cache.TTL / 3600:g}",
+        )
+    parser.add_argument(
+        "--negative-ttl",
+        type=float,
+        default=prsv_cache.NEGATIVE_TTL / 3600,
+        help=f"Hours a cached Preservica answer for a missing package is trusted, default {prsv_cache.NEGATIVE_TTL / 3600:g}",
+        )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Flag to ask Preservica about every package instead of reusing cached answers",
+        )
+    parser.add_argument(
+        "--invalidate-cache",
+        action="store_true",
+        help="Flag to drop the cached answers for the searched Preservica folders before checking",
+        )
+    parser.add_argument(
+        "--mirror",
+        action="store_true",
+        help="Flag to check packages against the local Preservica mirror taken with prsv_mirror instead of the API",
+        )
     parser.add_argument(
         "--checklist",
         "-cl",
@@ -134,141 +202,175 @@ def parse_args():
 #################
 
 def get_source_dirs(source_dir: Path, logger: logging.Logger) -> list[str]:
-    # return {p.name for p in source_dir.iterdir() if p.is_dir()}
     logger.info("Getting source directory names...")
-    # returning only AMI directories, should be modified for any DigArch names*******************************************
-    # using string pattern instead of regex as rglob does not support it
-    ami_id_pattern = "[0-9][0-9][0-9][0-9][0-9][0-9]"
-    return {p.name for p in source_dir.rglob(ami_id_pattern) if p.is_dir()}
-    # return {p.name for p in source_dir.rglob("*") if p.is_dir() and len(p.name) == 6 and p.name.isdigit()}
-
-# why did I make this a whole function?
-def is_six_digit_dir(name: str) -> bool:
-    return len(name) == 6 and name.isdigit()
-
-def find_matching_dirs(root: str, dirs: list[str]) -> dict:
-    matches = {}
-
-    for d in dirs:
-        if is_six_digit_dir(d):
-            full_path = os.path.join(root, d)
-            if d not in matches:
-                matches[d] = []
-            matches[d].append(full_path)
-
-    return matches
-
-def index_target_dirs(target_dir: Path, logger: logging.Logger) -> dict:
-    logger.info("Indexing target volume:")
-
-    index = {}
-    tasks = []
-
-    with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
-        for root, dirs, _ in os.walk(target_dir):
-            logger.info(root)
-            if any(is_six_digit_dir(d) for d in dirs):
-                tasks.append(executor.submit(find_matching_dirs, root, dirs))
-
-        for future in as_completed(tasks):
-            result = future.result()
-            for name, paths in result.items():
-                if name not in index:
-                    index[name] = []
-                index[name].extend(paths)
-    return index
-
-def find_index(target_dir: Path,logger, cache_path: Path = CACHE_PATH) -> dict:
-    if cache_path.exists():
-        logger.info(f"Loading target volume index from: {cache_path}")
-        with open(cache_path, "r") as f:
-            return json.load(f)
-    else:
-        index = index_target_dirs(target_dir, logger)
-        logger.info(f"Saving target volume index to: {cache_path}")
-        with open(cache_path, "w") as f:
-            json.dump(index, f, indent=2)
-        return index
-    
-def find_source_index(source_dir: Path, logger, cache_path: Path = SOURCE_CACHE_PATH) -> dict:
-    cache_path = Path(str(SOURCE_CACHE_PATH).replace("_reingest", f"_{source_dir.name}_reingest"))
-    if cache_path.exists():
-        logger.info(f"Loading source index from {cache_path}")
-        with open(cache_path, "r") as f:
-            return {key: Path(value) for key, value in json.load(f).items()}
+    return set(get_source_index(source_dir))
+
+def find_index(
+    target_dirs: list[Path], logger, names, rebuild: bool = False, refresh: bool = True, validate: bool = False
+) -> dict:
+    """look up only the given package names across every target volume's index shard"""
+    logger.info(f"Searching target volume indexes for: {', '.join(str(t) for t in target_dirs)}")
+    found = index_query.lookup(target_dirs, names, rebuild, refresh, validate)
+    for name, locations in found.items():
+        if len(locations) > 1:
+            logger.info(f"{name} found in {len(locations)} target locations: {', '.join(l.path for l in locations)}")
+    return found
+
+def pick_copy(paths: list[str]) -> Path:
+    """the copy used for a package found at several source paths, the first in path order"""
+    return Path(min(paths))
+
+def find_source_index(
+    source_dir: Path, logger, rebuild: bool = False, refresh: bool = True, check_duplicates: bool = False
+) -> dict:
+    """
+    one path per package name, picked by pick_copy when a name is found at several paths.
+    check_duplicates fingerprints those copies and leaves out the names whose copies
+    are not identical, or could not be read, instead of picking one of them
+    """
+    logger.info(f"Loading source index for: {source_dir}")
+    found = {}
+    with volume_index.load_index(source_dir, rebuild=rebuild, refresh_index=refresh) as source_index:
+        for name, path in source_index.items():
+            found.setdefault(name, []).append(path)
+    logger.info(f"Source index loaded with {len(found)} items")
+
+    if check_duplicates:
+        for name, groups in duplicates.find_duplicates(found).items():
+            if len(groups) == 1 and sum(map(len, groups.values())) == len(found[name]):
+                continue
+            duplicates.log_report(name, groups, logger)
+            logger.warning(f"{name}: copies are not identical, left out of the source index, resolve them by hand")
+            del found[name]
     else:
-        logger.info("Creating new source index.")
-        index = {dir.name: dir for dir in source_dir.rglob("*") if dir.is_dir() and len(dir.name)==6 and dir.name.isdigit()}
-        logger.info(f"Source index created with {len(index)} items")
-        cache_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(cache_path, "w") as f:
-            json.dump({key: str(value) for key, value in index.items()}, f, indent=2)
-        return index
+        for name, paths in found.items():
+            if len(paths) > 1:
+                logger.warning(
+                    f"{name} found at {len(paths)} source paths, using {pick_copy(paths)}; "
+                    "pass --check-duplicates to compare the copies"
+                )
+    return {name: pick_copy(paths) for name, paths in found.items()}
 
 ############# Prsv API from export_metadata
 
-def search_preservica_api(
-    accesstoken: str, query_params: dict, parentuuid: str
-) -> requests.Response:
-    query = json.dumps(query_params)
-    #search-within
-    search_url = f"https://nypl.preservica.com/api/content/search-within?q={query}&parenthierarchy={parentuuid}&start=0&max=-1&metadata=''"
-    search_headers = {
-        "Preservica-Access-Token": accesstoken,
-        "Content-Type": "application/xml;charset=UTF-8",
-    }
-    # logging.info("")
-    search_response = requests.get(search_url, headers=search_headers, timeout=30)
-
-    logging.info("")
-    return search_response
-
 def get_packages_uuids(
-    accesstoken: str, pkg_id: str, parentuuid: str
-) -> requests.Response:
-    try: 
-        col_id = re.search(r"(M\d+)_(ER|DI|EM)_\d+", pkg_id).group(1)
-    except AttributeError:
-        return None
-    query_params = {
-        "q": "",
-        "fields": [
-            {"name": "xip.title", "values": [pkg_id]},
-            {"name": "spec.specCollectionID", "values": [col_id]},
-        ],
-    }
-    return search_preservica_api(accesstoken, query_params, parentuuid)
+    client: PreservicaClient, pkg_ids: list[str], parentuuid: str, cache: prsv_cache.LookupCache | None = None
+) -> dict[str, list]:
+    """DigArch package uuids, searched in batches that all share one collection ID"""
+    found = {}
+    collections = {}
+    for pkg_id in pkg_ids:
+        pkg = package_id.classify(pkg_id)
+        if pkg is None or pkg.collection is None:
+            found[pkg_id] = []
+        else:
+            collections.setdefault(pkg.collection, []).append(pkg_id)
+    for col_id, col_pkgs in collections.items():
+        fields = [{"name": "spec.specCollectionID", "values": [col_id]}]
+        found.update(prsv_cache.search_titles(client, cache, col_pkgs, parentuuid, fields))
+    return found
 
 def get_amipackages_uuids(
-        accesstoken: str, pkg_id: str, parentuuid: str
-) -> requests.Response:
-    """get AMI uuids based on first 3 digits of AMI ID"""
-    query_params = {
-        "q": "%",
-        "fields": [
-            {"name": "xip.title", "values": [f"{pkg_id}"]},
-            {"name": "xip.identifier", "values": ["DigitizedAMIContainer"]}
-        ]
-    }
-    return search_preservica_api(accesstoken, query_params, parentuuid)
-
-def parse_structural_object_uuid(res: requests.Response) -> list:
-    """function to parse json API response into a list of UUIDs"""
-    uuid_ls = list()
-
-    if res is None:
-        return uuid_ls
-    
-    json_obj = json.loads(res.text)
-
-    value = json_obj.get("value")
-    if value and value.get("objectIds"):
-        obj_ids = json_obj["value"]["objectIds"]
-        for sdbso in obj_ids:
-            uuid_ls.append(sdbso[-36:])
+        client: PreservicaClient, pkg_ids: list[str], parentuuid: str, cache: prsv_cache.LookupCache | None = None
+) -> dict[str, list]:
+    """get AMI container uuids for a batch of AMI IDs"""
+    fields = [{"name": "xip.identifier", "values": [AMI_CONTAINER]}]
+    return prsv_cache.search_titles(client, cache, pkg_ids, parentuuid, fields, q="%")
+
+def check_batch(
+    client: PreservicaClient, pkg_ids: list[str], digarch_uuid: str, ami_uuid: str | None, cache: prsv_cache.LookupCache | None = None
+) -> dict[str, list]:
+    if pkg_ids[0].startswith("M"):
+        return get_packages_uuids(client, pkg_ids, digarch_uuid, cache)
+    return get_amipackages_uuids(client, pkg_ids, ami_uuid, cache)
+
+def check_batches(pkg_ids: list[str]) -> list[list[str]]:
+    """split packages into search batches of one kind, DigArch batches from a single collection"""
+    groups = {}
+    for pkg_id in sorted(pkg_ids):
+        if pkg_id.startswith("M"):
+            pkg = package_id.classify(pkg_id)
+            key = pkg.collection if pkg else None
+        else:
+            key = package_id.AMI
+        groups.setdefault(key, []).append(pkg_id)
+    return [
+        group[i : i + prsvapi.TITLE_BATCH] for group in groups.values() for i in range(0, len(group), prsvapi.TITLE_BATCH)
+    ]
+
+def check_preservica(
+    client: PreservicaClient,
+    pkg_ids: list[str],
+    digarch_uuid: str,
+    ami_uuid: str | None,
+    concurrency: int,
+    logger: logging.Logger,
+    cache: prsv_cache.LookupCache | None = None,
+) -> tuple[dict[str, list], dict[str, str]]:
+    """
+    look up packages in Preservica in batched searches, at most concurrency batches at a time.
+    answers still fresh in cache are not asked again.
+    returns ({package: [uuids]}, {package: error}) for the packages that could not be checked
+    """
+    found = {}
+    errors = {}
+    batches = []
+    for batch in check_batches(pkg_ids):
+        if not batch[0].startswith("M") and ami_uuid is None:
+            # test credentials have no AMI folder, searching without a parent would search everything
+            logger.error(f"No AMI folder for these credentials to check {len(batch)} packages ({batch[0]}...) against")
+            errors.update((pkg_id, NO_AMI_FOLDER) for pkg_id in batch)
+        else:
+            batches.append(batch)
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        futures = {
+            executor.submit(check_batch, client, batch, digarch_uuid, ami_uuid, cache): batch
+            for batch in batches
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            batch = futures[future]
+            try:
+                found.update(future.result())
+            except Exception as e:
+                # transient errors were already retried by the client
+                logger.error(f"Could not check {len(batch)} packages ({batch[0]}...) in Preservica: {e}")
+                errors.update((pkg_id, str(e)) for pkg_id in batch)
+            if done % 50 == 0:
+                logger.info(f"Checked {done} of {len(futures)} batches")
+    return found, errors
+
+def check_mirror(
+    mirror: prsv_mirror.Mirror, pkg_ids: list[str], digarch_uuid: str, ami_uuid: str | None, logger: logging.Logger
+) -> tuple[dict[str, list], dict[str, str]]:
+    """
+    check_preservica against a local snapshot, every package in one local query per folder.
+    AMI packages only match DigitizedAMIContainer objects, as in the API search
+    """
+    found = {}
+    errors = {}
+    groups = {digarch_uuid: [], ami_uuid: []}
+    for pkg_id in pkg_ids:
+        groups[digarch_uuid if pkg_id.startswith("M") else ami_uuid].append(pkg_id)
+    for parent, group in groups.items():
+        if not group:
+            continue
+        if parent is None:
+            logger.error(f"No AMI folder for these credentials to check {len(group)} packages against")
+            errors.update((pkg_id, NO_AMI_FOLDER) for pkg_id in group)
+            continue
+        taken = mirror.taken(parent)
+        if taken is None:
+            logger.error(f"No mirror of {parent} to check {len(group)} packages against, take one with prsv_mirror")
+            errors.update((pkg_id, f"no mirror of {parent}") for pkg_id in group)
+            continue
+        logger.info(f"Checking {len(group)} packages against the mirror of {parent} taken {datetime.datetime.fromtimestamp(taken):%Y-%m-%d %H:%M}")
+        try:
+            found.update(mirror.search_titles(group, parent, None if parent == digarch_uuid else AMI_CONTAINER))
+        except KeyError as e:
+            logger.error(f"Could not check {len(group)} packages against the mirror: {e.args[0]}")
+            errors.update((pkg_id, e.args[0]) for pkg_id in group)
+    return found, errors
 
-    return uuid_ls
-    
 ############# COPY/MOVE FUNCTIONS
 
 def copy_single_pkg(missing_dirs, source_index: dict, copy_dir: Path, logger: logging.Logger,): # change missing_dirs to dir_name for threading
@@ -358,14 +460,28 @@ def move_single_pkg(move_dirs, source_index: dict, ingest_dir: Path, logger: log
                 continue
     return m_move_count, m_failed_dict, m_skip_dict
 
-def get_source_index(single_dir: Path):
-    dir_index = {dir.name: dir for dir in single_dir.rglob("*") if dir.is_dir() and len(dir.name) == 6 and dir.name.isdigit()} 
-    return dir_index
+def plan_transfer(names: list[str], source_index: dict, source_dir: Path, logger: logging.Logger):
+    """
+    size the packages about to be copied or moved.
+    returns the names largest first, so the worker threads finish close together,
+    their sizes in bytes and a progress tracker for the whole run
+    """
+    paths = {name: source_index[name] for name in names if name in source_index}
+    sizes = package_size.measure_packages(source_dir, paths.values())
+    name_bytes = {name: sizes[path].total_bytes for name, path in paths.items() if path in sizes}
+    progress = package_size.Progress(sum(name_bytes.values()))
+    file_count = sum(sizes[path].file_count for path in paths.values() if path in sizes)
+    logger.info(f"{len(name_bytes)} packages to transfer: {file_count} files, {package_size.format_bytes(progress.total_bytes)}")
+    return sorted(names, key=lambda name: name_bytes.get(name, 0), reverse=True), name_bytes, progress
+
+def get_source_index(single_dir: Path) -> dict:
+    """uncached parallel walk, one path per AMI or DigArch package name, picked as find_source_index does"""
+    index = walker.find_packages(single_dir, package_id.is_package)
+    return {name: pick_copy(paths) for name, paths in index.items()}
 #############
 
 def main():
     args = parse_args()
-    SLEEP_DURATION = 2
 
     log_path = Path("/Users/emileebuytkins/Documents/Buytkins_Programming/compare_volumes_logs_index")
     log_path.mkdir(parents=True, exist_ok=True)
@@ -386,10 +502,12 @@ def main():
         logger.info(f"Scanning source directory: {args.source}")
         source_dir = Path(args.source)
         if args.srcindex:
-            source_index = find_source_index(source_dir, logger)
+            source_index = find_source_index(
+                source_dir, logger, args.rebuild_index, not args.no_refresh, args.check_duplicates
+            )
         else:
             logger.info("Creating temp source index...")
-            source_index = {dir.name: dir for dir in source_dir.rglob("*") if dir.is_dir() and len(dir.name) == 6 and dir.name.isdigit()}
+            source_index = get_source_index(source_dir)
             logger.info(f"Source index created with {len(source_index)} entries.")
         source_dirs = list(source_index.keys())
     else:
@@ -399,8 +517,9 @@ def main():
     target_index = {}
     if not args.prsvcheck:
         if args.target:
-            target_dir = Path(args.target)
-            target_index = find_index(target_dir, logger)
+            target_index = find_index(
+                args.target, logger, source_dirs, args.rebuild_index, not args.no_refresh, args.validate_index
+            )
         else:
             logger.error("When not using --prsvcheck you must provide --target argument")
             raise SystemExit("Missing --target")
@@ -408,13 +527,12 @@ def main():
     copy_dir = Path(args.copydir) if args.copydir else None
     move_dir = Path(args.movedir) if args.movedir else None
 
-    accesstoken = prsvapi.get_token(args.credentials)
-
+    ami_uuid = None
     if "test" in args.credentials:
-        digarch_uuid = "c0b9b47a-5552-4277-874e-092b3cc53af6"
+        digarch_uuid = prsv_mirror.HIERARCHIES["test-digarch"]
     else:
-        digarch_uuid = "e80315bc-42f5-44da-807f-446f78621c08"
-        ami_uuid = "183a74b5-7247-4fb2-8184-959366bc0cbc"
+        digarch_uuid = prsv_mirror.HIERARCHIES["digarch"]
+        ami_uuid = prsv_mirror.HIERARCHIES["digami"]
 
     logger.info(f"Checking {len(source_dirs)} packages against Preservica...")
 
@@ -422,22 +540,28 @@ def main():
     index_uuids = []
     prsv_uuids = []
 
-    for dir in sorted(source_dirs):
-        try:
-            if dir.startswith("M"):
-                res = get_packages_uuids(accesstoken, dir, digarch_uuid)
-            else:
-                res = get_amipackages_uuids(accesstoken, dir, ami_uuid)
-            find_prsv_pkg = parse_structural_object_uuid(res)
-        except Exception as e:
-            logging.warning(f"Error reaching prsv API, retrying {dir} in {SLEEP_DURATION} sec: {e}")
-            time.sleep(SLEEP_DURATION)
-            if dir.startswith("M"):
-                res = get_packages_uuids(accesstoken, dir, digarch_uuid)
-            else:
-                res = get_amipackages_uuids(accesstoken, dir, ami_uuid)
-            find_prsv_pkg = parse_structural_object_uuid(res)
+    # the client's pooled connections and the cache are closed however the check ends
+    with ExitStack() as stack:
+        client = stack.enter_context(PreservicaClient(args.credentials, pool_size=max(args.concurrency, NUM_THREADS)))
+        cache = None
+        if not args.no_cache and not args.mirror:
+            cache = stack.enter_context(
+                prsv_cache.LookupCache(ttl=args.cache_ttl * 3600, negative_ttl=args.negative_ttl * 3600)
+            )
+            if args.invalidate_cache:
+                for parent in filter(None, (digarch_uuid, ami_uuid)):
+                    logger.info(f"Dropped {cache.invalidate(parent, server=client.base_url)} cached answers for {parent}")
+
+        if args.mirror:
+            with prsv_mirror.Mirror() as mirror:
+                prsv_results, unchecked = check_mirror(mirror, source_dirs, digarch_uuid, ami_uuid, logger)
+        else:
+            prsv_results, unchecked = check_preservica(
+                client, source_dirs, digarch_uuid, ami_uuid, args.concurrency, logger, cache
+            )
 
+    for dir in sorted(prsv_results):
+        find_prsv_pkg = prsv_results[dir]
         if find_prsv_pkg == []: 
             if dir not in target_index:
                 missing_dirs.append(dir)
@@ -450,7 +574,9 @@ def main():
             prsv_uuids.append(dir)
 
     print(" --- COMPARE SUMMARY --- ")
-    logger.info(f"\nTotal packages checked: {len(source_dirs)}\nFound in Preservica: {len(prsv_uuids)}\nFound in target: {len(index_uuids)}\nMissing: {len(missing_dirs)}\n")
+    logger.info(f"\nTotal packages checked: {len(source_dirs)}\nFound in Preservica: {len(prsv_uuids)}\nFound in target: {len(index_uuids)}\nMissing: {len(missing_dirs)}\nCould not check: {len(unchecked)}\n")
+    for pkg_id, error in sorted(unchecked.items()):
+        logger.info(f"Could not check {pkg_id}: {error}")
 
     current_deletion_list = [line for line in DELETION_LIST_PATH.read_text().splitlines() if line.strip()]
     updated_list = [pkg for pkg in current_deletion_list if pkg not in prsv_uuids]
@@ -480,17 +606,20 @@ def main():
 
         if args.copydir:
             print(f"Copying {len(missing_dirs)} packages.")
+            copy_order, name_bytes, progress = plan_transfer(missing_dirs, source_index, Path(args.source), logger)
             with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
                 futures = {
                     executor.submit(copy_single_pkg, [dir_name], source_index, copy_dir, logger): 
-                    dir_name for dir_name in sorted(missing_dirs)
+                    dir_name for dir_name in copy_order
                 }
-                for future in sorted(as_completed(futures)):
+                for future in as_completed(futures):
                     dir_name = futures[future]
                     try:
                         copy_count, failed_dict = future.result()
                         successful_copies += copy_count
                         failed_items.update(failed_dict)
+                        progress.advance(name_bytes.get(dir_name, 0))
+                        logger.info(f"Copy progress: {progress.report()}")
                     except Exception as e:
                         logger.error(f"Error during copying {dir_name}: {e}")
             logger.info(f"{successful_copies} packages copied successfully.\n{len(failed_items)} packages failed to copy.\n {failed_items if failed_items else ''}")
@@ -500,10 +629,11 @@ def main():
 
             move_list = prsv_uuids if args.mvingested else missing_dirs
             print(f"Moving {len(move_list)} packages.")
+            move_order, name_bytes, progress = plan_transfer(move_list, source_index, Path(args.source), logger)
             with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
                 futures = {
                     executor.submit(move_single_pkg, [dir_name], source_index, move_dir, logger, r_mode): 
-                    dir_name for dir_name in sorted(move_list)
+                    dir_name for dir_name in move_order
                 }
                 for future in as_completed(futures):
                     dir_name = futures[future]
@@ -512,6 +642,8 @@ def main():
                         successful_moves += move_count
                         failed_items.update(failed_dict)
                         skipped_items.update(skip_dict)
+                        progress.advance(name_bytes.get(dir_name, 0))
+                        logger.info(f"Move progress: {progress.report()}")
                     except Exception as e:
                         logger.error(f"Error during moving {dir_name}: {e}")
 
@@ -1,14 +1,15 @@
-import json
 import logging
 import argparse
-import os
-import msgpack
-import re 
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
-INDEX_PATH = Path("/Users/emileebuytkins/Documents/Buytkins_Programming/index_files/repo_index.msgpack")
+import repair_tools.index_daemon as index_daemon
+import repair_tools.index_query as index_query
+import repair_tools.package_id as package_id
+import repair_tools.volume_index as volume_index
+from repair_tools.compact_index import CompactIndex
+
 INDEX_TXT_FILE = Path("/Users/emileebuytkins/Documents/Buytkins_Programming/index_files/repo_index.txt")
 
 ########## logging
@@ -50,7 +51,9 @@ def parse_args():
         "--ami-id",
         "-ami",
         nargs='*',
-        help="""Complete path to AMI pkg. If multiple, separate by space.""",
+        type=index_query.query_arg,
+        help="""AMI IDs to link. If multiple, separate by space.
+        Also accepts ranges (123000-123999), globs (123*) or "all" """,
         )
     
     parser.add_argument(
@@ -61,6 +64,16 @@ def parse_args():
         help="""Complete path to dir where symlink will be created""",
         )
     
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="""Flag to rebuild the source index instead of refreshing it""",
+        )
+    parser.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="""Flag to use the cached source index without refreshing it""",
+        )
     parser.add_argument(
         "--sym_false",
         "-sf",
@@ -70,53 +83,20 @@ def parse_args():
 
     return parser.parse_args()
 
-def create_index(source_dir: Path) -> dict:
-    """
-    Creates a targeted index by efficiently walking the directory.
-    This version is efficient because it "prunes" the search.
-    """
-    logging.info(f"Starting targeted index of {source_dir}...")
-    ami_regex = re.compile(r"^\d{6}$")
-    index_data = {}
-
-    for root, dirnames, _ in tqdm(os.walk(source_dir), desc="Indexing Source"):
-        dirs_to_prune = []
-        for dirname in dirnames:
-            if ami_regex.match(dirname):
-                full_path = os.path.join(root, dirname)
-
-                if dirname not in index_data:
-                    index_data[dirname] = []
-                index_data[dirname].append(full_path)
-                dirs_to_prune.append(dirname)
-        
-        if dirs_to_prune:
-            dirnames[:] = [d for d in dirnames if d not in dirs_to_prune]
-
-    return index_data
-
-def get_create_index(source_dir: Path, cache_path: Path = INDEX_PATH) -> dict:
-    if cache_path.exists():
-        logging.info(f"Loading index from: {cache_path}")
-        with open(cache_path, "rb") as f:
-            return msgpack.load(f)
-    else:
-        logging.info("No index found. Creating new index.")
-        index = create_index(source_dir)
-        logging.info(f"Saving index to cache: {cache_path}")
-        with open(cache_path, "wb") as f:
-            msgpack.dump(index, f)
-        return index
-
-def search_index(index_data: dict, ami_id: str = None) -> list[Path]:
-    all_paths = []
-    if ami_id:
-        for id in ami_id:
-            paths_str = index_data.get(id, [])
-            all_paths.extend(paths_str)
+def get_create_index(source_dir: Path, rebuild: bool = False, refresh: bool = True) -> CompactIndex:
+    return volume_index.load_index(source_dir, rebuild=rebuild, refresh_index=refresh)
+
+def search_index(index_data: CompactIndex, ami_id: list[str] = None) -> list[Path]:
+    all_paths = {}
+    if ami_id and "all" not in ami_id:
+        for query in ami_id:
+            for _, path in index_query.search(index_data, query):
+                all_paths.setdefault(path)
     else:
-        for path_list in index_data.values():
-            all_paths.extend(path_list)
+        # no IDs given, return every AMI package
+        for name, path in index_data.items():
+            if package_id.is_ami(name):
+                all_paths.setdefault(path)
     return [Path(p) for p in all_paths]
 
 def create_single_symlink(source_item: Path, dest_path: Path):
@@ -145,9 +125,14 @@ def main():
 
     args = parse_args()
 
-    index_data = get_create_index(args.source, INDEX_PATH)
-
-    source_list = search_index(index_data, args.ami_id)
+    found = None
+    if args.ami_id and not args.rebuild_index and all(index_query.is_exact(id) for id in args.ami_id):
+        found = index_daemon.lookup(args.source, args.ami_id)
+    if found is not None:
+        source_list = [Path(p) for paths in found.values() for p in paths]
+    else:
+        with get_create_index(args.source, args.rebuild_index, not args.no_refresh) as index_data:
+            source_list = search_index(index_data, args.ami_id)
 
     if not source_list:
         logging.warning("No matching directories found in the index. If multiple AMI ids, make sure they are separated by spaces not commas.")
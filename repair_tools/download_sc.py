@@ -1,7 +1,6 @@
 import argparse
 import logging
 import os
-import re
 import logging
 import boto3
 import datetime
@@ -10,7 +9,9 @@ import shutil
 from pathlib import Path
 from multiprocessing import Pool
 
+import repair_tools.package_id as package_id
 import repair_tools.video_processing as vp
+import repair_tools.walker as walker
 
 ################# Logging setup
 def setup_logging(log_file: Path):
@@ -211,10 +212,9 @@ def main():
     if args.package:
         pkg_paths.append(Path(args.package))
     else: 
-        dir_pattern = re.compile(r"^\d{6}$")
-        logging.info(f"Scanning {args.directory} for package directories matching pattern")
-        # pkg_paths = find_package_dirs(Path(args.directory), dir_pattern)
-        pkg_paths = [dir for dir in Path(args.directory).rglob("*") if dir_pattern.search(dir.name)]
+        logging.info(f"Scanning {args.directory} for AMI package directories")
+        found = walker.find_packages(Path(args.directory), package_id.is_ami)
+        pkg_paths = [Path(p) for paths in found.values() for p in paths]
 
     if not pkg_paths:
         logging.warning("No package directories found to process.")
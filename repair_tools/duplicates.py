@@ -0,0 +1,147 @@
+import argparse
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
+import repair_tools.index_query as index_query
+from repair_tools.walker import NUM_THREADS
+
+MANIFEST = "manifest-md5.txt"
+
+
+class Fingerprint(NamedTuple):
+    file_count: int
+    total_bytes: int
+    manifest_md5: str | None
+
+
+def fingerprint(path: Path) -> Fingerprint:
+    """
+    file count, total bytes and the md5 of the bag manifest of one package.
+    only directory entries and the manifest are read, never the payload
+    """
+    file_count = 0
+    total_bytes = 0
+    stack = [str(path)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    file_count += 1
+                    total_bytes += entry.stat(follow_symlinks=False).st_size
+
+    manifest = Path(path) / MANIFEST
+    manifest_md5 = hashlib.md5(manifest.read_bytes()).hexdigest() if manifest.is_file() else None
+    return Fingerprint(file_count, total_bytes, manifest_md5)
+
+
+def try_fingerprint(path: Path) -> Fingerprint | None:
+    try:
+        return fingerprint(path)
+    except OSError as e:
+        logging.warning(f"Could not fingerprint {path}: {e}")
+        return None
+
+
+def fingerprint_all(paths: Iterable[Path], num_threads: int = NUM_THREADS) -> dict[Path, Fingerprint]:
+    """fingerprint many package copies concurrently, leaving out the ones that cannot be read"""
+    paths = [Path(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=max(min(num_threads, len(paths)), 1)) as executor:
+        prints = executor.map(try_fingerprint, paths)
+        return {path: print_ for path, print_ in zip(paths, prints) if print_ is not None}
+
+
+def group_copies(paths: Iterable[Path], prints: dict[Path, Fingerprint]) -> dict[Fingerprint, list[Path]]:
+    groups = {}
+    for path in paths:
+        path = Path(path)
+        if path in prints:
+            groups.setdefault(prints[path], []).append(path)
+    return groups
+
+
+def find_duplicates(
+    found: dict[str, list], num_threads: int = NUM_THREADS
+) -> dict[str, dict[Fingerprint, list[Path]]]:
+    """
+    group the copies of every name found at more than one path by fingerprint.
+    a name with a single group has identical copies, more than one means they diverge
+    """
+    duplicates = {name: paths for name, paths in found.items() if len(paths) > 1}
+    prints = fingerprint_all((path for paths in duplicates.values() for path in paths), num_threads)
+    return {name: group_copies(paths, prints) for name, paths in duplicates.items()}
+
+
+def log_report(name: str, groups: dict[Fingerprint, list[Path]], logger: logging.Logger = logging.getLogger()):
+    copies = sum(len(paths) for paths in groups.values())
+    if len(groups) == 1:
+        logger.info(f"{name}: {copies} identical copies")
+    else:
+        logger.warning(f"{name}: {copies} copies diverge")
+    for print_, paths in groups.items():
+        for path in paths:
+            logger.info(
+                f"  - {path}: {print_.file_count} files, {print_.total_bytes} bytes, manifest {print_.manifest_md5 or 'missing'}"
+            )
+
+
+########## parser
+def extant_dir(p: str) -> Path:
+    path = Path(p)
+    if not path.is_dir():
+        raise argparse.ArgumentTypeError(f"{path} is not a directory")
+
+    return path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Report whether the copies of duplicated packages are identical")
+
+    parser.add_argument(
+        "names",
+        nargs="+",
+        type=index_query.query_arg,
+        help="""Package names or queries to check: exact names, "all", ranges (123000-123999) or globs (123*)""",
+        )
+    parser.add_argument(
+        "--volume",
+        "-v",
+        type=extant_dir,
+        nargs="+",
+        default=index_query.VOLUMES,
+        help="""Volume roots to search, each with its own index shard""",
+        )
+    parser.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="""Flag to use the cached shards without refreshing them""",
+        )
+
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    args = parse_args()
+
+    found = {}
+    with index_query.load_shards(args.volume, refresh_index=not args.no_refresh) as index:
+        for query in args.names:
+            for name, location in index_query.search(index, query):
+                found.setdefault(name, []).append(location.path)
+
+    duplicates = find_duplicates(found)
+    for name, groups in sorted(duplicates.items()):
+        log_report(name, groups)
+
+    divergent = sum(len(groups) > 1 for groups in duplicates.values())
+    logging.info(f"{len(duplicates)} duplicated packages, {len(duplicates) - divergent} identical, {divergent} divergent")
+
+
+if __name__ == "__main__":
+    main()
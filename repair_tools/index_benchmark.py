@@ -0,0 +1,172 @@
+"""
+generate a synthetic volume of AMI and DigArch packages and time the indexers over it,
+so walker changes can be measured before they are pointed at a real volume.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import repair_tools.package_id as package_id
+import repair_tools.volume_index as volume_index
+import repair_tools.walker as walker
+from repair_tools.index_store import IndexStore
+
+
+class Result(NamedTuple):
+    indexer: str
+    seconds: float
+    packages: int
+    stats: walker.WalkStats | None
+
+
+def bucket(i: int, depth: int, fanout: int) -> list[str]:
+    """the intermediate directories package number i is filed under"""
+    return [f"folder_{(i // fanout ** (level + 1)) % fanout}" for level in reversed(range(depth))]
+
+
+def make_tree(root: Path, ami: int, digarch: int, depth: int = 2, fanout: int = 10, files: int = 2) -> int:
+    """
+    fill root with ami AMI packages and digarch DigArch packages, each holding a small bag,
+    nested depth directories deep. returns the number of directories an indexer has to list
+    """
+    dirs = set()
+    packages = [(Path("ami", *bucket(i, depth, fanout)), f"{100000 + i:06d}") for i in range(ami)]
+    packages += [
+        (Path("digarch", f"M{1000 + i // 20}", *bucket(i, depth - 1, fanout)), f"M{1000 + i // 20}_ER_{i % 20}")
+        for i in range(digarch)
+    ]
+    for parent, name in packages:
+        data = root / parent / name / "data"
+        data.mkdir(parents=True, exist_ok=True)
+        (root / parent / name / "bagit.txt").write_text("BagIt-Version: 0.97\n")
+        for n in range(files):
+            (data / f"file_{n}.mkv").write_bytes(b"\0" * 64)
+        dirs.update(Path(*parent.parts[: k + 1]) for k in range(len(parent.parts)))
+    return len(dirs) + 1
+
+
+def legacy_walk(root: Path) -> dict[str, list[str]]:
+    """single-threaded os.walk, the way the tools indexed volumes before the walker module"""
+    index = {}
+    for dirpath, dirnames, _ in os.walk(root):
+        packages = [d for d in dirnames if package_id.is_package(d)]
+        for name in packages:
+            index.setdefault(name, []).append(os.path.join(dirpath, name))
+        dirnames[:] = [d for d in dirnames if d not in packages]
+    return index
+
+
+def run(name: str, indexer: Callable[[walker.WalkStats], int]) -> Result:
+    stats = walker.WalkStats()
+    start = time.monotonic()
+    packages = indexer(stats)
+    return Result(name, time.monotonic() - start, packages, stats if stats.dirs else None)
+
+
+def benchmark(root: Path, index_file: Path, num_threads: int = walker.NUM_THREADS) -> list[Result]:
+    def store_refresh(rebuild: bool):
+        def indexer(stats):
+            with IndexStore(index_file) as store:
+                volume_index.refresh(store, root, rebuild=rebuild, stats=stats)
+                return store.count()
+        return indexer
+
+    return [
+        run("os.walk, 1 thread", lambda stats: sum(map(len, legacy_walk(root).values()))),
+        run("walker, 1 thread", lambda stats: sum(map(len, walker.find_packages(root, package_id.is_package, 1, stats).values()))),
+        run(
+            f"walker, {num_threads} threads",
+            lambda stats: sum(map(len, walker.find_packages(root, package_id.is_package, num_threads, stats).values())),
+        ),
+        run("index build", store_refresh(rebuild=True)),
+        run("index refresh, unchanged", store_refresh(rebuild=False)),
+    ]
+
+
+def format_results(results: list[Result]) -> str:
+    lines = [f"{'indexer':<28}{'seconds':>10}{'packages':>10}{'dirs/sec':>12}{'listed':>10}{'stat calls':>12}"]
+    for r in results:
+        if r.stats is None:
+            lines.append(f"{r.indexer:<28}{r.seconds:>10.3f}{r.packages:>10}{'-':>12}{'-':>10}{'-':>12}")
+        else:
+            lines.append(
+                f"{r.indexer:<28}{r.seconds:>10.3f}{r.packages:>10}{r.stats.dirs / r.seconds:>12.0f}"
+                f"{r.stats.listed:>10}{r.stats.stat_calls:>12}"
+            )
+    return "\n".join(lines)
+
+
+########## parser
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time the volume indexers over a synthetic package tree")
+
+    parser.add_argument(
+        "--ami",
+        type=int,
+        default=10000,
+        help="""Number of AMI packages to generate""",
+        )
+    parser.add_argument(
+        "--digarch",
+        type=int,
+        default=2000,
+        help="""Number of DigArch packages to generate""",
+        )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=3,
+        help="""Directory levels between the volume root and each package""",
+        )
+    parser.add_argument(
+        "--fanout",
+        type=int,
+        default=10,
+        help="""Subdirectories per level""",
+        )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=walker.NUM_THREADS,
+        help="""Threads for the parallel walker""",
+        )
+    parser.add_argument(
+        "--root",
+        type=Path,
+        help="""Directory to generate the tree in, e.g. on a network mount. Defaults to a temp dir""",
+        )
+    parser.add_argument(
+        "--keep",
+        action="store_true",
+        help="""Flag to keep the generated tree and index afterwards""",
+        )
+
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s - %(message)s")
+    args = parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="index_benchmark_", dir=args.root))
+    try:
+        root = workdir / "volume"
+        start = time.monotonic()
+        dirs = make_tree(root, args.ami, args.digarch, args.depth, args.fanout)
+        print(f"Generated {args.ami + args.digarch} packages in {dirs} directories in {time.monotonic() - start:.1f}s")
+        print(format_results(benchmark(root, workdir / "index.sqlite", args.threads)))
+    finally:
+        if args.keep:
+            print(f"Kept {workdir}")
+        else:
+            shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,442 @@
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+import repair_tools.volume_index as volume_index
+from repair_tools.index_store import IndexStore
+
+SOCKET_PATH = volume_index.INDEX_DIR / "index_daemon.sock"
+
+# seconds between full incremental refreshes when inotify can't be used
+POLL_INTERVAL = 300
+# seconds to let a burst of inotify events settle before re-walking
+DEBOUNCE = 2
+
+# inotify does not see changes made by other clients of a network share
+NETWORK_FS_TYPES = {"cifs", "smbfs", "smb3", "nfs", "nfs4", "afpfs", "fuse.sshfs", "9p"}
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+
+########## logging
+def setup_logging():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+
+########## parser
+def extant_dir(p: str) -> Path:
+    path = Path(p)
+    if not path.is_dir():
+        raise argparse.ArgumentTypeError(f"{path} is not a directory")
+
+    return path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Keep volume indexes current and answer lookups over a Unix socket")
+
+    parser.add_argument(
+        "--volume",
+        "-v",
+        type=extant_dir,
+        nargs="+",
+        required=True,
+        help="""Root of each volume to index and watch""",
+        )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        default=SOCKET_PATH,
+        help=f"""Path of the Unix socket to listen on, default {SOCKET_PATH}""",
+        )
+    parser.add_argument(
+        "--poll-interval",
+        type=int,
+        default=POLL_INTERVAL,
+        help="""Seconds between refreshes of volumes that can't be watched with inotify""",
+        )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="""Flag to poll every volume instead of using inotify""",
+        )
+
+    return parser.parse_args()
+
+
+########## change detection
+def volume_key(root: Path) -> str:
+    return str(Path(root).resolve())
+
+
+def fs_type(path: Path) -> str | None:
+    """filesystem type of the mount holding path, from /proc/mounts (Linux only)"""
+    try:
+        mounts = Path("/proc/mounts").read_text().splitlines()
+    except OSError:
+        return None
+    path = str(Path(path).resolve())
+    best, best_type = "", None
+    for line in mounts:
+        fields = line.split()
+        if len(fields) < 3:
+            continue
+        mount_point = fields[1].replace("\\040", " ")
+        if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > len(best):
+            best, best_type = mount_point, fields[2]
+    return best_type
+
+
+class Inotify:
+    """minimal ctypes wrapper around the Linux inotify API"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or libc_name is None:
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        # kept alongside watches so membership checks don't rebuild a set of every path
+        self.paths = set()
+
+    def add_watch(self, path: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(err, f"inotify_add_watch failed for {path}")
+        self.watches[wd] = path
+        self.paths.add(path)
+
+    def watched(self) -> set[str]:
+        """the watched paths, kept current as watches are added and dropped"""
+        return self.paths
+
+    def read_changed_dirs(self, timeout: float) -> tuple[set[str], bool]:
+        """
+        directories whose entries changed, waiting up to timeout for the first event.
+        the flag is True when the kernel queue overflowed and events were lost
+        """
+        changed = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed, False
+
+        data = os.read(self.fd, 64 * 1024)
+        overflow = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size + name_len
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            path = self.watches.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                self.paths.discard(path)
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                changed.add(os.path.dirname(path))
+            else:
+                changed.add(path)
+        return changed, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+def collapse(paths: Iterable[str]) -> list[str]:
+    """drop paths that sit inside another path in the list"""
+    kept = []
+    for path in sorted(paths):
+        if not any(path == k or path.startswith(k + os.sep) for k in kept):
+            kept.append(path)
+    return kept
+
+
+class VolumeWatcher(threading.Thread):
+    """keeps one volume's index current, with inotify where possible and polling otherwise"""
+
+    def __init__(self, root: Path, index_file: Path, poll_interval: int, stop: threading.Event, poll: bool = False):
+        super().__init__(name=f"watch-{root.name}", daemon=True)
+        self.root = root
+        self.index_file = index_file
+        self.poll_interval = poll_interval
+        self.stop = stop
+        self.poll = poll
+        self.ready = threading.Event()
+
+    def run(self):
+        with IndexStore(self.index_file) as store:
+            try:
+                self.refresh(store)
+            finally:
+                self.ready.set()
+
+            inotify = None if self.poll else self.start_inotify(store)
+            if inotify is None:
+                self.poll_changes(store)
+            else:
+                try:
+                    self.watch_changes(store, inotify)
+                finally:
+                    inotify.close()
+
+    def refresh(self, store: IndexStore, subtree: Path | None = None):
+        """refresh the index, keeping the thread alive while the volume can't be read"""
+        try:
+            volume_index.refresh(store, self.root, subtree=subtree)
+        except OSError as e:
+            logging.error(f"Couldn't refresh the index of {self.root}: {e}")
+
+    def start_inotify(self, store: IndexStore) -> Inotify | None:
+        mount_type = fs_type(self.root)
+        if mount_type in NETWORK_FS_TYPES:
+            logging.info(f"{self.root} is on {mount_type}, polling every {self.poll_interval}s")
+            return None
+        try:
+            inotify = Inotify()
+        except OSError as e:
+            logging.warning(f"Can't watch {self.root} with inotify ({e}), polling every {self.poll_interval}s")
+            return None
+        try:
+            for path in store.load_dirs(str(self.root)):
+                inotify.add_watch(path)
+        except OSError as e:
+            # usually fs.inotify.max_user_watches is too low for the volume
+            logging.warning(f"Can't watch {self.root} with inotify ({e}), polling every {self.poll_interval}s")
+            inotify.close()
+            return None
+        logging.info(f"Watching {len(inotify.watches)} directories under {self.root}")
+        return inotify
+
+    def poll_changes(self, store: IndexStore):
+        while not self.stop.wait(self.poll_interval):
+            self.refresh(store)
+
+    def watch_changes(self, store: IndexStore, inotify: Inotify):
+        # catch up on anything that changed before the watches were in place
+        dirty = {str(self.root)}
+        dirty_since = last_event = 0.0
+        while not self.stop.is_set():
+            changed, overflow = inotify.read_changed_dirs(timeout=1)
+            if overflow:
+                logging.warning(f"inotify queue overflowed for {self.root}, refreshing the whole volume")
+                changed.add(str(self.root))
+            if changed:
+                if not dirty:
+                    dirty_since = time.monotonic()
+                last_event = time.monotonic()
+                dirty |= changed
+            if not dirty:
+                continue
+            # wait for a quiet moment, but don't let a steady stream of events starve the index
+            now = time.monotonic()
+            if now - last_event < DEBOUNCE and now - dirty_since < 10 * DEBOUNCE:
+                continue
+
+            refreshed = []
+            for subtree in collapse(dirty):
+                if subtree == str(self.root) or not subtree.startswith(str(self.root)):
+                    self.refresh(store)
+                    refreshed = [None]
+                    break
+                self.refresh(store, Path(subtree))
+                refreshed.append(subtree)
+            dirty.clear()
+
+            # watch directories that appeared during the refresh, only reading the
+            # records of the subtrees just walked unless the whole volume was
+            watched = inotify.watched()
+            try:
+                for subtree in refreshed:
+                    for path in store.load_dirs(str(self.root), under=subtree):
+                        if path not in watched:
+                            inotify.add_watch(path)
+            except OSError as e:
+                logging.warning(f"Can't add more inotify watches under {self.root}: {e}")
+
+
+########## lookup server
+class IndexRequestHandler(socketserver.StreamRequestHandler):
+    """one JSON request per line, one JSON response per line"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.index_daemon.handle_request(json.loads(line))
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class IndexServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class IndexDaemon:
+    def __init__(
+        self,
+        roots: Iterable[Path],
+        socket_path: Path = SOCKET_PATH,
+        poll_interval: int = POLL_INTERVAL,
+        poll: bool = False,
+        index_dir: Path = volume_index.INDEX_DIR,
+    ):
+        self.socket_path = Path(socket_path)
+        self.stop = threading.Event()
+        self.volumes = {}
+        self.watchers = []
+        for root in roots:
+            root = Path(root)
+            index_file = volume_index.index_path(root, index_dir)
+            self.volumes[volume_key(root)] = index_file
+            self.watchers.append(VolumeWatcher(root, index_file, poll_interval, self.stop, poll))
+        # one read connection per volume, opened at start and shared by every request
+        self.stores = {}
+        self.locks = {}
+        self.server = None
+
+    def handle_request(self, request: dict) -> dict:
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True, "volumes": sorted(self.volumes)}
+        if op == "get_many":
+            key = volume_key(request["volume"])
+            store = self.stores.get(key)
+            if store is None:
+                return {"ok": False, "error": f"{request['volume']} is not watched"}
+            # SQLite WAL lets the connection read while the watcher writes
+            with self.locks[key]:
+                return {"ok": True, "result": store.get_many(request["names"])}
+        return {"ok": False, "error": f"unknown op {op}"}
+
+    def start(self):
+        """raises RuntimeError if another daemon is already answering on the socket"""
+        if self.socket_path.exists():
+            if is_listening(self.socket_path):
+                raise RuntimeError(f"An index daemon is already answering on {self.socket_path}")
+            # left behind by a daemon that didn't shut down cleanly
+            self.socket_path.unlink()
+
+        for watcher in self.watchers:
+            watcher.start()
+        for watcher in self.watchers:
+            watcher.ready.wait()
+        for key, index_file in self.volumes.items():
+            self.stores[key] = IndexStore(index_file, check_same_thread=False)
+            self.locks[key] = threading.Lock()
+
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self.server = IndexServer(str(self.socket_path), IndexRequestHandler)
+        self.server.index_daemon = self
+        logging.info(f"Answering index lookups on {self.socket_path}")
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def shutdown(self):
+        self.stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+        for watcher in self.watchers:
+            watcher.join(timeout=5)
+        for store in self.stores.values():
+            store.close()
+        self.stores = {}
+
+
+########## client
+def is_listening(socket_path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def lookup(root: Path, names: Iterable[str], socket_path: Path = SOCKET_PATH, timeout: float = 30) -> dict | None:
+    """
+    ask a running index daemon for {name: [paths]}.
+    returns None when no daemon is running or it doesn't watch root, so callers can
+    fall back to opening the index themselves
+    """
+    socket_path = Path(socket_path)
+    if not socket_path.exists():
+        return None
+
+    request = {"op": "get_many", "volume": str(root), "names": sorted(set(names))}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(socket_path))
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                response = json.loads(f.readline())
+    except (OSError, ValueError) as e:
+        logging.warning(f"Index daemon at {socket_path} did not answer: {e}")
+        return None
+
+    if not response.get("ok"):
+        logging.info(f"Index daemon can't answer for {root}: {response.get('error')}")
+        return None
+    return response["result"]
+
+
+def main():
+    setup_logging()
+    args = parse_args()
+
+    daemon = IndexDaemon(args.volume, args.socket, args.poll_interval, args.poll)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever, so it can't run on the same thread
+        threading.Thread(target=daemon.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        daemon.start()
+    except RuntimeError as e:
+        logging.error(e)
+        raise SystemExit(1)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        daemon.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import argparse
+import heapq
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+import repair_tools.index_daemon as index_daemon
+import repair_tools.volume_index as volume_index
+from repair_tools.bloom import BloomFilter
+from repair_tools.compact_index import CompactIndex
+
+# volumes searched when none are given on the command line
+VOLUMES = [
+    Path("/Volumes/lpasync"),
+    Path("/Volumes/Archivematica/2_fa_components"),
+]
+
+
+# 123000-123999, both ends full AMI IDs so names sort numerically
+ID_RANGE = re.compile(r"^(\d+)-(\d+)$")
+ID_WIDTH = 6
+
+
+class Location(NamedTuple):
+    volume: str
+    path: str
+
+
+class ShardedIndex:
+    """
+    one index shard per volume, queried together.
+    every lookup reports each volume and path a package appears at
+    """
+
+    def __init__(self, shards: dict[str, CompactIndex], blooms: dict[str, BloomFilter] | None = None):
+        self.shards = shards
+        # names a shard's Bloom filter rules out are never looked up in it
+        self.blooms = blooms or {}
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, name: str) -> list[Location]:
+        return [Location(volume, path) for volume, shard in self.shards.items() for path in shard.get(name)]
+
+    def get_many(self, names: Iterable[str]) -> dict[str, list[Location]]:
+        names = list(names)
+        found = {}
+        for volume, shard in self.shards.items():
+            bloom = self.blooms.get(volume)
+            candidates = names if bloom is None else [name for name in names if name in bloom]
+            for name, paths in shard.get_many(candidates).items():
+                found.setdefault(name, []).extend(Location(volume, path) for path in paths)
+        return found
+
+    def __contains__(self, name: str) -> bool:
+        return any(name in shard for shard in self.shards.values())
+
+    def _merge(self, query: Callable[[CompactIndex], Iterator[tuple[str, str]]]) -> Iterator[tuple[str, Location]]:
+        streams = [
+            ((name, Location(volume, path)) for name, path in query(shard))
+            for volume, shard in self.shards.items()
+        ]
+        return heapq.merge(*streams)
+
+    def items(self) -> Iterator[tuple[str, Location]]:
+        """stream (name, location) across every shard, sorted by name"""
+        return self._merge(lambda shard: shard.items())
+
+    def prefix(self, prefix: str) -> Iterator[tuple[str, Location]]:
+        return self._merge(lambda shard: shard.prefix(prefix))
+
+    def range(self, first: str, last: str) -> Iterator[tuple[str, Location]]:
+        return self._merge(lambda shard: shard.range(first, last))
+
+    def glob(self, pattern: str) -> Iterator[tuple[str, Location]]:
+        return self._merge(lambda shard: shard.glob(pattern))
+
+
+def search(index: CompactIndex | ShardedIndex, query: str) -> Iterator[tuple[str, str | Location]]:
+    """
+    run one ID query against an index:
+    "all", a range of full AMI IDs (123000-123999), a glob (123*, M1234_ER_*) or an exact name
+    """
+    if query == "all":
+        return index.items()
+    match = ID_RANGE.match(check_query(query))
+    if match:
+        return index.range(*match.groups())
+    if any(c in query for c in "*?["):
+        return index.glob(query)
+    return ((query, location) for location in index.get(query))
+
+
+def check_query(query: str) -> str:
+    """
+    raise ValueError for a query search can't run, e.g. a range whose ends aren't full IDs.
+    ranges compare names as strings, so a shorter end such as 123-125 would stop at 125 and skip 125000-125999
+    """
+    match = ID_RANGE.match(query)
+    if match and any(len(end) != ID_WIDTH for end in match.groups()):
+        raise ValueError(f"{query}: both ends of a range need to be full {ID_WIDTH}-digit IDs")
+    return query
+
+
+def is_exact(query: str) -> bool:
+    return query != "all" and not ID_RANGE.match(query) and not any(c in query for c in "*?[")
+
+
+def load_shards(
+    roots: Iterable[Path],
+    rebuild: bool = False,
+    refresh_index: bool = True,
+    validate_names: Iterable[str] | None = None,
+) -> ShardedIndex:
+    """build, refresh or validate each volume's shard concurrently and open them together"""
+    roots = [Path(root) for root in roots]
+    if validate_names is not None:
+        validate_names = list(validate_names)
+
+    def load(root: Path) -> tuple[CompactIndex, BloomFilter | None]:
+        shard = volume_index.load_index(root, rebuild, refresh_index, validate_names=validate_names)
+        return shard, volume_index.load_bloom(root)
+
+    shards = {}
+    blooms = {}
+    with ThreadPoolExecutor(max_workers=max(len(roots), 1)) as executor:
+        futures = {str(root): executor.submit(load, root) for root in roots}
+        errors = []
+        for volume, future in futures.items():
+            try:
+                shards[volume], blooms[volume] = future.result()
+            except Exception as e:
+                errors.append(f"{volume}: {e}")
+    if errors:
+        for shard in shards.values():
+            shard.close()
+        raise RuntimeError(f"Could not load index shards: {'; '.join(errors)}")
+    return ShardedIndex(shards, {volume: bloom for volume, bloom in blooms.items() if bloom is not None})
+
+
+def lookup(
+    roots: Iterable[Path],
+    names: Iterable[str],
+    rebuild: bool = False,
+    refresh_index: bool = True,
+    validate: bool = False,
+) -> dict[str, list[Location]]:
+    """
+    return {name: [locations]} across every volume.
+    volumes watched by a running index daemon are asked over its socket,
+    the rest are loaded from their shards
+    """
+    names = list(names)
+    found = {}
+    unwatched = []
+    for root in roots:
+        result = None if (rebuild or validate) else index_daemon.lookup(root, names)
+        if result is None:
+            if not (rebuild or refresh_index or validate):
+                # with a cached index, a Bloom filter miss for every name means there is nothing to load
+                bloom = volume_index.load_bloom(root)
+                if bloom is not None and not any(name in bloom for name in names):
+                    logging.info(f"None of the names are indexed on {root}")
+                    continue
+            unwatched.append(root)
+            continue
+        logging.info(f"Looked up {root} through the index daemon")
+        for name, paths in result.items():
+            found.setdefault(name, []).extend(Location(str(root), path) for path in paths)
+
+    if unwatched:
+        with load_shards(unwatched, rebuild, refresh_index, names if validate else None) as index:
+            for name, locations in index.get_many(names).items():
+                found.setdefault(name, []).extend(locations)
+    return found
+
+
+########## parser
+def extant_dir(p: str) -> Path:
+    path = Path(p)
+    if not path.is_dir():
+        raise argparse.ArgumentTypeError(f"{path} is not a directory")
+
+    return path
+
+
+def query_arg(p: str) -> str:
+    """argparse type for ID queries, so a malformed range is reported as a usage error"""
+    try:
+        return check_query(p)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Find every volume and path a package appears at")
+
+    parser.add_argument(
+        "names",
+        nargs="*",
+        type=query_arg,
+        help="""Package names or queries to look up: exact names, "all", ranges (123000-123999)
+        or globs (123*, M1234_ER_*). Leave empty to only build or refresh the shards""",
+        )
+    parser.add_argument(
+        "--volume",
+        "-v",
+        type=extant_dir,
+        nargs="+",
+        default=VOLUMES,
+        help="""Volume roots to search, each with its own index shard""",
+        )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="""Flag to rebuild the shards instead of refreshing them""",
+        )
+    parser.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="""Flag to use the cached shards without refreshing them""",
+        )
+
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    args = parse_args()
+
+    if not args.names:
+        load_shards(args.volume, args.rebuild_index, not args.no_refresh).close()
+        return
+
+    if not all(is_exact(query) for query in args.names):
+        with load_shards(args.volume, args.rebuild_index, not args.no_refresh) as index:
+            for query in args.names:
+                for name, location in search(index, query):
+                    print(f"{name}: {location.path}")
+        return
+
+    found = lookup(args.volume, args.names, args.rebuild_index, not args.no_refresh)
+    for name in args.names:
+        locations = found.get(name, [])
+        if not locations:
+            print(f"{name}: not found")
+        for location in locations:
+            print(f"{name}: {location.path}")
+        if len(locations) > 1:
+            print(f"{name}: found at {len(locations)} locations on {len({l.volume for l in locations})} volume(s)")
+
+
+if __name__ == "__main__":
+    main()
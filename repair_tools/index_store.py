@@ -0,0 +1,322 @@
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import repair_tools.package_id as package_id
+
+# stay under SQLite's limit on bound parameters per statement
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    name TEXT NOT NULL,
+    volume TEXT NOT NULL,
+    path TEXT NOT NULL,
+    discovered REAL NOT NULL,
+    kind TEXT,
+    collection TEXT,
+    PRIMARY KEY (name, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS packages_volume ON packages (volume);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    volume TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    subdirs TEXT NOT NULL,
+    packages TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS dirs_volume ON dirs (volume);
+CREATE TABLE IF NOT EXISTS sizes (
+    path TEXT PRIMARY KEY,
+    volume TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    file_count INTEGER NOT NULL,
+    total_bytes INTEGER NOT NULL,
+    subdirs TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS frontier (
+    path TEXT PRIMARY KEY,
+    volume TEXT NOT NULL,
+    rebuild INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+"""
+
+
+def tag(name: str) -> tuple[str | None, str | None]:
+    """(kind, collection) columns for a package name"""
+    pkg = package_id.classify(name)
+    return (pkg.kind, pkg.collection) if pkg else (None, None)
+
+
+def batched(items: list, size: int = BATCH_SIZE) -> Iterator[list]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def read_generation(db_path: Path) -> int | None:
+    """
+    the store's generation from a read-only connection, None if there is no readable store.
+    cheap enough to check before trusting anything derived from the store
+    """
+    try:
+        conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    except sqlite3.Error:
+        return None
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+class IndexStore:
+    """
+    on-disk package index keyed by package name.
+    lookups only read the rows they ask for, so nothing is loaded up front.
+    also keeps the directory records used for incremental refreshes.
+    """
+
+    def __init__(self, db_path: Path, check_same_thread: bool = True):
+        """check_same_thread=False lets several threads use the store, callers serialize access"""
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """add the package kind columns to indexes built before they existed"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(packages)")}
+        if "kind" in columns:
+            self.conn.execute("CREATE INDEX IF NOT EXISTS packages_kind ON packages (kind, collection)")
+            return
+        with self.conn:
+            self.conn.execute("ALTER TABLE packages ADD COLUMN kind TEXT")
+            self.conn.execute("ALTER TABLE packages ADD COLUMN collection TEXT")
+            names = [name for (name,) in self.conn.execute("SELECT DISTINCT name FROM packages")]
+            self.conn.executemany(
+                "UPDATE packages SET kind = ?, collection = ? WHERE name = ?",
+                ((*tag(name), name) for name in names),
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS packages_kind ON packages (kind, collection)")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    ########## package lookups
+
+    def get(self, name: str) -> list[str]:
+        rows = self.conn.execute(
+            "SELECT path FROM packages WHERE name = ? ORDER BY path", (name,)
+        )
+        return [path for (path,) in rows]
+
+    def get_many(self, names: Iterable[str]) -> dict[str, list[str]]:
+        """return {name: [paths]} for the names that are in the index"""
+        found = {}
+        for batch in batched(sorted(set(names))):
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT name, path FROM packages WHERE name IN ({placeholders}) ORDER BY name, path",
+                batch,
+            )
+            for name, path in rows:
+                found.setdefault(name, []).append(path)
+        return found
+
+    def __contains__(self, name: str) -> bool:
+        row = self.conn.execute("SELECT 1 FROM packages WHERE name = ? LIMIT 1", (name,))
+        return row.fetchone() is not None
+
+    def items(self, kind: str | None = None) -> Iterator[tuple[str, str]]:
+        """stream (name, path) for every package, or every package of one kind, sorted by name"""
+        if kind is None:
+            yield from self.conn.execute("SELECT name, path FROM packages ORDER BY name, path")
+        else:
+            yield from self.conn.execute(
+                "SELECT name, path FROM packages WHERE kind = ? ORDER BY name, path", (kind,)
+            )
+
+    def get_collection(self, collection: str) -> dict[str, list[str]]:
+        """every DigArch package of one collection"""
+        found = {}
+        rows = self.conn.execute(
+            "SELECT name, path FROM packages WHERE collection = ? ORDER BY name, path", (collection,)
+        )
+        for name, path in rows:
+            found.setdefault(name, []).append(path)
+        return found
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM packages").fetchone()[0]
+
+    def generation(self) -> int:
+        """counter bumped by every write, used to tell when snapshots are stale"""
+        return self.conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def _bump_generation(self):
+        self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+
+    def upsert(self, rows: Iterable[tuple[str, str, str]]):
+        """add (name, volume, path) rows, keeping the discovery time of known rows"""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO packages (name, volume, path, discovered, kind, collection) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (name, path) DO UPDATE SET volume = excluded.volume",
+                ((name, volume, path, now, *tag(name)) for name, volume, path in rows),
+            )
+            self._bump_generation()
+
+    def delete_paths(self, paths: Iterable[str]):
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM packages WHERE name = ? AND path = ?",
+                ((os.path.basename(path), path) for path in paths),
+            )
+            self._bump_generation()
+
+    ########## directory records
+
+    def load_dirs(self, volume: str, under: str | None = None) -> dict:
+        """directory records for a volume, or only for the subtree rooted at under"""
+        if under is None:
+            rows = self.conn.execute(
+                "SELECT path, mtime, subdirs, packages FROM dirs WHERE volume = ?", (volume,)
+            )
+        else:
+            # range instead of LIKE, paths are full of "_"; "0" sorts right after "/"
+            under = under.rstrip(os.sep)
+            rows = self.conn.execute(
+                "SELECT path, mtime, subdirs, packages FROM dirs "
+                "WHERE volume = ? AND (path = ? OR (path >= ? AND path < ?))",
+                (volume, under, under + "/", under + "0"),
+            )
+        return {
+            path: {"mtime": mtime, "subdirs": json.loads(subdirs), "packages": json.loads(packages)}
+            for path, mtime, subdirs, packages in rows
+        }
+
+    def walked(self, volume: str) -> bool:
+        """whether a walk of the volume has recorded anything, finished or not"""
+        for table in ("dirs", "frontier"):
+            if self.conn.execute(f"SELECT 1 FROM {table} WHERE volume = ? LIMIT 1", (volume,)).fetchone():
+                return True
+        return False
+
+    def get_dir_mtimes(self, paths: Iterable[str]) -> dict[str, int]:
+        mtimes = {}
+        for batch in batched(sorted(set(paths))):
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(f"SELECT path, mtime FROM dirs WHERE path IN ({placeholders})", batch)
+            mtimes.update(rows)
+        return mtimes
+
+    def load_frontier(self, volume: str) -> tuple[list[str], bool]:
+        """directories an interrupted walk still had to list, and whether it was a rebuild"""
+        rows = self.conn.execute("SELECT path, rebuild FROM frontier WHERE volume = ?", (volume,)).fetchall()
+        return [path for path, _ in rows], any(rebuild for _, rebuild in rows)
+
+    def clear(self, volume: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM frontier WHERE volume = ?", (volume,))
+            self.conn.execute("DELETE FROM dirs WHERE volume = ?", (volume,))
+            self.conn.execute("DELETE FROM packages WHERE volume = ?", (volume,))
+            self._bump_generation()
+
+    def apply_dirs(
+        self,
+        volume: str,
+        previous: dict,
+        changed: dict,
+        removed: list[str],
+        frontier: Iterable[str] | None = None,
+        rebuild: bool = False,
+    ):
+        """
+        write changed directory records and keep the package rows in step with them.
+        only packages that appeared or disappeared since the previous record are touched.
+        frontier, when given, replaces the directories the volume's walk still has to list,
+        in the same transaction, so a checkpoint always matches the records written with it
+        """
+        now = time.time()
+        added_rows = []
+        removed_rows = []
+
+        for path in removed:
+            removed_rows.extend((name, os.path.join(path, name)) for name in previous[path]["packages"])
+
+        for path, record in changed.items():
+            old = set(previous[path]["packages"]) if path in previous else set()
+            new = set(record["packages"])
+            removed_rows.extend((name, os.path.join(path, name)) for name in old - new)
+            added_rows.extend((name, volume, os.path.join(path, name), now, *tag(name)) for name in new - old)
+
+        with self.conn:
+            self.conn.executemany("DELETE FROM dirs WHERE path = ?", ((path,) for path in removed))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO dirs (path, volume, mtime, subdirs, packages) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (path, volume, r["mtime"], json.dumps(r["subdirs"]), json.dumps(r["packages"]))
+                    for path, r in changed.items()
+                ),
+            )
+            self.conn.executemany("DELETE FROM packages WHERE name = ? AND path = ?", removed_rows)
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO packages (name, volume, path, discovered, kind, collection) VALUES (?, ?, ?, ?, ?, ?)",
+                added_rows,
+            )
+            if frontier is not None:
+                self.conn.execute("DELETE FROM frontier WHERE volume = ?", (volume,))
+                self.conn.executemany(
+                    "INSERT INTO frontier (path, volume, rebuild) VALUES (?, ?, ?)",
+                    ((path, volume, int(rebuild)) for path in frontier),
+                )
+            if changed or removed_rows:
+                self._bump_generation()
+
+    ########## size records
+
+    def load_sizes(self, under: str) -> dict:
+        """size records of the directories in the subtree rooted at under"""
+        under = under.rstrip(os.sep)
+        rows = self.conn.execute(
+            "SELECT path, mtime, file_count, total_bytes, subdirs FROM sizes "
+            "WHERE path = ? OR (path >= ? AND path < ?)",
+            (under, under + "/", under + "0"),
+        )
+        return {
+            path: {"mtime": mtime, "files": file_count, "bytes": total_bytes, "subdirs": json.loads(subdirs)}
+            for path, mtime, file_count, total_bytes, subdirs in rows
+        }
+
+    def save_sizes(self, volume: str, changed: dict, removed: Iterable[str]):
+        """size records don't feed the snapshots, so the generation is left alone"""
+        with self.conn:
+            self.conn.executemany("DELETE FROM sizes WHERE path = ?", ((path,) for path in removed))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sizes (path, volume, mtime, file_count, total_bytes, subdirs) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (path, volume, r["mtime"], r["files"], r["bytes"], json.dumps(r["subdirs"]))
+                    for path, r in changed.items()
+                ),
+            )
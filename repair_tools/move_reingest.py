@@ -1,17 +1,21 @@
 import argparse
 import logging
 import shutil
-import json
 from pathlib import Path
 
+import repair_tools.duplicates as duplicates
+import repair_tools.index_query as index_query
+import repair_tools.package_id as package_id
+import repair_tools.walker as walker
+
 # SOURCE_PATH = Path("/Volumes/lpasync")
 SOURCE_PATH = Path("/Volumes/Archivematica/2_fa_components/")
 
 DESTINATION_PATH = Path("/Volumes/Archivematica/2_fa_components/_reingest/")
 
-INDEX_CACHE_FILE = Path(f"./{SOURCE_PATH.name}_index.json")
+REINGEST_LIST = Path("/Users/emileebuytkins//Documents/Buytkins_Programming/reingest.txt")
 
-DIRS_TO_FIND = Path("/Users/emileebuytkins//Documents/Buytkins_Programming/reingest.txt").read_text().splitlines()
+DIRS_TO_FIND = REINGEST_LIST.read_text().splitlines() if REINGEST_LIST.exists() else []
 
 def setup_logging():
     logging.basicConfig(
@@ -22,50 +26,91 @@ def setup_logging():
 def parse_args():
     parser = argparse.ArgumentParser()
 
+    parser.add_argument(
+        "--source",
+        type=Path,
+        nargs="+",
+        default=[SOURCE_PATH],
+        help="Volume(s) to search for the packages, each with its own index."
+    )
     parser.add_argument(
         "--rebuild-index",
         action="store_true",
         help="Force the script to rebuild the source directory index."
     )
+    parser.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="Use the cached source directory index without refreshing it."
+    )
+    parser.add_argument(
+        "--validate-index",
+        action="store_true",
+        help="Only check the cached paths of the packages being moved, re-walking the directories that changed."
+    )
     return parser.parse_args()
 
-def build_index(root_path: Path) -> dict:
-    logging.info(f"Building index for '{root_path}'.")
-    index = {} 
-    for path in root_path.rglob('*'):
-        if path.is_dir():
-            dir_name = path.name
-            if dir_name not in index:
-                index[dir_name] = []
-            index[dir_name].append(str(path))
+def get_index(
+    source_paths: list[Path] | None = None,
+    force_rebuild: bool = False,
+    refresh_index: bool = True,
+    validate: bool = False,
+) -> dict:
+    """
+    return {package name: [paths]} across every source volume for the packages being searched for.
+    names that aren't standard package IDs, which the index never records, are looked for with a walk
+    """
+    source_paths = source_paths or [SOURCE_PATH]
+    found = index_query.lookup(source_paths, DIRS_TO_FIND, force_rebuild, refresh_index, validate)
+    index = {name: [location.path for location in locations] for name, locations in found.items()}
+    unindexed = {name for name in DIRS_TO_FIND if name and not index.get(name) and not package_id.is_package(name)}
+    if unindexed:
+        logging.info(f"{len(unindexed)} names are not package IDs, walking the sources for them.")
+        index.update(find_unindexed(source_paths, unindexed))
     return index
 
-def get_index(force_rebuild: bool = False) -> dict:
-    if not force_rebuild and INDEX_CACHE_FILE.exists():
-        with open(INDEX_CACHE_FILE, 'r') as f:
-            return json.load(f)
-    
-    index = build_index(SOURCE_PATH)
-    with open(INDEX_CACHE_FILE, 'w') as f:
-        json.dump(index, f, indent=2)
-    return index
+def find_unindexed(source_paths: list[Path], names: set[str]) -> dict:
+    """
+    find directories whose names aren't package IDs, which the index doesn't record.
+    like the index walk, it doesn't descend into packages, so payloads are never listed
+    """
+    found = {}
+    for source_path in source_paths:
+        walked = walker.find_packages(source_path, lambda name: name in names or package_id.is_package(name))
+        for name in names & walked.keys():
+            found.setdefault(name, []).extend(walked[name])
+    return found
 
 def main():
     setup_logging()
     args = parse_args()
 
-    if not SOURCE_PATH.is_dir():
-        logging.error(f"'{SOURCE_PATH}' does not exist or is not a directory.")
+    if not DIRS_TO_FIND:
+        logging.error(f"No package names to find, check '{REINGEST_LIST}'.")
         return
+
+    for source_path in args.source:
+        if not source_path.is_dir():
+            logging.error(f"'{source_path}' does not exist or is not a directory.")
+            return
     if not DESTINATION_PATH.is_dir():
         logging.error(f"'{DESTINATION_PATH}' does not exist or is not a directory.")
         return
 
-    directory_index = get_index(force_rebuild=args.rebuild_index)
+    directory_index = get_index(
+        args.source,
+        force_rebuild=args.rebuild_index,
+        refresh_index=not args.no_refresh,
+        validate=args.validate_index,
+    )
     
     moved_count = 0
     unmoved_dirs = dict()
     dir_exists_unmoved = set()
+    redundant_copies = []
+    unfingerprinted = []
+
+    duplicate_groups = duplicates.find_duplicates(directory_index)
 
     logging.info(f"Starting search for {len(DIRS_TO_FIND)} package names.")
 
@@ -75,14 +120,31 @@ def main():
         found_directories = [Path(p) for p in found_paths_str]
 
         if not found_directories:
-            logging.warning(f"'{dir_name_to_find}' not found in the index.")
-            unmoved_dirs[dir_name_to_find] = "Not found in index."
+            logging.warning(
+                f"'{dir_name_to_find}' not found in the index or by walking the sources, "
+                "directories inside packages are not searched."
+            )
+            unmoved_dirs[dir_name_to_find] = "Not found in index or source walk."
             continue
 
         if len(found_directories) > 1:
             logging.warning(f"Duplicate: Found multiple directories named '{dir_name_to_find}'.")
-            for path in found_directories:
-                logging.warning(f"  - Location: {path}")
+            groups = duplicate_groups.get(dir_name_to_find, {})
+            duplicates.log_report(dir_name_to_find, groups)
+            grouped = {path for copies in groups.values() for path in copies}
+            unchecked = [path for path in found_directories if path not in grouped]
+            if unchecked:
+                # without a fingerprint there's no telling whether they match, so every copy is moved
+                logging.warning(
+                    f"Could not fingerprint {len(unchecked)} copies of '{dir_name_to_find}': "
+                    + ", ".join(str(path) for path in unchecked)
+                )
+                unfingerprinted.extend(unchecked)
+            elif len(groups) == 1:
+                # identical copies, only the first needs to be moved
+                copies = next(iter(groups.values()))
+                found_directories = copies[:1]
+                redundant_copies.extend(copies[1:])
 
         for source_dir_path in found_directories:
             destination_dir_path = DESTINATION_PATH / source_dir_path.name
@@ -107,6 +169,14 @@ def main():
     logging.info("--- MOVE SUMMARY ---")
     logging.info(f"Successfully moved: {moved_count}")
     
+    logging.info(f"Identical duplicate copies left in place: {len(redundant_copies)}")
+    for path in redundant_copies:
+        logging.info(f"    {path}")
+
+    logging.info(f"Duplicate copies that could not be fingerprinted, each one handled separately: {len(unfingerprinted)}")
+    for path in unfingerprinted:
+        logging.info(f"    {path}")
+
     exist_count = len(dir_exists_unmoved)
     logging.info(f"Moved previously, skipped: {exist_count}")
 
@@ -0,0 +1,38 @@
+import re
+from typing import NamedTuple
+
+# one pattern for every package kind, so a single pass over directory names finds them all
+PACKAGE_ID = re.compile(
+    r"^(?:(?P<ami>\d{6})|(?P<collection>M\d+)_(?P<kind>ER|DI|EM)_(?P<number>\d+))$"
+)
+
+AMI = "AMI"
+KINDS = (AMI, "ER", "DI", "EM")
+
+
+class PackageID(NamedTuple):
+    name: str
+    kind: str
+    collection: str | None
+
+
+def classify(name: str) -> PackageID | None:
+    """
+    return the kind and collection ID of a package directory name,
+    or None if the name is not an AMI ID (123456) or a DigArch package (M1234_ER_1)
+    """
+    match = PACKAGE_ID.match(name)
+    if match is None:
+        return None
+    if match["ami"]:
+        return PackageID(name, AMI, None)
+    return PackageID(name, match["kind"], match["collection"])
+
+
+def is_package(name: str) -> bool:
+    return PACKAGE_ID.match(name) is not None
+
+
+def is_ami(name: str) -> bool:
+    match = PACKAGE_ID.match(name)
+    return match is not None and match["ami"] is not None
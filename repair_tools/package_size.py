@@ -0,0 +1,119 @@
+import datetime
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
+import repair_tools.volume_index as volume_index
+from repair_tools.index_store import IndexStore
+from repair_tools.walker import NUM_THREADS
+
+
+class PackageSize(NamedTuple):
+    file_count: int
+    total_bytes: int
+
+
+def scan_sizes(path: str, mtime: int) -> dict:
+    """count the files directly inside one directory and list its subdirectories"""
+    files = 0
+    total = 0
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif entry.is_file(follow_symlinks=False):
+                files += 1
+                total += entry.stat(follow_symlinks=False).st_size
+    return {"mtime": mtime, "files": files, "bytes": total, "subdirs": sorted(subdirs)}
+
+
+def measure(path: str, cached: dict) -> tuple[PackageSize | None, dict]:
+    """
+    size one package, rescanning only the directories whose mtime changed.
+    returns (size, records for every directory in the package), size None if the package is gone
+    """
+    records = {}
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            mtime = os.stat(current).st_mtime_ns
+            record = cached.get(current)
+            if record is None or record["mtime"] != mtime:
+                record = scan_sizes(current, mtime)
+        except FileNotFoundError:
+            if current == path:
+                return None, {}
+            continue
+        except OSError as e:
+            logging.warning(f"Skipping unreadable directory {current}: {e}")
+            continue
+        records[current] = record
+        stack.extend(os.path.join(current, name) for name in record["subdirs"])
+
+    size = PackageSize(sum(r["files"] for r in records.values()), sum(r["bytes"] for r in records.values()))
+    return size, records
+
+
+def package_sizes(
+    store: IndexStore, volume: str, paths: Iterable[Path], num_threads: int = NUM_THREADS
+) -> dict[Path, PackageSize]:
+    """size packages concurrently, reusing and updating the size records kept in store"""
+    paths = [Path(p) for p in paths]
+    cached = {path: store.load_sizes(str(path)) for path in paths}
+    with ThreadPoolExecutor(max_workers=max(min(num_threads, len(paths)), 1)) as executor:
+        results = dict(zip(paths, executor.map(lambda p: measure(str(p), cached[p]), paths)))
+
+    changed = {}
+    removed = []
+    for path, (_, records) in results.items():
+        old = cached[path]
+        changed.update((p, r) for p, r in records.items() if old.get(p) != r)
+        removed.extend(p for p in old if p not in records)
+    store.save_sizes(volume, changed, removed)
+
+    return {path: size for path, (size, _) in results.items() if size is not None}
+
+
+def measure_packages(root: Path, paths: Iterable[Path], index_file: Path | None = None) -> dict[Path, PackageSize]:
+    """size packages on root, with the size records kept in root's index"""
+    with IndexStore(index_file or volume_index.index_path(root)) as store:
+        return package_sizes(store, str(root), paths)
+
+
+def format_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if n < 1024 or unit == "TB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{int(n)} B"
+        n /= 1024
+
+
+class Progress:
+    """bytes done out of a known total, shared by the worker threads of a copy or move"""
+
+    def __init__(self, total_bytes: int):
+        self.total_bytes = total_bytes
+        self.done_bytes = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def advance(self, n: int):
+        with self._lock:
+            self.done_bytes += n
+
+    def eta(self) -> float | None:
+        """seconds left at the rate so far, None until something is done"""
+        elapsed = time.monotonic() - self.started
+        if not self.done_bytes or not elapsed:
+            return None
+        return (self.total_bytes - self.done_bytes) / (self.done_bytes / elapsed)
+
+    def report(self) -> str:
+        eta = self.eta()
+        remaining = "unknown" if eta is None else str(datetime.timedelta(seconds=round(eta)))
+        return f"{format_bytes(self.done_bytes)} of {format_bytes(self.total_bytes)}, ETA {remaining}"
@@ -1,46 +1,43 @@
+import json
 import re
-import time
 import xml.etree.ElementTree as ET
-from pathlib import Path
-
-import requests
+from typing import Iterator, NamedTuple
 
 import repair_tools.prsv_creds as prsvcreds
+import repair_tools.prsv_tokens as prsvtokens
+
+TOKEN_PATH = "accesstoken/login"
+SEARCH_PATH = "content/search-within"
 
-TOKEN_BASE_URL = "https://nypl.preservica.com/api/accesstoken/login"
+# xip.title values sent in one search
+TITLE_BATCH = 100
+# hits requested per page, small enough that a page never nears the client timeout
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
 
 
-def get_token(credential_set: str) -> str:
+def get_token(credential_set: str, client, manager: prsvtokens.TokenManager | None = None) -> str:
     """
     return token string
-    check for existing valid token in token file
-    if the file does not exist or the token is out of date, create token
+    tokens come from the shared token manager, which requests one through client
+    only when no thread or process holds a valid token for the credential set
     """
+    manager = manager or prsvtokens.MANAGER
+    manager.register(credential_set, lambda: request_token(credential_set, client))
+    return manager.get(credential_set)
 
-    token_file = Path(f"{credential_set}.token.file")
-    if token_file.is_file():
-        time_issued, sessiontoken = token_file.read_text().split("\n")
-        # tokens are valid for 500 seconds
-        if time.time() - float(time_issued) < 500:
-            return sessiontoken
-
-    return create_token(credential_set, token_file)
 
-
-def create_token(credential_set: str, token_file: Path) -> str:
-    """
-    request token string based on credentials
-    write time and token to a file and return token
-    """
+def request_token(credential_set: str, client) -> str:
+    """request a new token string based on credentials"""
 
     creds = prsvcreds.Credentials()
     user, pw, tenant = creds.get_credentials(credential_set)
 
     # build the query string and get a new token
-    url = TOKEN_BASE_URL
     headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    payload = f"username={user}&password={pw}&tenant={tenant}"
-    response = requests.post(url, headers=headers, data=payload)
+    payload = {"username": user, "password": pw, "tenant": tenant}
+    # logging in twice only hands out another token, so the login is safe to retry
+    response = client.post(TOKEN_PATH, auth=False, retry=True, headers=headers, data=payload)
     data = response.json()
 
     if not data["success"]:
@@ -48,20 +45,11 @@ def create_token(credential_set: str, token_file: Path) -> str:
             f"Invalid credentials. Update the file at {str(prsvcreds.CREDS_INI)}"
         )
 
-    # write token to token.file for later reuse
-    token_file.write_text(f'{str(time.time())}\n{data["token"]}')
-
     return data["token"]
 
 
-def find_apiversion(credential_set: str) -> str:
-    schemas_url = "https://nypl.preservica.com/api/admin/schemas"
-    token = get_token(credential_set)
-    headers = {
-        "Preservica-Access-Token": token,
-        "Content-Type": "application/xml",
-    }
-    response = requests.request("GET", schemas_url, headers=headers)
+def find_apiversion(client) -> str:
+    response = client.get("admin/schemas", headers={"Content-Type": "application/xml"})
     root = ET.fromstring(response.text)
 
     version_search = re.search(r"v(\d+\.\d+)\}", root.tag)
@@ -71,5 +59,81 @@ def find_apiversion(credential_set: str) -> str:
         return ""
 
 
-def main():
-    get_token()
+def search_within(
+    client, query_params: dict, parentuuid: str, start: int = 0, max_hits: int | None = None, metadata: str = "xip.title"
+) -> dict:
+    """one page of a search-within query, the "value" of the response"""
+    params = {
+        "q": json.dumps(query_params),
+        "parenthierarchy": parentuuid,
+        "start": start,
+        "max": min(max_hits or PAGE_SIZE, MAX_PAGE_SIZE),
+        "metadata": metadata,
+    }
+    response = client.get(SEARCH_PATH, params=params, headers={"accept": "application/json"})
+    response.raise_for_status()
+    return response.json().get("value") or {}
+
+
+class SearchHit(NamedTuple):
+    uuid: str
+    metadata: list[dict]
+
+
+def iter_search(
+    client,
+    query_params: dict,
+    parentuuid: str,
+    page_size: int | None = None,
+    metadata: str = "xip.title",
+    limit: int | None = None,
+) -> Iterator[SearchHit]:
+    """
+    stream the hits of a search-within query, one bounded page at a time.
+    a page is only requested once the previous one is used up, so closing the
+    generator early, or passing limit, skips the pages that are not needed
+    """
+    start = 0
+    yielded = 0
+    while True:
+        value = search_within(client, query_params, parentuuid, start, page_size, metadata)
+        object_ids = value.get("objectIds") or []
+        fields = value.get("metadata") or []
+        for i, object_id in enumerate(object_ids):
+            yield SearchHit(object_id[-36:], fields[i] if i < len(fields) else [])
+            yielded += 1
+            if limit is not None and yielded >= limit:
+                return
+        start += len(object_ids)
+        if not object_ids or start >= value.get("totalHits", 0):
+            return
+
+
+def hit_field(metadata: list | None, name: str) -> str | None:
+    for field in metadata or []:
+        if field.get("name") == name:
+            return field.get("value")
+    return None
+
+
+def hit_title(metadata: list | None) -> str | None:
+    return hit_field(metadata, "xip.title")
+
+
+def search_titles(
+    client, titles: list[str], parentuuid: str, fields: list[dict] | None = None, q: str = "", batch_size: int = TITLE_BATCH
+) -> dict[str, list[str]]:
+    """
+    look up many titles with one search per batch, matching the hits back by their xip.title.
+    returns {title: [uuids]} for every title asked for, [] when nothing has that exact title
+    """
+    titles = list(dict.fromkeys(titles))
+    found = {title: [] for title in titles}
+    for i in range(0, len(titles), batch_size):
+        batch = titles[i : i + batch_size]
+        query_params = {"q": q, "fields": [{"name": "xip.title", "values": batch}, *(fields or [])]}
+        for hit in iter_search(client, query_params, parentuuid):
+            title = hit_title(hit.metadata)
+            if title in found:
+                found[title].append(hit.uuid)
+    return found
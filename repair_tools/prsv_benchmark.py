@@ -0,0 +1,171 @@
+"""
+time the Preservica lookup and move flows against the local mock server,
+so client changes can be measured without touching the live tenant.
+"""
+
+import argparse
+import logging
+import time
+from typing import Callable, NamedTuple
+
+import repair_tools.prsv_api as prsvapi
+import repair_tools.prsv_mirror as prsv_mirror
+import repair_tools.prsv_move as prsv_move
+import repair_tools.prsv_progress as prsv_progress
+from repair_tools.prsv_client import PreservicaClient
+from repair_tools.prsv_mock import MockPreservica
+from repair_tools.prsv_tokens import TokenManager
+
+CREDENTIAL_SET = "mock"
+
+
+class Result(NamedTuple):
+    flow: str
+    seconds: float
+    items: int
+    requests: int
+    # titles a flow left out because they didn't resolve to a single uuid
+    skipped: int = 0
+
+
+def mock_client(mock: MockPreservica, base_url: str, pool_size: int) -> PreservicaClient:
+    """a client whose tokens come from the mock's login, which takes any credentials"""
+    client = PreservicaClient(CREDENTIAL_SET, base_url=base_url, pool_size=pool_size, backoff=0.05, tokens=TokenManager(None))
+
+    def login() -> str:
+        form = {"username": "mock", "password": "mock", "tenant": "mock"}
+        return client.post(prsvapi.TOKEN_PATH, auth=False, retry=True, data=form).json()["token"]
+
+    client.tokens.register(CREDENTIAL_SET, login)
+    return client
+
+
+def run(mock: MockPreservica, name: str, flow: Callable[[], int | tuple[int, int]]) -> Result:
+    """time a flow returning its item count, or (items, skipped)"""
+    before = sum(mock.requests.values())
+    start = time.monotonic()
+    outcome = flow()
+    items, skipped = outcome if isinstance(outcome, tuple) else (outcome, 0)
+    return Result(name, time.monotonic() - start, items, sum(mock.requests.values()) - before, skipped)
+
+
+def benchmark(mock: MockPreservica, base_url: str, ingest: str, sample: int, concurrency: int) -> list[Result]:
+    """run every flow over the packages filed directly under the mock's ingest folder"""
+    deletion = mock.add_object("DELETION")
+    titles = sorted(mock.objects[u][0] for u in mock.objects if mock.objects[u][1] == ingest)
+    if not titles:
+        return []
+    serial = titles[:sample]
+    client = mock_client(mock, base_url, concurrency)
+
+    def serial_lookup() -> int:
+        # one search per title, the way packages were looked up before batching
+        for title in serial:
+            prsvapi.search_titles(client, [title], ingest)
+        return len(serial)
+
+    def bulk_lookup() -> int:
+        return len(prsv_move.resolve_all(client, titles, ingest, deletion, concurrency=concurrency))
+
+    def snapshot() -> int:
+        return len(prsv_mirror.fetch_objects(client, ingest, concurrency))
+
+    moved = []
+
+    def serial_moves() -> tuple[int, int]:
+        resolved = prsv_move.resolve_all(client, serial, ingest, deletion, concurrency=concurrency)
+        # unresolved titles are None, ones already in the deletion folder True
+        to_move = [title for title in serial if isinstance(resolved[title], str)]
+        for title in to_move:
+            moved.append(prsv_move.set_new_parent_ref(client, resolved[title], deletion, title))
+        return len(to_move), len(serial) - len(to_move)
+
+    def bulk_moves() -> tuple[int, int]:
+        rest = titles[sample:]
+        resolved = prsv_move.resolve_all(client, rest, ingest, deletion, concurrency=concurrency)
+        to_move = {t: u for t, u in resolved.items() if isinstance(u, str)}
+        started = prsv_move.move_all(client, to_move, deletion, concurrency)
+        moved.extend(started.values())
+        return len(started), len(rest) - len(to_move)
+
+    def progress() -> int:
+        results = prsv_progress.track(client, [m for m in moved if m], concurrency)
+        return sum(map(len, results.values()))
+
+    with client:
+        return [
+            run(mock, "lookup, 1 title per search", serial_lookup),
+            run(mock, f"lookup, batched, {concurrency} at once", bulk_lookup),
+            run(mock, f"mirror snapshot, {concurrency} pages", snapshot),
+            run(mock, "move, serial", serial_moves),
+            run(mock, f"move, {concurrency} workers", bulk_moves),
+            run(mock, f"progress, {concurrency} polls", progress),
+        ]
+
+
+def format_results(results: list[Result]) -> str:
+    lines = [f"{'flow':<34}{'seconds':>10}{'items':>10}{'items/sec':>12}{'requests':>10}{'skipped':>10}"]
+    for r in results:
+        rate = r.items / r.seconds if r.seconds else 0
+        lines.append(f"{r.flow:<34}{r.seconds:>10.3f}{r.items:>10}{rate:>12.0f}{r.requests:>10}{r.skipped:>10}")
+    return "\n".join(lines)
+
+
+########## parser
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time the Preservica lookup and move flows against a local mock")
+
+    parser.add_argument(
+        "--packages",
+        type=int,
+        default=5000,
+        help="""Number of packages in the mock ingest folder""",
+        )
+    parser.add_argument(
+        "--sample",
+        type=int,
+        default=200,
+        help="""Packages put through the serial flows, which are too slow to run over all of them""",
+        )
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=prsv_move.MOVE_CONCURRENCY,
+        help="""Requests in flight at once in the concurrent flows""",
+        )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.02,
+        help="""Seconds the mock adds to every request""",
+        )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="""Fraction of requests the mock answers with a 503""",
+        )
+    parser.add_argument(
+        "--token-ttl",
+        type=float,
+        default=500,
+        help="""Seconds before the mock refuses a token with a 401""",
+        )
+
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR, format="%(levelname)s - %(message)s")
+    args = parse_args()
+
+    with MockPreservica(args.latency, args.error_rate, args.token_ttl, seed=0) as mock:
+        base_url = mock.start()
+        ingest = mock.add_object("INGEST")
+        mock.add_packages(ingest, [f"M{1000 + i // 20}_ER_{i % 20}" for i in range(args.packages)])
+        print(format_results(benchmark(mock, base_url, ingest, args.sample, args.concurrency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+persistent cache of Preservica title lookups.
+
+every search answer is kept per server and parent hierarchy, including titles
+that were not found, so a repeat run over the same package list only asks Preservica
+about titles whose cached answer has aged out. found and not found answers
+age separately, since a missing package is the one most likely to change.
+answers from a test tenant or the mock server (PRSV_BASE_URL) are kept apart
+from production ones, even where the parent uuids are the same.
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+import repair_tools.prsv_api as prsvapi
+import repair_tools.volume_index as volume_index
+from repair_tools.index_store import batched
+
+CACHE_FILE = volume_index.INDEX_DIR / "prsv_lookups.sqlite"
+
+# seconds a cached answer is trusted
+TTL = 24 * 3600
+NEGATIVE_TTL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lookups (
+    server TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    query TEXT NOT NULL,
+    title TEXT NOT NULL,
+    uuids TEXT NOT NULL,
+    checked REAL NOT NULL,
+    PRIMARY KEY (server, parent, query, title)
+) WITHOUT ROWID;
+"""
+
+
+def query_key(fields: list[dict] | None = None, q: str = "") -> str:
+    """the search filters besides the title, answers to different filters are cached apart"""
+    return json.dumps({"q": q, "fields": fields or []}, sort_keys=True)
+
+
+class LookupCache:
+    """title -> uuids answers per server and parent hierarchy, safe to share between threads"""
+
+    def __init__(self, db_path: Path = CACHE_FILE, ttl: float = TTL, negative_ttl: float = NEGATIVE_TTL):
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _migrate(self):
+        """drop caches written before answers were kept per server, there's no telling where they came from"""
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(lookups)")}
+        if columns and "server" not in columns:
+            with self.conn:
+                self.conn.execute("DROP TABLE lookups")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_many(self, server: str, parent: str, query: str, titles: Iterable[str]) -> dict[str, list[str]]:
+        """{title: [uuids]} for the titles with an answer young enough to trust"""
+        now = time.time()
+        found = {}
+        with self._lock:
+            for batch in batched(sorted(set(titles))):
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    "SELECT title, uuids, checked FROM lookups "
+                    f"WHERE server = ? AND parent = ? AND query = ? AND title IN ({placeholders})",
+                    (server, parent, query, *batch),
+                )
+                for title, uuids, checked in rows:
+                    uuids = json.loads(uuids)
+                    if now - checked < (self.ttl if uuids else self.negative_ttl):
+                        found[title] = uuids
+        return found
+
+    def put_many(self, server: str, parent: str, query: str, found: dict[str, list[str]]):
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO lookups (server, parent, query, title, uuids, checked) VALUES (?, ?, ?, ?, ?, ?)",
+                ((server, parent, query, title, json.dumps(uuids), now) for title, uuids in found.items()),
+            )
+
+    def invalidate(
+        self, parent: str | None = None, titles: Iterable[str] | None = None, server: str | None = None
+    ) -> int:
+        """
+        drop cached answers, for one parent hierarchy or all of them, on one server or all of them,
+        optionally only for some titles. returns the number dropped
+        """
+        where, params = [], []
+        if server is not None:
+            where.append("server = ?")
+            params.append(server)
+        if parent is not None:
+            where.append("parent = ?")
+            params.append(parent)
+        clause = " AND ".join(where) or "1"
+        with self._lock, self.conn:
+            if titles is None:
+                return self.conn.execute(f"DELETE FROM lookups WHERE {clause}", params).rowcount
+            dropped = 0
+            for batch in batched(sorted(set(titles))):
+                placeholders = ",".join("?" * len(batch))
+                dropped += self.conn.execute(
+                    f"DELETE FROM lookups WHERE {clause} AND title IN ({placeholders})", (*params, *batch)
+                ).rowcount
+            return dropped
+
+    def counts(self) -> dict[tuple[str, str], tuple[int, int]]:
+        """{(server, parent): (found, not found)} answers currently cached"""
+        rows = self.conn.execute(
+            "SELECT server, parent, SUM(uuids != '[]'), SUM(uuids = '[]') FROM lookups "
+            "GROUP BY server, parent ORDER BY server, parent"
+        )
+        return {(server, parent): (found, missing) for server, parent, found, missing in rows}
+
+
+def search_titles(
+    client, cache: LookupCache | None, titles: list[str], parentuuid: str, fields: list[dict] | None = None, q: str = ""
+) -> dict[str, list[str]]:
+    """prsv_api.search_titles, answering from cache where it can and caching what it had to ask"""
+    if cache is None:
+        return prsvapi.search_titles(client, titles, parentuuid, fields, q)
+    titles = list(dict.fromkeys(titles))
+    query = query_key(fields, q)
+    found = cache.get_many(client.base_url, parentuuid, query, titles)
+    missing = [title for title in titles if title not in found]
+    if missing:
+        fetched = prsvapi.search_titles(client, missing, parentuuid, fields, q)
+        cache.put_many(client.base_url, parentuuid, query, fetched)
+        found.update(fetched)
+    return {title: found[title] for title in titles}
+
+
+########## parser
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the cached Preservica lookups")
+
+    parser.add_argument(
+        "--invalidate",
+        nargs="+",
+        metavar="PARENT_UUID",
+        help="""Drop the cached answers for these parent hierarchies""",
+        )
+    parser.add_argument(
+        "--clear",
+        action="store_true",
+        help="""Flag to drop every cached answer""",
+        )
+    parser.add_argument(
+        "--cache-file",
+        type=Path,
+        default=CACHE_FILE,
+        help=f"""Cache database, default {CACHE_FILE}""",
+        )
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    with LookupCache(args.cache_file) as cache:
+        if args.clear:
+            print(f"Dropped {cache.invalidate()} cached answers")
+        for parent in args.invalidate or []:
+            print(f"Dropped {cache.invalidate(parent)} cached answers for {parent}")
+        for (server, parent), (found, missing) in cache.counts().items():
+            print(f"{server} {parent}: {found} found, {missing} not found")
+
+
+if __name__ == "__main__":
+    main()
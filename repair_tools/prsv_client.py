@@ -0,0 +1,149 @@
+"""
+one HTTP client for every Preservica call.
+
+requests go through a pooled keep-alive session, so repeated lookups reuse
+their TLS connections instead of paying a handshake each. connection errors,
+timeouts and 429/5xx responses of idempotent requests are retried with
+exponential backoff and full jitter, and an expired token (401) is replaced once
+per request in one place. other requests, e.g. parent-ref moves, are sent once
+unless the caller passes retry=True: a 502 or a timeout can come back after the
+server already acted on them.
+"""
+
+import logging
+import os
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import repair_tools.prsv_api as prsvapi
+import repair_tools.prsv_tokens as prsvtokens
+
+# PRSV_BASE_URL points every tool at another server, e.g. a test tenant or a mock
+BASE_URL = os.environ.get("PRSV_BASE_URL", "https://nypl.preservica.com/api")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+RETRIES = 4
+BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+TIMEOUT = 30
+POOL_SIZE = 32
+
+
+class PreservicaClient:
+    """pooled, retrying session for one credential set, safe to share between threads"""
+
+    def __init__(
+        self,
+        credential_set: str,
+        base_url: str = BASE_URL,
+        retries: int = RETRIES,
+        backoff: float = BACKOFF,
+        max_backoff: float = MAX_BACKOFF,
+        timeout: float = TIMEOUT,
+        pool_size: int = POOL_SIZE,
+        tokens: prsvtokens.TokenManager | None = None,
+    ):
+        self.credential_set = credential_set
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # tokens are shared with every other client of the process, and through the
+        # manager's cache file with other processes
+        self.tokens = tokens or prsvtokens.MANAGER
+        self.tokens.register(credential_set, lambda: prsvapi.request_token(credential_set, self))
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    ########## auth
+
+    def token(self) -> str:
+        return self.tokens.get(self.credential_set)
+
+    def reauthenticate(self, expired: str):
+        """replace a refused token, unless another thread or process already has"""
+        logging.info("Access token refused, requesting a new one")
+        self.tokens.renew(self.credential_set, expired)
+
+    ########## requests
+
+    def url(self, path: str) -> str:
+        return path if path.startswith("http") else f"{self.base_url}/{path.lstrip('/')}"
+
+    def delay(self, attempt: int, response: requests.Response | None = None) -> float:
+        """full jitter backoff, or the server's Retry-After when it gives one"""
+        if response is not None and response.headers.get("Retry-After", "").isdigit():
+            return min(float(response.headers["Retry-After"]), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def request(
+        self, method: str, path: str, auth: bool = True, retry: bool | None = None, **kwargs
+    ) -> requests.Response:
+        """
+        send a request, retrying transient failures when retry is set, by default only for GET and HEAD.
+        the last response is returned once retries run out, so callers still see its status;
+        connection errors that outlast the retries are raised.
+        a refused token is always renewed and the request sent again, the server did not act on it
+        """
+        if retry is None:
+            retry = method.upper() in IDEMPOTENT_METHODS
+        retries = self.retries if retry else 0
+        url = self.url(path)
+        kwargs.setdefault("timeout", self.timeout)
+        extra_headers = kwargs.pop("headers", {})
+        reauthenticated = False
+        attempt = 0
+        while True:
+            headers = dict(extra_headers)
+            token = None
+            if auth:
+                token = self.token()
+                headers["Preservica-Access-Token"] = token
+
+            response = None
+            try:
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= retries:
+                    raise
+                error = e
+            else:
+                if response.status_code == 401 and auth and not reauthenticated:
+                    self.reauthenticate(token)
+                    reauthenticated = True
+                    continue
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                error = f"status {response.status_code}"
+
+            delay = self.delay(attempt, response)
+            attempt += 1
+            logging.warning(f"{method} {url} failed ({error}), retry {attempt}/{retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
@@ -0,0 +1,280 @@
+"""
+local mirror of Preservica parent hierarchies.
+
+a snapshot pages through every structural object under a parent hierarchy
+with concurrent search-within requests and stores title, uuid and direct
+parent in SQLite, along with each object's identifiers so lookups can apply
+the same identifier filters as the API searches. existence checks against the mirror are local queries, so
+a whole deletion list is checked without any API calls. a mirror is only as
+current as its snapshot, take a new one before relying on it after ingests.
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from pathlib import Path
+from typing import Iterable
+
+import repair_tools.prsv_api as prsvapi
+import repair_tools.volume_index as volume_index
+from repair_tools.index_store import batched
+from repair_tools.prsv_client import PreservicaClient
+
+MIRROR_FILE = volume_index.INDEX_DIR / "prsv_mirror.sqlite"
+
+HIERARCHIES = {
+    "ingest": "380c6d78-0a8a-4843-b472-2199ba7fad72",
+    "digami": "183a74b5-7247-4fb2-8184-959366bc0cbc",
+    "digarch": "e80315bc-42f5-44da-807f-446f78621c08",
+    # the test tenant's DigArch folder, it has no DigAMI folder
+    "test-digarch": "c0b9b47a-5552-4277-874e-092b3cc53af6",
+}
+
+# pages in flight at once while taking a snapshot
+CONCURRENCY = 8
+
+METADATA = "xip.title,xip.parent_ref,xip.identifier"
+SNAPSHOT_QUERY = {"q": "%", "fields": [{"name": "xip.document_type", "values": ["SO"]}]}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    hierarchy TEXT NOT NULL,
+    uuid TEXT NOT NULL,
+    title TEXT,
+    parent TEXT,
+    identifiers TEXT,
+    PRIMARY KEY (hierarchy, uuid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS objects_title ON objects (hierarchy, title);
+CREATE TABLE IF NOT EXISTS snapshots (
+    hierarchy TEXT PRIMARY KEY,
+    taken REAL NOT NULL,
+    objects INTEGER NOT NULL,
+    identifiers INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# (uuid, title, parent, identifiers)
+MirroredObject = tuple[str, str | None, str | None, list[str]]
+
+
+def identifier_values(value) -> list[str]:
+    """the xip.identifier of a hit, which comes back as one value or a list of them"""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    return [str(value)]
+
+
+def fetch_objects(
+    client: PreservicaClient, hierarchy: str, concurrency: int = CONCURRENCY, page_size: int | None = None
+) -> list[MirroredObject]:
+    """
+    every structural object under hierarchy as (uuid, title, parent, identifiers).
+    the first page gives the total, the remaining pages are requested concurrently
+    """
+    page_size = min(page_size or prsvapi.PAGE_SIZE, prsvapi.MAX_PAGE_SIZE)
+
+    def page(start: int) -> dict:
+        return prsvapi.search_within(client, SNAPSHOT_QUERY, hierarchy, start, page_size, METADATA)
+
+    def rows(value: dict) -> list:
+        object_ids = value.get("objectIds") or []
+        fields = (value.get("metadata") or [])[: len(object_ids)]
+        return [
+            (
+                object_id[-36:],
+                prsvapi.hit_title(md),
+                prsvapi.hit_field(md, "xip.parent_ref"),
+                identifier_values(prsvapi.hit_field(md, "xip.identifier")),
+            )
+            for object_id, md in zip_longest(object_ids, fields)
+        ]
+
+    first = page(0)
+    objects = rows(first)
+    total = first.get("totalHits", 0)
+    if objects and len(objects) < total:
+        starts = range(len(objects), total, len(objects))
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+            for done, value in enumerate(executor.map(page, starts), 1):
+                objects.extend(rows(value))
+                if done % 20 == 0:
+                    logging.info(f"Fetched {len(objects)} of {total} objects under {hierarchy}")
+    return objects
+
+
+class Mirror:
+    """title -> uuid/parent index of mirrored hierarchies, safe to share between threads"""
+
+    def __init__(self, db_path: Path = MIRROR_FILE):
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self._lock = threading.Lock()
+
+    def _migrate(self):
+        """add the identifier columns to mirrors taken before they existed"""
+        for table, column in (("objects", "identifiers TEXT"), ("snapshots", "identifiers INTEGER NOT NULL DEFAULT 0")):
+            columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if column.split()[0] not in columns:
+                with self.conn:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def replace(self, hierarchy: str, objects: Iterable[MirroredObject]) -> int:
+        """swap in a new snapshot of hierarchy in one transaction, returns the object count"""
+        objects = list(objects)
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM objects WHERE hierarchy = ?", (hierarchy,))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO objects (hierarchy, uuid, title, parent, identifiers) VALUES (?, ?, ?, ?, ?)",
+                ((hierarchy, uuid, title, parent, json.dumps(ids)) for uuid, title, parent, ids in objects),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO snapshots (hierarchy, taken, objects, identifiers) VALUES (?, ?, ?, 1)",
+                (hierarchy, time.time(), len(objects)),
+            )
+        return len(objects)
+
+    def snapshot(
+        self, client: PreservicaClient, hierarchy: str, concurrency: int = CONCURRENCY, page_size: int | None = None
+    ) -> int:
+        return self.replace(hierarchy, fetch_objects(client, hierarchy, concurrency, page_size))
+
+    def taken(self, hierarchy: str) -> float | None:
+        """when hierarchy was last snapshotted, None if never"""
+        row = self.conn.execute("SELECT taken FROM snapshots WHERE hierarchy = ?", (hierarchy,)).fetchone()
+        return row[0] if row else None
+
+    def snapshots(self) -> dict[str, tuple[float, int]]:
+        """{hierarchy: (taken, objects)} for every mirrored hierarchy"""
+        rows = self.conn.execute("SELECT hierarchy, taken, objects FROM snapshots ORDER BY hierarchy")
+        return {hierarchy: (taken, objects) for hierarchy, taken, objects in rows}
+
+    def search_titles(self, titles: Iterable[str], hierarchy: str, identifier: str | None = None) -> dict[str, list[str]]:
+        """
+        the mirror's answer to prsv_api.search_titles, {title: [uuids]} for every title asked for.
+        identifier keeps only objects carrying that xip.identifier, as the API's field filter does.
+        raises KeyError if hierarchy was never snapshotted, or was snapshotted without
+        identifiers and one is asked for
+        """
+        row = self.conn.execute("SELECT identifiers FROM snapshots WHERE hierarchy = ?", (hierarchy,)).fetchone()
+        if row is None:
+            raise KeyError(f"No snapshot of {hierarchy}, take one with prsv_mirror")
+        if identifier is not None and not row[0]:
+            raise KeyError(f"The snapshot of {hierarchy} has no identifiers, take a new one with prsv_mirror")
+        titles = list(dict.fromkeys(titles))
+        found = {title: [] for title in titles}
+        with self._lock:
+            for batch in batched(sorted(found)):
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT title, uuid, identifiers FROM objects WHERE hierarchy = ? AND title IN ({placeholders}) "
+                    "ORDER BY title, uuid",
+                    (hierarchy, *batch),
+                )
+                for title, uuid, identifiers in rows:
+                    if identifier is None or identifier in json.loads(identifiers or "[]"):
+                        found[title].append(uuid)
+        return found
+
+    def record_move(self, uuid: str, new_parent: str):
+        """
+        keep the mirror in step with a move: the object now belongs to the mirrored hierarchies
+        that are, or contain, new_parent. its descendants wait for the next snapshot
+        """
+        with self._lock, self.conn:
+            row = self.conn.execute("SELECT title, identifiers FROM objects WHERE uuid = ? LIMIT 1", (uuid,)).fetchone()
+            hierarchies = {h for (h,) in self.conn.execute("SELECT hierarchy FROM objects WHERE uuid = ?", (new_parent,))}
+            if self.conn.execute("SELECT 1 FROM snapshots WHERE hierarchy = ?", (new_parent,)).fetchone():
+                hierarchies.add(new_parent)
+            self.conn.execute("DELETE FROM objects WHERE uuid = ?", (uuid,))
+            if row:
+                self.conn.executemany(
+                    "INSERT INTO objects (hierarchy, uuid, title, parent, identifiers) VALUES (?, ?, ?, ?, ?)",
+                    ((hierarchy, uuid, row[0], new_parent, row[1]) for hierarchy in hierarchies),
+                )
+
+
+def hierarchy_uuid(name: str) -> str:
+    """a hierarchy given by its folder name or uuid"""
+    return HIERARCHIES.get(name.lower(), name)
+
+
+########## parser
+def parse_args():
+    parser = argparse.ArgumentParser(description="Snapshot Preservica parent hierarchies into a local mirror")
+
+    parser.add_argument(
+        "hierarchies",
+        nargs="*",
+        type=hierarchy_uuid,
+        help=f"""Parent hierarchies to snapshot, by uuid or as one of {', '.join(HIERARCHIES)}""",
+        )
+    parser.add_argument(
+        "--credentials",
+        type=str,
+        choices=["test-ingest", "prod-ingest", "test-manage"],
+        help="""Which set of credentials to use, required to take a snapshot""",
+        )
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=CONCURRENCY,
+        help=f"""Pages requested at once, default {CONCURRENCY}""",
+        )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=prsvapi.PAGE_SIZE,
+        help=f"""Objects per page, at most {prsvapi.MAX_PAGE_SIZE}""",
+        )
+    parser.add_argument(
+        "--mirror-file",
+        type=Path,
+        default=MIRROR_FILE,
+        help=f"""Mirror database, default {MIRROR_FILE}""",
+        )
+
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    args = parse_args()
+    if args.hierarchies and not args.credentials:
+        raise SystemExit("--credentials is required to take a snapshot")
+
+    with Mirror(args.mirror_file) as mirror:
+        if args.hierarchies:
+            with PreservicaClient(args.credentials, pool_size=args.concurrency) as client:
+                for hierarchy in args.hierarchies:
+                    start = time.monotonic()
+                    count = mirror.snapshot(client, hierarchy, args.concurrency, args.page_size)
+                    logging.info(f"Mirrored {count} objects under {hierarchy} in {time.monotonic() - start:.1f}s")
+        for hierarchy, (taken, objects) in mirror.snapshots().items():
+            print(f"{hierarchy}: {objects} objects, taken {time.strftime('%Y-%m-%d %H:%M', time.localtime(taken))}")
+
+
+if __name__ == "__main__":
+    main()
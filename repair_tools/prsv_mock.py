@@ -0,0 +1,331 @@
+"""
+local stand-in for the Preservica API, for tests and benchmarks.
+
+serves the endpoints the tools use: token login, search-within, parent-ref
+moves with their progress tokens, structural object reads and admin schemas.
+every request can be slowed by a fixed latency, failed with a 503 at a given
+rate, and tokens expire after token_ttl seconds so 401 handling is exercised.
+searches apply every field filter the tools send: titles, identifiers, document
+type and collection IDs. any credentials are accepted. run it alone and point the tools at it with
+PRSV_BASE_URL=http://127.0.0.1:<port>/api
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid as uuidlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable
+from urllib.parse import parse_qs, urlsplit
+from xml.sax.saxutils import escape
+
+from repair_tools import package_id
+from repair_tools.compare_sources import AMI_CONTAINER
+from repair_tools.prsv_mirror import HIERARCHIES
+
+ENTITY_NS = "http://preservica.com/EntityAPI/v7.0"
+SCHEMAS_XML = '<Schemas xmlns="http://preservica.com/AdminAPI/v7.0"></Schemas>'
+
+
+class MockPreservica:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        token_ttl: float = 500,
+        move_delay: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.token_ttl = token_ttl
+        self.move_delay = move_delay
+        self.random = random.Random(seed)
+
+        # uuid -> [title, parent, {field name: [values]}] for the fields searches can filter on
+        self.objects: dict[str, list] = {}
+        self.tokens: dict[str, float] = {}
+        # progress token -> [done at, uuid, new parent, applied], and the tokens not yet applied
+        self.moves: dict[str, list] = {}
+        self.pending: list[str] = []
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.server: ThreadingHTTPServer | None = None
+
+    ########## data
+
+    def add_object(
+        self, title: str, parent: str | None = None, identifiers: Iterable[str] = (), object_uuid: str | None = None
+    ) -> str:
+        """a structural object, DigArch packages also get their spec.specCollectionID"""
+        object_uuid = object_uuid or str(uuidlib.UUID(int=self.random.getrandbits(128)))
+        fields = {"xip.document_type": ["SO"], "xip.identifier": list(identifiers)}
+        pkg = package_id.classify(title)
+        if pkg is not None and pkg.collection is not None:
+            fields["spec.specCollectionID"] = [pkg.collection]
+        with self.lock:
+            self.objects[object_uuid] = [title, parent, fields]
+        return object_uuid
+
+    def add_packages(self, parent: str, titles: list[str], identifiers: Iterable[str] = ()) -> list[str]:
+        identifiers = list(identifiers)
+        return [self.add_object(title, parent, identifiers) for title in titles]
+
+    def field_values(self, object_uuid: str, name: str) -> list[str]:
+        title, parent, fields = self.objects[object_uuid]
+        if name == "xip.title":
+            return [title]
+        if name == "xip.parent_ref":
+            return [parent] if parent else []
+        return fields.get(name, [])
+
+    def matches(self, object_uuid: str, filters: list[dict]) -> bool:
+        """whether an object has one of the values of every field filter"""
+        return all(set(self.field_values(object_uuid, f.get("name"))) & set(f.get("values") or []) for f in filters)
+
+    def in_hierarchy(self, object_uuid: str, hierarchy: str) -> bool:
+        parent = self.objects[object_uuid][1]
+        while parent is not None:
+            if parent == hierarchy:
+                return True
+            parent = self.objects[parent][1] if parent in self.objects else None
+        return False
+
+    def settle(self):
+        """apply the moves whose delay has passed"""
+        now = time.monotonic()
+        still_pending = []
+        for progress_token in self.pending:
+            move = self.moves[progress_token]
+            if move[0] <= now:
+                self.objects[move[1]][1] = move[2]
+                move[3] = True
+            else:
+                still_pending.append(progress_token)
+        self.pending = still_pending
+
+    ########## server
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """serve in a background thread, returns the base url"""
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://{host}:{self.server.server_address[1]}/api"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    ########## endpoints, each returns (status, content type, body)
+
+    def login(self, form: dict) -> tuple:
+        token = uuidlib.uuid4().hex
+        self.tokens[token] = time.monotonic()
+        return 200, "application/json", json.dumps({"success": True, "token": token})
+
+    def search_within(self, params: dict) -> tuple:
+        query = json.loads(params.get("q", "{}"))
+        hierarchy = params.get("parenthierarchy")
+        filters = query.get("fields") or []
+        hits = sorted(
+            u for u in self.objects if self.matches(u, filters) and (not hierarchy or self.in_hierarchy(u, hierarchy))
+        )
+        start = int(params.get("start", 0))
+        size = int(params.get("max", -1))
+        page = hits[start:] if size < 0 else hits[start : start + size]
+        wanted = [name for name in params.get("metadata", "").split(",") if name]
+        metadata = []
+        for u in page:
+            fields = []
+            for name in wanted:
+                values = self.field_values(u, name)
+                if name == "xip.parent_ref":
+                    fields.append({"name": name, "value": values[0] if values else None})
+                elif values:
+                    # like the API, a field with several values comes back as a list
+                    fields.append({"name": name, "value": values[0] if len(values) == 1 else values})
+            metadata.append(fields)
+        body = {
+            "success": True,
+            "value": {"objectIds": [f"sdb:SO|{u}" for u in page], "metadata": metadata, "totalHits": len(hits)},
+        }
+        return 200, "application/json", json.dumps(body)
+
+    def move(self, object_uuid: str, new_parent: str) -> tuple:
+        if object_uuid not in self.objects:
+            return 404, "text/plain", "not found"
+        progress_token = uuidlib.uuid4().hex
+        self.moves[progress_token] = [time.monotonic() + self.move_delay, object_uuid, new_parent.strip(), False]
+        self.pending.append(progress_token)
+        self.settle()
+        return 202, "text/plain", progress_token
+
+    def progress(self, progress_token: str) -> tuple:
+        if progress_token not in self.moves:
+            return 404, "text/plain", "not found"
+        status = "COMPLETED" if self.moves[progress_token][3] else "ACTIVE"
+        return 200, "application/xml", f'<ProgressResponse xmlns="{ENTITY_NS}"><Status>{status}</Status></ProgressResponse>'
+
+    def structural_object(self, object_uuid: str) -> tuple:
+        if object_uuid not in self.objects:
+            return 404, "text/plain", "not found"
+        title, parent, _ = self.objects[object_uuid]
+        body = (
+            f'<EntityResponse xmlns="{ENTITY_NS}"><StructuralObject><Ref>{object_uuid}</Ref>'
+            f"<Title>{escape(title)}</Title><Parent>{parent or ''}</Parent></StructuralObject></EntityResponse>"
+        )
+        return 200, "application/xml", body
+
+    def handle(self, method: str, path: str, params: dict, headers, body: str) -> tuple:
+        if self.latency:
+            time.sleep(self.latency)
+        parts = path.strip("/").split("/")
+        if parts and parts[0] == "api":
+            parts = parts[1:]
+        route = "/".join(parts[:2])
+        with self.lock:
+            self.requests[f"{method} {route}"] += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                return 503, "text/plain", "unavailable"
+
+            if method == "POST" and parts == ["accesstoken", "login"]:
+                return self.login(parse_qs(body))
+
+            issued = self.tokens.get(headers.get("Preservica-Access-Token", ""))
+            if issued is None or time.monotonic() - issued > self.token_ttl:
+                return 401, "application/json", json.dumps({"success": False, "message": "token expired"})
+
+            self.settle()
+            if method == "GET" and parts == ["content", "search-within"]:
+                return self.search_within(params)
+            if method == "GET" and parts == ["admin", "schemas"]:
+                return 200, "application/xml", SCHEMAS_XML
+            if method == "GET" and route == "entity/progress" and len(parts) == 3:
+                return self.progress(parts[2])
+            if route == "entity/structural-objects" and len(parts) == 4 and parts[3] == "parent-ref" and method == "PUT":
+                return self.move(parts[2], body)
+            if route == "entity/structural-objects" and len(parts) == 3 and method == "GET":
+                return self.structural_object(parts[2])
+        return 404, "text/plain", "not found"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes, don't let them wait on delayed acks
+    disable_nagle_algorithm = True
+
+    def respond(self, method: str):
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else ""
+        status, content_type, payload = self.server.mock.handle(method, url.path, params, self.headers, body)
+        data = payload.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.respond("GET")
+
+    def do_POST(self):
+        self.respond("POST")
+
+    def do_PUT(self):
+        self.respond("PUT")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def populate(mock: MockPreservica, packages: int) -> dict[str, str]:
+    """
+    create the folders the tools search, under the uuids they use, and fill them with packages.
+    returns {folder name: uuid}
+    """
+    folders = {name: mock.add_object(name.upper(), object_uuid=uuid) for name, uuid in HIERARCHIES.items()}
+    digarch_titles = [f"M{1000 + i // 20}_ER_{i % 20}" for i in range(packages)]
+    for name in ("ingest", "digarch", "test-digarch"):
+        mock.add_packages(folders[name], digarch_titles)
+    # AMI packages are containers with the identifier compare_sources filters on
+    mock.add_packages(folders["digami"], [f"{100000 + i}" for i in range(packages)], [AMI_CONTAINER])
+    return folders
+
+
+########## parser
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve a local mock of the Preservica API")
+
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8080,
+        help="""Port to listen on""",
+        )
+    parser.add_argument(
+        "--packages",
+        type=int,
+        default=10000,
+        help="""Number of packages to put in the ingest folder""",
+        )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="""Seconds added to every request""",
+        )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="""Fraction of requests answered with a 503""",
+        )
+    parser.add_argument(
+        "--token-ttl",
+        type=float,
+        default=500,
+        help="""Seconds before a token is refused with a 401""",
+        )
+    parser.add_argument(
+        "--move-delay",
+        type=float,
+        default=5,
+        help="""Seconds before a started move completes""",
+        )
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    mock = MockPreservica(args.latency, args.error_rate, args.token_ttl, args.move_delay)
+    folders = populate(mock, args.packages)
+    deletion = mock.add_object("DELETION")
+
+    base_url = mock.start(port=args.port)
+    print(f"Serving mock Preservica at {base_url}")
+    print(f"Folders {', '.join(f'{name} {uuid}' for name, uuid in folders.items())}, deletion folder {deletion}")
+    print(f"Run the tools with PRSV_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
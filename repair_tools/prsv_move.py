@@ -1,20 +1,24 @@
 import argparse
-import json
 import logging
 import requests
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
 from pathlib import Path
 import repair_tools.prsv_api as prsvapi
+import repair_tools.prsv_cache as prsv_cache
+import repair_tools.prsv_mirror as prsv_mirror
+import repair_tools.prsv_progress as prsv_progress
+from repair_tools.prsv_client import PreservicaClient
 
 # parent ref to search within (INGEST folder), can be changed
 PARENT_HIERARCHY = "380c_d78-0a8a-4843-b472-2199ba7fad72" # INGEST folder
 # PARENT_HIERARCHY = "183a74b5-7247-4fb2-8184-959366bc0cbc" # DigAMI folder
 # PARENT_HIERARCHY = "e80315bc-42f5-44da-807f-446f78621c08" # DigArch folder
 
-PRESERVICA_API_URL = "https://nypl.preservica.com/api"
-
 DELETION_LIST_PATH = Path("/Users/emileebuytkins/Documents/Buytkins_Programming/complete_reingest.txt")
-DELETION_LIST = [line for line in DELETION_LIST_PATH.read_text().splitlines() if line.strip()]
+
+# title searches or parent-ref PUTs in flight at once in bulk mode
+MOVE_CONCURRENCY = 8
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -53,105 +57,181 @@ def parse_args():
         choices=["ingest", "digami", "digarch"],
         help="The parentref of the current folder. Options: 'ingest', 'digami', 'digarch'"
     )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Resolve every package up front in concurrent batches, then start the moves through a worker pool."
+    )
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=MOVE_CONCURRENCY,
+        help=f"Searches or moves in flight at once in bulk mode, default {MOVE_CONCURRENCY}."
+    )
+    parser.add_argument(
+        "--track",
+        type=float,
+        metavar="SECONDS",
+        help="Poll the started moves until they finish or SECONDS pass, and report completed, failed and running."
+    )
+    parser.add_argument(
+        "--mirror",
+        action="store_true",
+        help="Find packages in the local mirror taken with prsv_mirror instead of searching Preservica."
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ask Preservica about every package instead of reusing cached answers."
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=prsv_cache.TTL / 3600,
+        help=f"Hours a cached answer for a found package is trusted, default {prsv_cache.TTL / 3600:g}."
+    )
+    parser.add_argument(
+        "--negative-ttl",
+        type=float,
+        default=prsv_cache.NEGATIVE_TTL / 3600,
+        help=f"Hours a cached answer for a missing package is trusted, default {prsv_cache.NEGATIVE_TTL / 3600:g}."
+    )
     return parser.parse_args()
 
-def get_pkg_uuid(accesstoken: str, pkg_title: str, initial_parent: str, new_parent: str) -> str | None:
-
-    def perform_search(parent_uuid: str, current_token: str) -> requests.Response | str | None:
-        """
-        Performs the search request with a retry mechanism.
-        Returns a response object on success, None on failure,
-        or the string "REAUTH" if a 401 error occurs.
-        """
-        query_params = {"q": "", "fields": [{"name": "xip.title", "values": [pkg_title]}]}
-        query_str = json.dumps(query_params)
-        search_url = (
-            f"{PRESERVICA_API_URL}/content/search-within"
-            f"?q={requests.utils.quote(query_str)}"
-            f"&parenthierarchy={parent_uuid}"
-            "&start=0&max=10&metadata=id"
-        )
-        headers = {"Preservica-Access-Token": current_token, "accept": "application/json"}
-
-        for attempt in range(3):
+def get_pkg_uuids(
+    client: PreservicaClient,
+    pkg_titles: list[str],
+    initial_parent: str,
+    new_parent: str,
+    cache: prsv_cache.LookupCache | None = None,
+    mirror: prsv_mirror.Mirror | None = None,
+) -> dict[str, str | bool | None]:
+    """
+    resolve many packages with batched title searches, reusing fresh answers from cache,
+    or entirely from a local mirror when one is given.
+    each title maps to its uuid in the initial parent, True if it is already in the new parent,
+    or None if it is in neither or could not be looked up
+    """
+
+    def search(titles: list[str], parent_uuid: str) -> dict[str, list[str]]:
+        if mirror is not None:
             try:
-                response = requests.get(search_url, headers=headers)
-                response.raise_for_status()
-                return response
-            except requests.exceptions.HTTPError as e:
-                # check for token related errors
-                if e.response.status_code == 401:
-                    logging.error(f"Authorization failed (401): Token is expired. Signaling for re-authentication.")
-                    return "REAUTH" #signals to refresh token
-                # HTTP errors other than 401
-                logging.warning(f"HTTP Error on attempt {attempt + 1}/3: {e}.")
-            except requests.exceptions.RequestException as e:
-                # conn errors, timeouts, etc.
-                logging.warning(f"Connection Error on attempt {attempt + 1}/3: {e}.")
-
-            if attempt < 2:
-                logging.info("Retrying in 15 seconds...")
-                time.sleep(15)
-
-        logging.error(f"API request failed after 3 attempts for '{pkg_title}' in parent '{parent_uuid}'.")
-        return None
+                return mirror.search_titles(titles, parent_uuid)
+            except KeyError as e:
+                logging.error(e)
+                return {}
+        found = {}
+        for i in range(0, len(titles), prsvapi.TITLE_BATCH):
+            batch = titles[i : i + prsvapi.TITLE_BATCH]
+            try:
+                found.update(prsv_cache.search_titles(client, cache, batch, parent_uuid))
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # transient errors were already retried by the client
+                logging.error(f"API request failed for {len(batch)} titles in parent '{parent_uuid}': {e}")
+        return found
 
-    # check parent ref
-    initial_response = perform_search(initial_parent, accesstoken)
-    if initial_response == "REAUTH":
-        return "REAUTH" 
-    if initial_response:
-        try:
-            data = initial_response.json()
-            if data.get("success") and data["value"]["totalHits"] > 0:
-                metadata = data.get("value", {}).get("metadata", [])
-                if metadata and metadata[0]:
-                    return metadata[0][0].get("value")
-        except (json.JSONDecodeError, KeyError, IndexError) as e:
-            logging.error(f"Failed to parse initial search response for '{pkg_title}': {e}")
+    pkg_titles = list(dict.fromkeys(pkg_titles))
+    resolved = dict.fromkeys(pkg_titles)
 
+    # check parent ref
+    for title, uuids in search(pkg_titles, initial_parent).items():
+        if uuids:
+            resolved[title] = uuids[0]
 
     # check deletion folder
-    logging.warning(f"Package '{pkg_title}' not in initial folder. Checking deletion folder:")
-    new_parent_response = perform_search(new_parent, accesstoken)
-    if new_parent_response == "REAUTH":
-        return "REAUTH" # pass token retry signal up to refresh
-    if new_parent_response:
-        try:
-            data = new_parent_response.json()
-            if data.get("success") and data["value"]["totalHits"] > 0:
-                logging.info(f"Package '{pkg_title}' already exists in the deletion folder.")
-                return True 
-        except (json.JSONDecodeError, KeyError, IndexError) as e:
-            logging.error(f"Failed to parse second search response for '{pkg_title}': {e}")
-
+    unresolved = [title for title, uuid in resolved.items() if uuid is None]
+    if unresolved:
+        logging.warning(f"{len(unresolved)} packages not in initial folder. Checking deletion folder:")
+    for title, uuids in search(unresolved, new_parent).items():
+        if uuids:
+            logging.info(f"Package '{title}' already exists in the deletion folder.")
+            resolved[title] = True
 
     # not in either
-    logging.warning(f"Package '{pkg_title}' not found in either location.")
-    return None 
-
-def set_new_parent_ref(accesstoken: str, pkg_uuid: str, new_parent_uuid: str) -> bool:
-    """Moves pkg to new parentref"""
-    move_url = f"{PRESERVICA_API_URL}/entity/structural-objects/{pkg_uuid}/parent-ref"
+    for title, uuid in resolved.items():
+        if uuid is None:
+            logging.warning(f"Package '{title}' not found in either location.")
+    return resolved
+
+def get_pkg_uuid(
+    client: PreservicaClient,
+    pkg_title: str,
+    initial_parent: str,
+    new_parent: str,
+    cache: prsv_cache.LookupCache | None = None,
+    mirror: prsv_mirror.Mirror | None = None,
+) -> str | bool | None:
+    return get_pkg_uuids(client, [pkg_title], initial_parent, new_parent, cache, mirror)[pkg_title]
+
+def resolve_all(
+    client: PreservicaClient,
+    pkg_titles: list[str],
+    initial_parent: str,
+    new_parent: str,
+    cache: prsv_cache.LookupCache | None = None,
+    mirror: prsv_mirror.Mirror | None = None,
+    concurrency: int = MOVE_CONCURRENCY,
+) -> dict[str, str | bool | None]:
+    """get_pkg_uuids over batches of titles, at most concurrency batches at a time"""
+    pkg_titles = list(dict.fromkeys(pkg_titles))
+    if mirror is not None:
+        # local queries, nothing to overlap
+        return get_pkg_uuids(client, pkg_titles, initial_parent, new_parent, mirror=mirror)
+    batches = [pkg_titles[i : i + prsvapi.TITLE_BATCH] for i in range(0, len(pkg_titles), prsvapi.TITLE_BATCH)]
+    resolved = {}
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        for result in executor.map(lambda batch: get_pkg_uuids(client, batch, initial_parent, new_parent, cache), batches):
+            resolved.update(result)
+    return resolved
+
+def move_all(
+    client: PreservicaClient, pkg_uuids: dict[str, str], new_parent_uuid: str, concurrency: int = MOVE_CONCURRENCY
+) -> dict[str, prsv_progress.Move | None]:
+    """start the moves of {title: uuid} through a pool of concurrency workers, {title: move or None if not started}"""
+    started = {}
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        futures = {
+            executor.submit(set_new_parent_ref, client, pkg_uuid, new_parent_uuid, title): title
+            for title, pkg_uuid in pkg_uuids.items()
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            title = futures[future]
+            try:
+                started[title] = future.result()
+            except Exception as e:
+                logging.error(f"An unexpected error occurred while moving '{title}': {e}")
+                started[title] = None
+            if done % 100 == 0:
+                logging.info(f"Sent {done} of {len(futures)} moves")
+    return started
+
+def set_new_parent_ref(
+    client: PreservicaClient, pkg_uuid: str, new_parent_uuid: str, pkg_title: str = ""
+) -> prsv_progress.Move | None:
+    """Moves pkg to new parentref, returns the started move with its progress token or None"""
+    move_path = f"entity/structural-objects/{pkg_uuid}/parent-ref"
     
     headers = {
-        "Preservica-Access-Token": accesstoken,
         "Content-Type": "text/plain",
         "accept": "text/plain;charset=UTF-8"
     }
 
     try:
-        response = requests.put(move_url, headers=headers, data=new_parent_uuid.strip())
+        # sent once: a 5xx or a timeout can come back after the move was accepted,
+        # and a second PUT would start a second move
+        response = client.put(move_path, retry=False, headers=headers, data=new_parent_uuid.strip())
 
         if response.status_code == 202:
-            return True
+            # the body is the progress token of the queued move
+            return prsv_progress.Move(pkg_title or pkg_uuid, pkg_uuid, new_parent_uuid.strip(), response.text.strip() or None)
         else:
             logging.error(f"FAILED to move. Status: {response.status_code}, Response: {response.text}")
-            return False
+            return None
 
     except requests.exceptions.RequestException as e:
         logging.error(f"API request failed during move: {e}")
-        return False
+        return None
 
 
 def main():
@@ -160,80 +240,119 @@ def main():
     logging.basicConfig(level=logging.INFO, format='%(message)s')
 
     if "ingest" in args.parent:
-        PARENT_HIERARCHY = "380c6d78-0a8a-4843-b472-2199ba7fad72" # INGEST folder
+        PARENT_HIERARCHY = prsv_mirror.HIERARCHIES["ingest"]
     elif "digami" in args.parent:
-        PARENT_HIERARCHY = "183a74b5-7247-4fb2-8184-959366bc0cbc" # DigAMI folder
+        PARENT_HIERARCHY = prsv_mirror.HIERARCHIES["digami"]
     elif "digarch" in args.parent:
-        PARENT_HIERARCHY = "e80315bc-42f5-44da-807f-446f78621c08" # DigArch folder
+        PARENT_HIERARCHY = prsv_mirror.HIERARCHIES["digarch"]
     else:
         print("Define parent folder to search in")
         return
 
-    accesstoken = prsvapi.get_token(args.credentials)
-
-    failed_moves = set()
-    successful_moves = set()
-    deletion_exists = set()
-
-    # set -> list conversion to avoid miscounts in summary (gets rid of duplicates)
-    if args.use_file:
-        logging.info(f"Using package list from file: {DELETION_LIST_PATH.name}")
-        pkg_set = set(DELETION_LIST)
-    else:
-        logging.info("Using package list provided from the command line.")
-        pkg_set = set(args.pkgtitle)
-
-    pkg_list = list(pkg_set)
-    
-    i = 0
-    while i < len(pkg_list):
-        pkg_title = pkg_list[i]
-        try:
-            print(f"\n--- Processing package: {pkg_title} ---")
-            
-            pkg_uuid = get_pkg_uuid(accesstoken, pkg_title, PARENT_HIERARCHY, args.new_parent_ref)
-
-            if pkg_uuid == "REAUTH":
-                print("Accesstoken expired, attempting to refresh.")
-                accesstoken = prsvapi.get_token(args.credentials)
-                print("Token refreshed. Retrying last package.")
-                continue 
-
-            if not pkg_uuid:
-                print(f"Move FAILED: Could not find package {pkg_title}, skipping.")
-                failed_moves.add(pkg_title)
-            elif pkg_uuid is True:
-                print(f"Move SKIPPED: Package {pkg_title} already exists in the destination folder.")
-                deletion_exists.add(pkg_title)
-            else:
-                print("Found package, safe to move.")
-                success = set_new_parent_ref(accesstoken, pkg_uuid, args.new_parent_ref)
-
-                if success:
-                    print(f"Move workflow for '{pkg_title}' started.")
-                    successful_moves.add(pkg_title)
+    # the mirror and cache are closed on every way out, so their WAL is checkpointed
+    with ExitStack() as stack:
+        client = stack.enter_context(PreservicaClient(args.credentials, pool_size=max(args.concurrency, 1)))
+        cache = None
+        mirror = None
+        if args.mirror:
+            mirror = stack.enter_context(prsv_mirror.Mirror())
+        elif not args.no_cache:
+            cache = stack.enter_context(
+                prsv_cache.LookupCache(ttl=args.cache_ttl * 3600, negative_ttl=args.negative_ttl * 3600)
+            )
+
+        def record_move(pkg_title: str, pkg_uuid: str):
+            # the package is leaving the folder its answer was cached for
+            if cache is not None:
+                cache.invalidate(PARENT_HIERARCHY, [pkg_title], client.base_url)
+                cache.invalidate(args.new_parent_ref, [pkg_title], client.base_url)
+            if mirror is not None:
+                mirror.record_move(pkg_uuid, args.new_parent_ref)
+
+        failed_moves = set()
+        successful_moves = set()
+        deletion_exists = set()
+        started_moves = []
+
+        # set -> list conversion to avoid miscounts in summary (gets rid of duplicates)
+        if args.use_file:
+            logging.info(f"Using package list from file: {DELETION_LIST_PATH.name}")
+            pkg_set = set(line for line in DELETION_LIST_PATH.read_text().splitlines() if line.strip())
+        else:
+            logging.info("Using package list provided from the command line.")
+            pkg_set = set(args.pkgtitle)
+
+        pkg_list = list(pkg_set)
+
+        if args.bulk:
+            logging.info(f"Resolving {len(pkg_list)} packages...")
+            resolved = resolve_all(
+                client, sorted(pkg_list), PARENT_HIERARCHY, args.new_parent_ref, cache, mirror, args.concurrency
+            )
+            failed_moves.update(title for title, pkg_uuid in resolved.items() if not pkg_uuid)
+            deletion_exists.update(title for title, pkg_uuid in resolved.items() if pkg_uuid is True)
+            to_move = {title: pkg_uuid for title, pkg_uuid in resolved.items() if isinstance(pkg_uuid, str)}
+
+            logging.info(f"Starting {len(to_move)} moves...")
+            for title, move in move_all(client, to_move, args.new_parent_ref, args.concurrency).items():
+                if move:
+                    successful_moves.add(title)
+                    started_moves.append(move)
+                    record_move(title, to_move[title])
                 else:
-                    print(f"Move FAILED: Could not initiate the move for package {pkg_title} / uuid {pkg_uuid}.")
-                    failed_moves.add(pkg_title)
+                    failed_moves.add(title)
+        else:
+            for pkg_title in pkg_list:
+                try:
+                    print(f"\n--- Processing package: {pkg_title} ---")
             
-            i += 1 # move to the next pkg only if current was processed
+                    # expired tokens are renewed inside the client
+                    pkg_uuid = get_pkg_uuid(client, pkg_title, PARENT_HIERARCHY, args.new_parent_ref, cache, mirror)
+
+                    if not pkg_uuid:
+                        print(f"Move FAILED: Could not find package {pkg_title}, skipping.")
+                        failed_moves.add(pkg_title)
+                    elif pkg_uuid is True:
+                        print(f"Move SKIPPED: Package {pkg_title} already exists in the destination folder.")
+                        deletion_exists.add(pkg_title)
+                    else:
+                        print("Found package, safe to move.")
+                        move = set_new_parent_ref(client, pkg_uuid, args.new_parent_ref, pkg_title)
+
+                        if move:
+                            print(f"Move workflow for '{pkg_title}' started.")
+                            successful_moves.add(pkg_title)
+                            started_moves.append(move)
+                            record_move(pkg_title, pkg_uuid)
+                        else:
+                            print(f"Move FAILED: Could not initiate the move for package {pkg_title} / uuid {pkg_uuid}.")
+                            failed_moves.add(pkg_title)
+
+                except Exception as e:
+                    logging.error(f"An unexpected error occurred while processing '{pkg_title}': {e}")
+                    failed_moves.add(pkg_title)
+
+        print(f"\n--- SUMMARY ---")
+        print(f"\nTotal packages processed: {len(pkg_list)}")
+        print(f"Successful moves started: {len(successful_moves)}")
 
-        except Exception as e:
-            logging.error(f"An unexpected error occurred while processing '{pkg_title}': {e}")
-            failed_moves.add(pkg_title)
-            i += 1 # move to the next pkg even if unexpected error
+        if len(deletion_exists) > 0:
+            print(f"Pkgs already in deletion folder: {len(deletion_exists)}")
 
-    print(f"\n--- SUMMARY ---")
-    print(f"\nTotal packages processed: {len(pkg_list)}")
-    print(f"Successful moves started: {len(successful_moves)}")
+        if len(failed_moves) > 0:
+            print(f"\nFailed moves or errors: ({len(failed_moves)})")
+            for pkg in sorted(list(failed_moves)):
+                print(f"- {pkg}")
 
-    if len(deletion_exists) > 0:
-        print(f"Pkgs already in deletion folder: {len(deletion_exists)}")
+        if started_moves:
+            prsv_progress.save_moves(prsv_progress.MOVES_FILE, started_moves)
+            print(f"\nRecorded {len(started_moves)} started moves in {prsv_progress.MOVES_FILE}, check on them with prsv_progress")
 
-    if len(failed_moves) > 0:
-        print(f"\nFailed moves or errors: ({len(failed_moves)})")
-        for pkg in sorted(list(failed_moves)):
-            print(f"- {pkg}")
+        if args.track is not None and started_moves:
+            results = prsv_progress.track(client, started_moves, args.concurrency, args.track)
+            prsv_progress.settle(prsv_progress.MOVES_FILE, results)
+            print("\n--- MOVE PROGRESS ---")
+            print(prsv_progress.format_report(results))
 
 
 if __name__ == "__main__":
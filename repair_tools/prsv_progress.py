@@ -0,0 +1,248 @@
+"""
+track the asynchronous moves started by prsv_move.
+
+a parent-ref PUT only queues the move, its 202 response carries a progress
+token. every started move is recorded with its token, so one concurrent round
+of progress polls tells which moves completed, failed or are still running,
+without searching for the packages again. moves without a token are checked
+by reading the package's parent ref instead.
+"""
+
+import argparse
+import fcntl
+import json
+import logging
+import os
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
+import requests
+
+from repair_tools.prsv_client import PreservicaClient
+
+MOVES_FILE = Path("/Users/emileebuytkins/Documents/Buytkins_Programming/prsv_moves.jsonl")
+
+PROGRESS_PATH = "entity/progress/{}"
+ENTITY_PATH = "entity/structural-objects/{}"
+
+# polls in flight at once, and the pause between rounds while moves are running
+TRACK_CONCURRENCY = 16
+BACKOFF = 2.0
+MAX_BACKOFF = 60.0
+
+COMPLETED = "completed"
+FAILED = "failed"
+RUNNING = "running"
+
+DONE_STATUSES = {"COMPLETED", "SUCCEEDED", "FINISHED"}
+FAILED_STATUSES = {"FAILED", "ABORTED", "CANCELLED", "ERROR"}
+
+
+class Move(NamedTuple):
+    title: str
+    uuid: str
+    new_parent: str
+    token: str | None
+
+
+@contextmanager
+def moves_lock(moves_file: Path):
+    """
+    exclusive lock shared by everything writing the moves file. it sits on a separate
+    file because a rewrite replaces the moves file, and with it any lock held on it
+    """
+    moves_file = Path(moves_file)
+    moves_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(moves_file.with_suffix(".lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def save_moves(moves_file: Path, moves: Iterable[Move], append: bool = True):
+    moves_file = Path(moves_file)
+    with moves_lock(moves_file):
+        if append:
+            with open(moves_file, "a") as f:
+                f.writelines(json.dumps(move._asdict()) + "\n" for move in moves)
+        else:
+            _rewrite_moves(moves_file, moves)
+
+
+def _rewrite_moves(moves_file: Path, moves: Iterable[Move]):
+    """replace the moves file, the caller holds moves_lock"""
+    tmp_file = moves_file.with_name(moves_file.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        f.writelines(json.dumps(move._asdict()) + "\n" for move in moves)
+    os.replace(tmp_file, moves_file)
+
+
+def load_moves(moves_file: Path) -> list[Move]:
+    try:
+        lines = Path(moves_file).read_text().splitlines()
+    except FileNotFoundError:
+        return []
+    return [Move(**json.loads(line)) for line in lines if line.strip()]
+
+
+def settle(moves_file: Path, results: dict[str, list[Move]]):
+    """
+    drop the moves that finished from the record, running ones are kept for the next check.
+    the file is read and rewritten under the lock, so moves appended meanwhile are kept
+    """
+    finished = set(results[COMPLETED]) | set(results[FAILED])
+    with moves_lock(moves_file):
+        _rewrite_moves(Path(moves_file), [move for move in load_moves(moves_file) if move not in finished])
+
+
+def tag_text(text: str, name: str) -> str | None:
+    """text of the first element called name in an XML body, whatever its namespace"""
+    try:
+        root = ET.fromstring(text)
+    except ET.ParseError:
+        return None
+    for element in root.iter():
+        if element.tag.rsplit("}", 1)[-1] == name:
+            return (element.text or "").strip()
+    return None
+
+
+def progress_status(response: requests.Response) -> str | None:
+    text = response.text.strip()
+    if text.startswith("{"):
+        body = response.json()
+        value = body.get("value") or body
+        return value.get("status") or value.get("Status")
+    return tag_text(text, "Status")
+
+
+def poll(client: PreservicaClient, move: Move) -> str:
+    """
+    COMPLETED, FAILED or RUNNING for one move. errors leave it RUNNING to be polled again.
+    moves without a progress token, or whose token has expired, are checked by their parent ref
+    """
+    try:
+        if move.token:
+            response = client.get(PROGRESS_PATH.format(move.token))
+            if response.status_code != 404:
+                response.raise_for_status()
+                status = (progress_status(response) or "").upper()
+                if status in DONE_STATUSES:
+                    return COMPLETED
+                if status in FAILED_STATUSES:
+                    logging.error(f"{move.title}: move {status.lower()}")
+                    return FAILED
+                return RUNNING
+            # progress tokens are short-lived, the move may well have finished
+            logging.info(f"{move.title}: progress token {move.token} is unknown, checking the parent ref")
+
+        response = client.get(ENTITY_PATH.format(move.uuid), headers={"accept": "application/xml"})
+        if response.status_code == 404:
+            logging.error(f"{move.title}: {move.uuid} no longer exists")
+            return FAILED
+        response.raise_for_status()
+        return COMPLETED if tag_text(response.text, "Parent") == move.new_parent else RUNNING
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.warning(f"{move.title}: could not poll the move: {e}")
+        return RUNNING
+
+
+def track(
+    client: PreservicaClient,
+    moves: Iterable[Move],
+    concurrency: int = TRACK_CONCURRENCY,
+    timeout: float = 0,
+    backoff: float = BACKOFF,
+    max_backoff: float = MAX_BACKOFF,
+) -> dict[str, list[Move]]:
+    """
+    poll every move concurrently, then keep polling the running ones with exponential
+    backoff until they finish or timeout seconds pass. timeout 0 is a single round.
+    returns {COMPLETED: [...], FAILED: [...], RUNNING: [...]}
+    """
+    results = {COMPLETED: [], FAILED: [], RUNNING: []}
+    pending = list(moves)
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        while pending:
+            running = []
+            for move, status in zip(pending, executor.map(lambda move: poll(client, move), pending)):
+                (running if status == RUNNING else results[status]).append(move)
+            pending = running
+            delay = min(max_backoff, backoff * 2**attempt)
+            if not pending or time.monotonic() + delay > deadline:
+                break
+            logging.info(f"{len(pending)} moves still running, polling again in {delay:.0f}s")
+            time.sleep(delay)
+            attempt += 1
+    results[RUNNING] = pending
+    return results
+
+
+def format_report(results: dict[str, list[Move]]) -> str:
+    lines = [f"{status.capitalize()}: {len(results[status])}" for status in (COMPLETED, FAILED, RUNNING)]
+    for move in sorted(results[FAILED]):
+        lines.append(f"- failed: {move.title} / {move.uuid}")
+    return "\n".join(lines)
+
+
+########## parser
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check on the Preservica moves started by prsv_move")
+
+    parser.add_argument(
+        "--credentials",
+        type=str,
+        required=True,
+        choices=["test-ingest", "prod-ingest", "test-manage"],
+        help="""Which set of credentials to use""",
+        )
+    parser.add_argument(
+        "--moves-file",
+        type=Path,
+        default=MOVES_FILE,
+        help=f"""Moves recorded by prsv_move, default {MOVES_FILE}""",
+        )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=0,
+        help="""Seconds to keep polling running moves, default one round""",
+        )
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=TRACK_CONCURRENCY,
+        help=f"""Polls in flight at once, default {TRACK_CONCURRENCY}""",
+        )
+
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_args()
+
+    moves = load_moves(args.moves_file)
+    if not moves:
+        print(f"No moves recorded in {args.moves_file}")
+        return
+
+    with PreservicaClient(args.credentials, pool_size=args.concurrency) as client:
+        results = track(client, moves, args.concurrency, args.timeout)
+
+    settle(args.moves_file, results)
+    print(" --- MOVE PROGRESS --- ")
+    print(format_report(results))
+
+
+if __name__ == "__main__":
+    main()
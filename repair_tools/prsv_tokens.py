@@ -0,0 +1,151 @@
+"""
+Preservica access tokens shared by every thread and process.
+
+tokens are held in memory per credential set and renewed by a background
+thread before callers would consider them stale, so requests neither wait on a
+401 round trip nor on a renewal of their own.
+separate processes share them through a JSON cache file guarded by an
+fcntl lock, so concurrent tools don't each log in.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+TOKEN_CACHE = Path.home() / ".repair_tools" / "prsv_tokens.json"
+
+# tokens are valid for 500 seconds, renew them a minute early
+TOKEN_LIFETIME = 500
+REFRESH_MARGIN = 60
+
+
+class TokenManager:
+    def __init__(
+        self,
+        cache_file: Path | None = TOKEN_CACHE,
+        lifetime: float = TOKEN_LIFETIME,
+        margin: float = REFRESH_MARGIN,
+    ):
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.lifetime = lifetime
+        self.margin = margin
+        # the background thread renews tokens two wake-ups before get() would
+        self.interval = min(margin / 2, 30)
+        self.early_margin = margin + 2 * self.interval
+        self._tokens: dict[str, tuple[str, float]] = {}
+        self._requesters: dict[str, Callable[[], str]] = {}
+        self._lock = threading.Lock()
+        self._set_locks: dict[str, threading.Lock] = {}
+        self._stop = threading.Event()
+        self._refresher: threading.Thread | None = None
+
+    def register(self, credential_set: str, request_token: Callable[[], str]):
+        """set how new tokens for a credential set are requested, and start background renewal"""
+        with self._lock:
+            self._requesters[credential_set] = request_token
+            self._set_locks.setdefault(credential_set, threading.Lock())
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name="prsv-token-refresh", daemon=True)
+                self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _fresh(self, issued: float, margin: float | None = None) -> bool:
+        return time.time() - issued < self.lifetime - (self.margin if margin is None else margin)
+
+    ########## tokens
+
+    def get(self, credential_set: str) -> str:
+        """a token with at least margin seconds left, requested only if no thread or process has one"""
+        cached = self._tokens.get(credential_set)
+        if cached and self._fresh(cached[1]):
+            return cached[0]
+        with self._set_lock(credential_set):
+            cached = self._tokens.get(credential_set)
+            if cached and self._fresh(cached[1]):
+                return cached[0]
+            return self._renew(credential_set, expired=None)
+
+    def renew(self, credential_set: str, expired: str) -> str:
+        """replace a token the server refused, unless another thread or process already has"""
+        with self._set_lock(credential_set):
+            cached = self._tokens.get(credential_set)
+            if cached and cached[0] != expired and self._fresh(cached[1]):
+                return cached[0]
+            return self._renew(credential_set, expired)
+
+    def _set_lock(self, credential_set: str) -> threading.Lock:
+        with self._lock:
+            return self._set_locks.setdefault(credential_set, threading.Lock())
+
+    def _renew(self, credential_set: str, expired: str | None, margin: float | None = None) -> str:
+        with self._file_lock():
+            shared = self._read_cache().get(credential_set)
+            if shared and shared["token"] != expired and self._fresh(shared["issued"], margin):
+                token, issued = shared["token"], shared["issued"]
+            else:
+                request_token = self._requesters.get(credential_set)
+                if request_token is None:
+                    raise KeyError(f"No way to request tokens for {credential_set}")
+                token, issued = request_token(), time.time()
+                self._write_cache(credential_set, token, issued)
+        self._tokens[credential_set] = (token, issued)
+        return token
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.interval):
+            for credential_set in list(self._requesters):
+                cached = self._tokens.get(credential_set)
+                if cached is None or self._fresh(cached[1], self.early_margin):
+                    continue
+                try:
+                    with self._set_lock(credential_set):
+                        self._renew(credential_set, expired=cached[0], margin=self.early_margin)
+                except Exception as e:
+                    logging.warning(f"Could not renew the {credential_set} token in the background: {e}")
+
+    ########## shared cache file
+
+    @contextmanager
+    def _file_lock(self):
+        if self.cache_file is None:
+            yield
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_file.with_suffix(".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_cache(self) -> dict:
+        if self.cache_file is None:
+            return {}
+        try:
+            return json.loads(self.cache_file.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _write_cache(self, credential_set: str, token: str, issued: float):
+        if self.cache_file is None:
+            return
+        cache = self._read_cache()
+        cache[credential_set] = {"token": token, "issued": issued}
+        tmp_file = self.cache_file.with_suffix(".tmp")
+        # tokens are credentials, keep them readable by this user only
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, self.cache_file)
+
+
+# one manager per process, shared by every client
+MANAGER = TokenManager()
@@ -0,0 +1,190 @@
+"""
+diff the packages of two volumes or index snapshots.
+
+both listings are streamed in name order and merge-joined, so only the
+packages currently being compared are held in memory. packages on both sides
+are fingerprinted (see duplicates.fingerprint) to tell identical copies from
+differing ones; a bounded window of fingerprints is computed concurrently.
+a copy that can't be read is reported as unreadable with its error, never as
+differing, so it isn't mistaken for a content mismatch.
+"""
+
+import argparse
+import itertools
+import logging
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple
+
+import repair_tools.duplicates as duplicates
+import repair_tools.index_query as index_query
+from repair_tools.walker import NUM_THREADS
+
+ONLY_SOURCE = "only-in-source"
+ONLY_TARGET = "only-in-target"
+IDENTICAL = "identical"
+DIFFERING = "differing"
+IN_BOTH = "in-both"  # name matched, contents not compared
+UNREADABLE = "unreadable"  # a copy could not be fingerprinted
+STATUSES = (ONLY_SOURCE, ONLY_TARGET, IDENTICAL, DIFFERING, IN_BOTH, UNREADABLE)
+
+
+class DiffEntry(NamedTuple):
+    name: str
+    status: str
+    source_paths: list[str]
+    target_paths: list[str]
+    error: OSError | None = None
+
+
+def grouped(items: Iterable[tuple[str, str]]) -> Iterator[tuple[str, list[str]]]:
+    """fold a name-sorted (name, path) stream into (name, [paths])"""
+    for name, group in itertools.groupby(items, key=lambda item: item[0]):
+        yield name, [path for _, path in group]
+
+
+def merge_join(
+    source: Iterable[tuple[str, str]], target: Iterable[tuple[str, str]]
+) -> Iterator[tuple[str, list[str], list[str]]]:
+    """
+    join two name-sorted (name, path) streams.
+    yields (name, source paths, target paths), one side empty when the name is missing from it
+    """
+    source, target = grouped(source), grouped(target)
+    s, t = next(source, None), next(target, None)
+    while s is not None or t is not None:
+        if t is None or (s is not None and s[0] < t[0]):
+            yield s[0], s[1], []
+            s = next(source, None)
+        elif s is None or t[0] < s[0]:
+            yield t[0], [], t[1]
+            t = next(target, None)
+        else:
+            yield s[0], s[1], t[1]
+            s, t = next(source, None), next(target, None)
+
+
+def compare_copies(source_paths: list[str], target_paths: list[str]) -> tuple[str, OSError | None]:
+    """
+    identical when every copy on both sides has the same fingerprint.
+    unreadable, with the error, as soon as one copy can't be fingerprinted
+    """
+    prints = set()
+    for path in source_paths + target_paths:
+        try:
+            prints.add(duplicates.fingerprint(Path(path)))
+        except OSError as e:
+            return UNREADABLE, e
+    return (IDENTICAL if len(prints) == 1 else DIFFERING), None
+
+
+def resolve(entry: tuple[str, list[str], list[str], Future | str]) -> DiffEntry:
+    name, source_paths, target_paths, status = entry
+    error = None
+    if isinstance(status, Future):
+        status, error = status.result()
+    return DiffEntry(name, status, source_paths, target_paths, error)
+
+
+def diff(
+    source: Iterable[tuple[str, str]],
+    target: Iterable[tuple[str, str]],
+    fingerprint: bool = True,
+    num_threads: int = NUM_THREADS,
+) -> Iterator[DiffEntry]:
+    """
+    classify every package of two name-sorted (name, path) streams, in name order.
+    at most 2 * num_threads comparisons are in flight at once
+    """
+    pending: deque[tuple[str, list[str], list[str], Future | str]] = deque()
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        for name, source_paths, target_paths in merge_join(source, target):
+            if not target_paths:
+                status = ONLY_SOURCE
+            elif not source_paths:
+                status = ONLY_TARGET
+            elif not fingerprint:
+                status = IN_BOTH
+            else:
+                status = executor.submit(compare_copies, source_paths, target_paths)
+            pending.append((name, source_paths, target_paths, status))
+
+            while pending and (len(pending) > 2 * num_threads or isinstance(pending[0][3], str)):
+                yield resolve(pending.popleft())
+        while pending:
+            yield resolve(pending.popleft())
+
+
+def paths_only(items: Iterable[tuple[str, index_query.Location]]) -> Iterator[tuple[str, str]]:
+    return ((name, location.path) for name, location in items)
+
+
+########## parser
+def extant_dir(p: str) -> Path:
+    path = Path(p)
+    if not path.is_dir():
+        raise argparse.ArgumentTypeError(f"{path} is not a directory")
+
+    return path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Diff the packages of a source volume against target volumes")
+
+    parser.add_argument(
+        "--source",
+        "-s",
+        type=extant_dir,
+        nargs="+",
+        required=True,
+        help="""Source volume(s), each with its own index shard""",
+        )
+    parser.add_argument(
+        "--target",
+        "-t",
+        type=extant_dir,
+        nargs="+",
+        required=True,
+        help="""Target volume(s), each with its own index shard""",
+        )
+    parser.add_argument(
+        "--names-only",
+        action="store_true",
+        help="""Flag to match packages by name only, without fingerprinting their contents""",
+        )
+    parser.add_argument(
+        "--show",
+        nargs="+",
+        choices=STATUSES,
+        default=[ONLY_SOURCE, DIFFERING, UNREADABLE],
+        help="""Statuses to list, all statuses are counted in the summary""",
+        )
+    parser.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="""Flag to use the cached shards without refreshing them""",
+        )
+
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    args = parse_args()
+
+    refresh = not args.no_refresh
+    counts = Counter()
+    with index_query.load_shards(args.source, refresh_index=refresh) as source, \
+            index_query.load_shards(args.target, refresh_index=refresh) as target:
+        for entry in diff(paths_only(source.items()), paths_only(target.items()), not args.names_only):
+            counts[entry.status] += 1
+            if entry.status in args.show:
+                line = f"{entry.status}\t{entry.name}\t{', '.join(entry.source_paths + entry.target_paths)}"
+                print(f"{line}\t{entry.error}" if entry.error else line)
+
+    logging.info(", ".join(f"{status}: {counts[status]}" for status in STATUSES if counts[status]))
+
+
+if __name__ == "__main__":
+    main()
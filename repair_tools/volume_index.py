@@ -0,0 +1,279 @@
+import hashlib
+import logging
+import os
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable
+
+import repair_tools.compact_index as compact
+import repair_tools.index_store as index_store
+import repair_tools.package_id as package_id
+import repair_tools.walker as walker
+import repair_tools.bloom as bloom
+from repair_tools.bloom import BloomFilter
+from repair_tools.compact_index import CompactIndex
+from repair_tools.index_store import IndexStore, batched
+
+# shared location for every tool's volume index
+INDEX_DIR = Path("/Users/emileebuytkins/Documents/Buytkins_Programming/index_files")
+
+# paths stat'ed per task when validating cached entries
+VALIDATE_BATCH = 256
+
+# how often a whole-volume walk writes what it has so far
+CHECKPOINT_DIRS = 5000
+CHECKPOINT_SECONDS = 60
+
+
+def index_path(root: Path, index_dir: Path | None = None) -> Path:
+    """one index file per volume, named after the root plus a hash of the full path"""
+    root_hash = hashlib.md5(str(Path(root).resolve()).encode()).hexdigest()[:8]
+    return Path(index_dir or INDEX_DIR) / f"{Path(root).name}_{root_hash}_index.sqlite"
+
+
+def refresh(
+    store: IndexStore,
+    root: Path,
+    rebuild: bool = False,
+    subtree: Path | None = None,
+    stats: walker.WalkStats | None = None,
+) -> int:
+    """
+    walk root, reusing the recorded listing of every directory whose mtime is unchanged.
+    a directory's mtime only changes when its own entries change, so unchanged
+    directories are stat'ed but not listed again. only changed records are written.
+    subtree limits the walk to one directory under root.
+
+    whole-volume walks checkpoint every CHECKPOINT_DIRS listed directories or
+    CHECKPOINT_SECONDS, writing the records so far along with the directories
+    still to list. an interrupted walk picks up from that frontier on the next run.
+
+    directories that exist but can't be read keep their recorded listing and stay on
+    the frontier to be retried, nothing under them is dropped. raises OSError, before
+    touching the index, when root (or subtree, unless it is gone) can't be listed.
+    returns the number of directories that had to be listed.
+    """
+    stats = stats or walker.WalkStats()
+    volume = str(root)
+    start = str(subtree) if subtree else volume
+    checkpoints = subtree is None
+    try:
+        with os.scandir(start):
+            pass
+    except OSError as e:
+        # a subtree that was deleted is walked, so its records are dropped
+        if subtree is None or not isinstance(e, (FileNotFoundError, NotADirectoryError)):
+            logging.error(f"Can't read {start}, not refreshing its index: {e}")
+            raise
+    frontier, was_rebuild = store.load_frontier(volume) if checkpoints else ([], False)
+    resuming = bool(frontier) and (was_rebuild or not rebuild)
+    if resuming and not any(map(readable, frontier)):
+        # only directories left unreadable by an earlier walk, which a full walk retries anyway
+        logging.warning(f"{len(frontier)} directories under {volume} are still unreadable, walking the whole volume")
+        resuming = rebuild = False
+    with stats.phase("load"):
+        if rebuild and not resuming:
+            store.clear(volume)
+        previous = store.load_dirs(volume, under=str(subtree) if subtree else None)
+    if resuming:
+        rebuild = was_rebuild
+        logging.info(f"Resuming interrupted walk of {volume} from {len(frontier)} directories")
+
+    pending = set(frontier) if resuming else {start}
+    listed_count = 0
+    batch = {}
+    seen = set()
+    unreadable = []
+    last_checkpoint = time.monotonic()
+    walk = walker.walk(start, package_id.is_package, previous, stats=stats, starts=pending.copy(), unreadable=unreadable)
+    for path, record, listed in walk:
+        seen.add(path)
+        pending.discard(path)
+        pending.update(os.path.join(path, subdir) for subdir in record["subdirs"])
+        if listed and record != previous.get(path):
+            batch[path] = record
+        if checkpoints and (
+            len(batch) >= CHECKPOINT_DIRS or time.monotonic() - last_checkpoint >= CHECKPOINT_SECONDS
+        ):
+            with stats.phase("write"):
+                store.apply_dirs(volume, previous, batch, [], frontier=pending, rebuild=rebuild)
+            listed_count += len(batch)
+            batch = {}
+            last_checkpoint = time.monotonic()
+
+    with stats.phase("write"):
+        # a resumed walk never saw the directories finished before the interruption,
+        # so vanished ones are left for the next full walk to drop
+        removed = [] if resuming else [path for path in previous if path not in seen]
+        if unreadable:
+            logging.warning(f"Couldn't read {len(unreadable)} directories under {start}, keeping them to retry")
+            removed = [path for path in removed if not under_any(path, unreadable)]
+        if not checkpoints:
+            frontier = None
+        elif unreadable:
+            frontier = sorted(unreadable)
+        else:
+            frontier = []
+        store.apply_dirs(volume, previous, batch, removed, frontier=frontier, rebuild=rebuild)
+    listed_count += len(batch)
+    logging.info(
+        f"Listed {listed_count} changed and removed {len(removed)} of {len(seen)} directories under {start}"
+    )
+    logging.info(f"Indexed {start}: {stats.report()}")
+    return listed_count
+
+
+def readable(path: str) -> bool:
+    try:
+        with os.scandir(path):
+            return True
+    except OSError:
+        return False
+
+
+def under_any(path: str, dirs: Iterable[str]) -> bool:
+    return any(path == d or path.startswith(d + os.sep) for d in dirs)
+
+
+def stat_mtimes(paths: list[str]) -> list[tuple[str, int | None]]:
+    """mtime of each path, None when it is gone or no longer a directory"""
+    results = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            results.append((path, st.st_mtime_ns if stat.S_ISDIR(st.st_mode) else None))
+        except OSError:
+            results.append((path, None))
+    return results
+
+
+def nearest_existing(path: str, root: str, mtimes: dict) -> str:
+    while path != root and len(path) > len(root):
+        if mtimes.get(path) is not None or (path not in mtimes and os.path.isdir(path)):
+            return path
+        path = os.path.dirname(path)
+    return root
+
+
+def validate(store: IndexStore, root: Path, names: Iterable[str], num_threads: int = walker.NUM_THREADS) -> int:
+    """
+    check the cached paths of the given names without walking the volume.
+    every cached package dir and its parent is stat'ed in parallel batches; missing
+    packages and parents whose mtime no longer matches the index are re-walked,
+    one subtree each. a name whose every cached path is gone after those re-walks has
+    moved out of its old folders, so the whole volume is refreshed to find it again.
+    returns the number of subtrees re-walked, the volume counting as one.
+    """
+    root = str(root)
+    cached = store.get_many(names)
+    paths = [path for path_list in cached.values() for path in path_list]
+    parents = sorted({os.path.dirname(path) for path in paths})
+    recorded = store.get_dir_mtimes(parents)
+
+    mtimes = {}
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        for results in executor.map(stat_mtimes, batched(paths + parents, VALIDATE_BATCH)):
+            mtimes.update(results)
+
+    stale = {os.path.dirname(path) for path in paths if mtimes[path] is None}
+    stale.update(parent for parent in parents if mtimes[parent] != recorded.get(parent))
+    logging.info(f"Validated {len(paths)} cached paths, {len(stale)} directories are out of date")
+
+    # re-walk from the closest directory that still exists, skipping nested subtrees
+    subtrees = sorted({nearest_existing(path, root, mtimes) for path in stale})
+    walked = []
+    for subtree in subtrees:
+        if under_any(subtree, walked):
+            continue
+        refresh(store, Path(root), subtree=Path(subtree))
+        walked.append(subtree)
+
+    lost = set(cached) - set(store.get_many(cached)) if walked else set()
+    if lost and root not in walked:
+        logging.info(f"{len(lost)} packages left their cached folders, refreshing {root} to find them")
+        refresh(store, Path(root))
+        walked = [root]
+    return len(walked)
+
+
+def open_index(
+    root: Path,
+    rebuild: bool = False,
+    refresh_index: bool = True,
+    index_file: Path | None = None,
+    validate_names: Iterable[str] | None = None,
+) -> IndexStore:
+    """
+    open the package index for root, refreshing it incrementally first.
+    a missing index is always built, as is one that never walked root, e.g. a store
+    package_size opened first for its size records. rebuild ignores the recorded directories.
+    validate_names skips the full refresh and only checks the cached paths of those names.
+    """
+    root = Path(root)
+    index_file = index_file or index_path(root)
+
+    store = IndexStore(index_file)
+    if rebuild or not store.walked(str(root)):
+        logging.info(f"Building index for {root} at {index_file}")
+        refresh(store, root, rebuild=True)
+    elif validate_names is not None:
+        logging.info(f"Validating cached index entries for {root} from {index_file}")
+        validate(store, root, validate_names)
+    elif refresh_index:
+        logging.info(f"Refreshing index for {root} from {index_file}")
+        refresh(store, root)
+    else:
+        logging.info(f"Using cached index for {root} from {index_file}")
+    return store
+
+
+def compact_path(index_file: Path) -> Path:
+    return Path(index_file).with_suffix(".pidx")
+
+
+def bloom_path(index_file: Path) -> Path:
+    return Path(index_file).with_suffix(".bloom")
+
+
+def load_bloom(root: Path, index_file: Path | None = None) -> BloomFilter | None:
+    """
+    the Bloom filter of root's package names, without refreshing the index.
+    None if there is none or the store has changed since it was written, e.g. by the
+    index daemon, which keeps the store current but doesn't rewrite the filter
+    """
+    index_file = index_file or index_path(root)
+    names = BloomFilter.read(bloom_path(index_file))
+    if names is None or names.generation != index_store.read_generation(index_file):
+        return None
+    return names
+
+
+def load_index(
+    root: Path,
+    rebuild: bool = False,
+    refresh_index: bool = True,
+    index_file: Path | None = None,
+    validate_names: Iterable[str] | None = None,
+) -> CompactIndex:
+    """
+    open the memory-mapped snapshot of root's index for lookups.
+    the snapshot is rewritten from the SQLite store whenever the store has changed
+    since it was written, so readers never decode more than the names they ask for.
+    a Bloom filter of the names is written alongside it for ruling out misses
+    """
+    root = Path(root)
+    index_file = index_file or index_path(root)
+    snapshot = compact_path(index_file)
+
+    with open_index(root, rebuild, refresh_index, index_file, validate_names) as store:
+        generation = store.generation()
+        if compact.read_generation(snapshot) != generation:
+            logging.info(f"Writing index snapshot to {snapshot}")
+            compact.write_compact(snapshot, store.items(), generation)
+        bloom_file = bloom_path(index_file)
+        if bloom.read_generation(bloom_file) != generation:
+            names = (name for name, _ in store.items())
+            BloomFilter.from_names(names, store.count(), generation=generation).write(bloom_file)
+    return CompactIndex(snapshot)
@@ -0,0 +1,170 @@
+import logging
+import os
+import queue
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+# directory listing is network-bound on SMB/NFS mounts, not CPU-bound
+NUM_THREADS = min(32, (os.cpu_count() or 1) * 4)
+
+
+class WalkStats:
+    """
+    counters for one indexing run. walk() updates them from the thread consuming
+    results, so the listing threads never contend on them
+    """
+
+    def __init__(self):
+        self.dirs = 0
+        self.listed = 0
+        self.reused = 0
+        self.stat_calls = 0
+        self.packages = 0
+        self.unreadable = 0
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.monotonic() - start
+
+    def add(self, record: dict | None, listed: bool, statted: bool = True):
+        # cached walks stat every directory they are handed, even ones that disappeared
+        self.stat_calls += statted
+        if record is None:
+            return
+        self.dirs += 1
+        self.listed += listed
+        self.reused += not listed
+        self.packages += len(record["packages"])
+
+    def dirs_per_sec(self) -> float:
+        elapsed = self.phases.get("walk", 0)
+        return self.dirs / elapsed if elapsed else 0.0
+
+    def report(self) -> str:
+        phases = ", ".join(f"{name} {elapsed:.2f}s" for name, elapsed in self.phases.items())
+        return (
+            f"{self.dirs} dirs ({self.listed} listed, {self.reused} reused), {self.packages} packages, "
+            f"{self.stat_calls} stat calls, {self.unreadable} unreadable, {self.dirs_per_sec():.0f} dirs/sec; {phases}"
+        )
+
+
+def scan_dir(path: str, mtime: int | None, is_package: Callable[[str], bool]) -> dict:
+    """
+    list a single directory, splitting children into packages and dirs to descend.
+    DirEntry.is_dir uses the d_type returned by scandir, so no extra stat per entry
+    """
+    subdirs = []
+    packages = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            if is_package(entry.name):
+                packages.append(entry.name)
+            else:
+                subdirs.append(entry.name)
+    return {"mtime": mtime, "subdirs": sorted(subdirs), "packages": sorted(packages)}
+
+
+def list_dir(
+    path: str, is_package: Callable[[str], bool], previous: dict | None
+) -> tuple[str, dict | None, bool, bool]:
+    """
+    return (path, record, listed, unreadable) for one directory.
+    the recorded listing is reused when the directory's mtime is unchanged.
+    with previous None nothing can be reused, so the stat is skipped and the record's mtime is None.
+    record is None when the directory is gone, or when it could not be read
+    (I/O errors, an unmounted share), which unreadable tells apart
+    """
+    try:
+        if previous is None:
+            return path, scan_dir(path, None, is_package), True, False
+        mtime = os.stat(path).st_mtime_ns
+        record = previous.get(path) if previous else None
+        if record is not None and record["mtime"] == mtime:
+            return path, record, False, False
+        return path, scan_dir(path, mtime, is_package), True, False
+    except (FileNotFoundError, NotADirectoryError):
+        return path, None, False, False
+    except OSError as e:
+        logging.warning(f"Skipping unreadable directory {path}: {e}")
+        return path, None, False, True
+
+
+def walk(
+    root: Path,
+    is_package: Callable[[str], bool],
+    previous: dict | None = None,
+    num_threads: int = NUM_THREADS,
+    stats: WalkStats | None = None,
+    starts: Iterable[str] | None = None,
+    unreadable: list[str] | None = None,
+) -> Iterator[tuple[str, dict, bool]]:
+    """
+    walk root with a pool of threads listing directories concurrently.
+    packages are recorded but never descended into.
+    previous, the records of an earlier walk, makes it a cached walk: every directory is
+    stat'ed and its record reused when its mtime is unchanged. pass {} to record mtimes
+    without reusing anything.
+    starts replaces root with several directories to walk from, e.g. to resume a walk.
+    directories that exist but could not be read are appended to unreadable.
+    yields (path, record, listed) for every directory, in no particular order
+    """
+    stats = stats or WalkStats()
+    results = queue.Queue()
+    executor = ThreadPoolExecutor(max_workers=num_threads)
+
+    def submit(path: str):
+        future = executor.submit(list_dir, path, is_package, previous)
+        future.add_done_callback(results.put)
+
+    start = time.monotonic()
+    try:
+        outstanding = 0
+        for start_dir in starts if starts is not None else [str(root)]:
+            submit(start_dir)
+            outstanding += 1
+        while outstanding:
+            path, record, listed, failed = results.get().result()
+            outstanding -= 1
+            stats.add(record, listed, previous is not None)
+            if failed:
+                stats.unreadable += 1
+                if unreadable is not None:
+                    unreadable.append(path)
+            if record is None:
+                continue
+            for subdir in record["subdirs"]:
+                submit(os.path.join(path, subdir))
+                outstanding += 1
+            yield path, record, listed
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        # includes time the caller spends between results, as the walk is paced by them
+        stats.phases["walk"] = stats.phases.get("walk", 0) + time.monotonic() - start
+
+
+def find_packages(
+    root: Path,
+    is_package: Callable[[str], bool],
+    num_threads: int = NUM_THREADS,
+    stats: WalkStats | None = None,
+) -> dict[str, list[str]]:
+    """uncached walk returning {package name: [paths]}"""
+    stats = stats or WalkStats()
+    index = {}
+    for path, record, _ in walk(root, is_package, num_threads=num_threads, stats=stats):
+        for name in record["packages"]:
+            index.setdefault(name, []).append(os.path.join(path, name))
+    for paths in index.values():
+        paths.sort()
+    logging.info(f"Walked {root}: {stats.report()}")
+    return index
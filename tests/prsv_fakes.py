@@ -0,0 +1,84 @@
+"""stand-ins for PreservicaClient shared by the Preservica tests"""
+
+import json
+import threading
+
+import requests
+
+UUID = "00000000-0000-0000-0000-{:012d}"
+
+
+def make_response(status: int, body: str = "{}") -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response._content = body.encode()
+    return response
+
+
+class FakeClient:
+    """
+    answers search-within pages over a fixed list of (uuid, title, parent) objects,
+    optionally followed by their identifiers, and starts parent-ref moves. titles are
+    matched when the query asks for them, objects are within a hierarchy when it is
+    their direct parent
+    """
+
+    def __init__(self, objects, failing_titles=(), failing_moves=None):
+        self.objects = objects
+        self.failing_titles = set(failing_titles)
+        # uuid -> a status code to answer its move with, or an exception to raise
+        self.failing_moves = failing_moves or {}
+        self.queries = []
+        self.starts = []
+        self.moved = []
+        self.lock = threading.Lock()
+
+    def get(self, path, params, headers):
+        query = json.loads(params["q"])
+        titles = None
+        for field in query.get("fields") or []:
+            if field["name"] == "xip.title":
+                titles = set(field["values"])
+        with self.lock:
+            self.queries.append(sorted(titles or []))
+            self.starts.append(params["start"])
+        if titles and titles & self.failing_titles:
+            raise requests.exceptions.ConnectionError("reset")
+
+        matches = [
+            obj
+            for obj in self.objects
+            if (titles is None or obj[1] in titles) and obj[2] == params["parenthierarchy"]
+        ]
+        page = matches[params["start"] : params["start"] + params["max"]]
+        wanted = params["metadata"].split(",")
+        metadata = []
+        for obj in page:
+            fields = []
+            if "xip.title" in wanted:
+                fields.append({"name": "xip.title", "value": obj[1]})
+            if "xip.parent_ref" in wanted:
+                fields.append({"name": "xip.parent_ref", "value": obj[2]})
+            if "xip.identifier" in wanted and len(obj) > 3:
+                fields.append({"name": "xip.identifier", "value": obj[3]})
+            metadata.append(fields)
+        body = {
+            "success": True,
+            "value": {
+                "objectIds": [f"sdb:SO|{obj[0]}" for obj in page],
+                "metadata": metadata,
+                "totalHits": len(matches),
+            },
+        }
+        return make_response(200, json.dumps(body))
+
+    def put(self, path, headers, data, retry=None):
+        uuid = path.split("/")[2]
+        failure = self.failing_moves.get(uuid)
+        if isinstance(failure, Exception):
+            raise failure
+        if failure:
+            return make_response(failure, "error")
+        with self.lock:
+            self.moved.append((uuid, data))
+        return make_response(202, f"token-{uuid[-2:]}")
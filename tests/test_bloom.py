@@ -0,0 +1,40 @@
+from repair_tools.bloom import BloomFilter, read_generation
+
+
+def test_no_false_negatives():
+    """test every added name is reported as possibly present"""
+    names = [f"{i:06d}" for i in range(5000)]
+    bloom = BloomFilter.from_names(names, len(names))
+
+    assert all(name in bloom for name in names)
+
+
+def test_false_positive_rate():
+    """test misses are ruled out at roughly the configured rate"""
+    bloom = BloomFilter.from_names((f"{i:06d}" for i in range(10000)), 10000, error_rate=0.01)
+    false_positives = sum(f"M{i}_ER_1" in bloom for i in range(10000))
+
+    assert false_positives < 300
+    assert len(bloom.bits) < 10000 * 10 / 8 * 1.1
+
+
+def test_roundtrip(tmp_path):
+    """test a written filter reads back the same"""
+    bloom = BloomFilter.from_names(["123456"], 1, generation=3)
+    bloom.write(tmp_path / "index.bloom")
+
+    loaded = BloomFilter.read(tmp_path / "index.bloom")
+    assert loaded.generation == 3
+    assert "123456" in loaded
+    assert BloomFilter.read(tmp_path / "missing.bloom") is None
+
+
+def test_truncated_filter_is_not_used(tmp_path):
+    """test a filter shorter than its header says reads as missing"""
+    bloom = BloomFilter.from_names(["123456"], 1000, generation=3)
+    bloom.write(tmp_path / "index.bloom")
+    (tmp_path / "index.bloom").write_bytes((tmp_path / "index.bloom").read_bytes()[:-1])
+
+    assert BloomFilter.read(tmp_path / "index.bloom") is None
+    assert read_generation(tmp_path / "index.bloom") is None
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,113 @@
+import pytest
+
+from repair_tools import compact_index, volume_index
+from repair_tools.compact_index import CompactIndex
+
+ITEMS = [
+    ("123456", "/Volumes/one/a/123456"),
+    ("123456", "/Volumes/one/b/123456"),
+    ("234567", "/Volumes/one/a/234567"),
+    ("M1234_ER_5", "/Volumes/one/digarch/M1234_ER_5"),
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    """writes and opens a small snapshot"""
+    compact_index.write_compact(tmp_path / "index.pidx", ITEMS, generation=7)
+    with CompactIndex(tmp_path / "index.pidx") as index:
+        yield index
+
+
+def test_roundtrip(index):
+    """test every item comes back in sorted order"""
+    assert list(index.items()) == ITEMS
+    assert len(index) == 4
+    assert index.generation == 7
+
+
+def test_lookups(index):
+    """test point and batch lookups"""
+    assert index.get("123456") == ["/Volumes/one/a/123456", "/Volumes/one/b/123456"]
+    assert index.get("000000") == []
+    assert "M1234_ER_5" in index
+    assert "999999" not in index
+    assert index.get_many(["M1234_ER_5", "000000", "234567"]) == {
+        "234567": ["/Volumes/one/a/234567"],
+        "M1234_ER_5": ["/Volumes/one/digarch/M1234_ER_5"],
+    }
+
+
+def test_prefixes_are_interned(tmp_path):
+    """test a shared parent directory is only stored once"""
+    items = [(f"{i:06d}", f"/Volumes/one/a_long_parent_directory/{i:06d}") for i in range(1000)]
+    compact_index.write_compact(tmp_path / "index.pidx", items)
+
+    size = (tmp_path / "index.pidx").stat().st_size
+    assert size < sum(len(path) for _, path in items) / 2
+
+
+def test_empty_index(tmp_path):
+    """test an empty snapshot can be opened and queried"""
+    compact_index.write_compact(tmp_path / "index.pidx", [])
+    with CompactIndex(tmp_path / "index.pidx") as index:
+        assert len(index) == 0
+        assert index.get("123456") == []
+
+
+def test_truncated_snapshot_is_not_used(tmp_path):
+    """test a snapshot shorter than its header says is treated as missing and rewritten"""
+    root = tmp_path / "volume"
+    (root / "folder_A" / "123456").mkdir(parents=True)
+    index_file = tmp_path / "index.sqlite"
+    volume_index.load_index(root, index_file=index_file).close()
+    snapshot = volume_index.compact_path(index_file)
+    data = snapshot.read_bytes()
+    snapshot.write_bytes(data[:-4])
+
+    assert compact_index.read_generation(snapshot) is None
+    with pytest.raises(ValueError):
+        CompactIndex(snapshot)
+    with volume_index.load_index(root, index_file=index_file, refresh_index=False) as index:
+        assert index.get("123456") == [str(root / "folder_A" / "123456")]
+    assert snapshot.read_bytes() == data
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_failed_write_keeps_the_old_file(tmp_path):
+    """test a write that fails part way leaves the previous file and no temp file behind"""
+    target = tmp_path / "shared.bin"
+    with compact_index.atomic_write(target) as f:
+        f.write(b"old")
+    assert target.stat().st_mode & 0o777 == 0o644
+
+    with pytest.raises(RuntimeError):
+        with compact_index.atomic_write(target) as f:
+            f.write(b"partial")
+            raise RuntimeError("disk full")
+
+    assert target.read_bytes() == b"old"
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_load_index_rewrites_stale_snapshot(tmp_path):
+    """test the snapshot follows changes to the volume"""
+    root = tmp_path / "volume"
+    (root / "folder_A" / "123456").mkdir(parents=True)
+    index_file = tmp_path / "index.sqlite"
+
+    with volume_index.load_index(root, index_file=index_file) as index:
+        assert index.get("123456") == [str(root / "folder_A" / "123456")]
+
+    (root / "folder_A" / "222222").mkdir()
+    with volume_index.load_index(root, index_file=index_file) as index:
+        assert "222222" in index
+
+
+def test_sorted_queries(index):
+    """test prefix, range and glob queries only return matching names"""
+    assert [name for name, _ in index.prefix("12")] == ["123456", "123456"]
+    assert [name for name, _ in index.range("200000", "299999")] == ["234567"]
+    assert list(index.range("300000", "399999")) == []
+    assert list(index.glob("M1234_*")) == [("M1234_ER_5", "/Volumes/one/digarch/M1234_ER_5")]
+    assert [name for name, _ in index.glob("*45*")] == ["123456", "123456", "234567"]
@@ -0,0 +1,83 @@
+import logging
+import threading
+import time
+
+from repair_tools import compare_sources
+
+
+def test_check_batches():
+    """test batches hold one kind of package, DigArch from a single collection"""
+    pkg_ids = ["M2_ER_1", "123456", "M1_DI_1", "M1_ER_2", "234567"]
+
+    assert compare_sources.check_batches(pkg_ids) == [["123456", "234567"], ["M1_DI_1", "M1_ER_2"], ["M2_ER_1"]]
+
+
+def test_check_preservica_runs_concurrently(mocker):
+    """test batches overlap up to the concurrency limit and errors are kept apart"""
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def check(client, pkg_ids, digarch_uuid, ami_uuid, cache=None):
+        with lock:
+            in_flight.append(pkg_ids)
+            peak.append(len(in_flight))
+        time.sleep(0.05)
+        with lock:
+            in_flight.remove(pkg_ids)
+        if pkg_ids[0].startswith("M1_"):
+            raise ConnectionError("reset")
+        return {pkg_id: ["uuid"] if pkg_id == "123456" else [] for pkg_id in pkg_ids}
+
+    mocker.patch.object(compare_sources, "check_batch", side_effect=check)
+    pkg_ids = ["123456", "M1_ER_1"] + [f"M{i}_ER_1" for i in range(2, 10)]
+
+    found, errors = compare_sources.check_preservica(None, pkg_ids, "digarch", "ami", 4, logging.getLogger())
+
+    assert max(peak) == 4
+    assert found["123456"] == ["uuid"]
+    assert len(found) == 9
+    assert list(errors) == ["M1_ER_1"]
+
+
+def test_ami_packages_are_unchecked_without_an_ami_folder(mocker):
+    """test AMI batches aren't searched without a parent, they are reported as not checked"""
+    check = mocker.patch.object(compare_sources, "check_batch", return_value={"M1_ER_1": []})
+
+    found, errors = compare_sources.check_preservica(None, ["123456", "M1_ER_1"], "digarch", None, 4, logging.getLogger())
+
+    assert [c.args[1] for c in check.call_args_list] == [["M1_ER_1"]]
+    assert found == {"M1_ER_1": []}
+    assert errors == {"123456": compare_sources.NO_AMI_FOLDER}
+
+
+def test_source_duplicates_are_only_compared_when_asked(tmp_path, monkeypatch, mocker):
+    """test copies are fingerprinted on request, and names whose copies differ are left out"""
+    monkeypatch.setattr(compare_sources.volume_index, "INDEX_DIR", tmp_path / "index")
+    source = tmp_path / "source"
+    # 123456 has three identical copies, one copy of 234567 has another manifest
+    for folder, manifest in (("a", "abc"), ("b", "abc"), ("c", "def")):
+        for name, text in (("123456", "abc"), ("234567", manifest)):
+            (source / folder / name).mkdir(parents=True)
+            (source / folder / name / "manifest-md5.txt").write_text(text)
+    logger = logging.getLogger("test")
+    spy = mocker.spy(compare_sources.duplicates, "find_duplicates")
+
+    index = compare_sources.find_source_index(source, logger)
+    assert spy.call_count == 0
+    assert index == {"123456": source / "a" / "123456", "234567": source / "a" / "234567"}
+
+    index = compare_sources.find_source_index(source, logger, check_duplicates=True)
+    assert spy.call_count == 1
+    assert index == {"123456": source / "a" / "123456"}
+
+
+def test_both_source_indexes_pick_the_same_copy(tmp_path, monkeypatch):
+    """test the cached and the uncached source index use the same copy of a duplicated package"""
+    monkeypatch.setattr(compare_sources.volume_index, "INDEX_DIR", tmp_path / "index")
+    source = tmp_path / "source"
+    for folder in ("b", "a", "c"):
+        (source / folder / "123456").mkdir(parents=True)
+
+    cached = compare_sources.find_source_index(source, logging.getLogger("test"))
+    assert cached == compare_sources.get_source_index(source) == {"123456": source / "a" / "123456"}
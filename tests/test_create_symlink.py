@@ -131,4 +131,15 @@ def test_main_flow(mocker):
     mock_log_info.assert_any_call("Finding AMI packages:")
     mock_get_dirs.assert_called_once_with("fake/source")
     mock_log_info.assert_any_call("Found 2 total directories.")
-    mock_create_sym.assert_called_once_with(["dir1", "dir2"], "fake/target")
\ No newline at end of file
+    mock_create_sym.assert_called_once_with(["dir1", "dir2"], "fake/target")
+
+def test_malformed_range_is_a_usage_error(setup_test_dirs, monkeypatch, capsys):
+    """test an AMI ID range whose ends aren't full IDs is reported by argparse"""
+    source_dir, target_dir = setup_test_dirs
+    argv = ["create_symlink", "-s", str(source_dir), "-t", str(target_dir), "-ami", "12300-123999"]
+    monkeypatch.setattr("sys.argv", argv)
+
+    with pytest.raises(SystemExit) as exit_info:
+        create_symlink.parse_args()
+    assert exit_info.value.code == 2
+    assert "full 6-digit IDs" in capsys.readouterr().err
@@ -0,0 +1,46 @@
+from repair_tools import duplicates
+
+
+def make_package(path, manifest: str, payload: bytes = b"data"):
+    (path / "data").mkdir(parents=True)
+    (path / "data" / "file.mkv").write_bytes(payload)
+    (path / "manifest-md5.txt").write_text(manifest)
+
+
+def test_fingerprint(tmp_path):
+    """test files are counted and the manifest is hashed"""
+    make_package(tmp_path / "123456", "abc  data/file.mkv\n")
+    print_ = duplicates.fingerprint(tmp_path / "123456")
+
+    assert print_.file_count == 2
+    assert print_.total_bytes == len(b"data") + len("abc  data/file.mkv\n")
+    assert print_.manifest_md5 is not None
+
+
+def test_find_duplicates(tmp_path):
+    """test identical copies share a group and divergent copies do not"""
+    make_package(tmp_path / "a" / "123456", "abc  data/file.mkv\n")
+    make_package(tmp_path / "b" / "123456", "abc  data/file.mkv\n")
+    make_package(tmp_path / "a" / "234567", "abc  data/file.mkv\n")
+    make_package(tmp_path / "b" / "234567", "def  data/file.mkv\n")
+    found = {
+        "123456": [tmp_path / "a" / "123456", tmp_path / "b" / "123456"],
+        "234567": [tmp_path / "a" / "234567", tmp_path / "b" / "234567"],
+        "345678": [tmp_path / "a" / "345678"],
+    }
+
+    groups = duplicates.find_duplicates(found)
+
+    assert set(groups) == {"123456", "234567"}
+    assert list(groups["123456"].values()) == [found["123456"]]
+    assert len(groups["234567"]) == 2
+
+
+def test_missing_copy_is_left_out(tmp_path):
+    """test a copy that disappeared does not stop the others being grouped"""
+    make_package(tmp_path / "a" / "123456", "abc  data/file.mkv\n")
+    found = {"123456": [tmp_path / "a" / "123456", tmp_path / "b" / "123456"]}
+
+    groups = duplicates.find_duplicates(found)
+
+    assert list(groups["123456"].values()) == [[tmp_path / "a" / "123456"]]
@@ -0,0 +1,12 @@
+from repair_tools import index_benchmark
+
+
+def test_benchmark(tmp_path):
+    """test every indexer finds every generated package"""
+    root = tmp_path / "volume"
+    dirs = index_benchmark.make_tree(root, ami=50, digarch=20, depth=2, fanout=3)
+    results = index_benchmark.benchmark(root, tmp_path / "index.sqlite", num_threads=2)
+
+    assert {r.packages for r in results} == {70}
+    assert all(r.stats.dirs == dirs for r in results if r.stats)
+    assert results[-1].stats.listed == 0
@@ -0,0 +1,111 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from repair_tools import index_daemon
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    """runs a daemon watching a small volume"""
+    root = tmp_path / "volume"
+    (root / "folder_A" / "123456").mkdir(parents=True)
+    daemon = index_daemon.IndexDaemon(
+        [root], socket_path=tmp_path / "index.sock", index_dir=tmp_path / "index"
+    )
+    daemon.start()
+    server = threading.Thread(target=daemon.serve_forever, daemon=True)
+    server.start()
+    yield daemon, root
+    daemon.shutdown()
+
+
+def wait_for(check, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_lookup(daemon):
+    """test lookups are answered over the socket"""
+    daemon, root = daemon
+    found = index_daemon.lookup(root, ["123456", "000000"], daemon.socket_path)
+
+    assert found == {"123456": [str(root / "folder_A" / "123456")]}
+
+
+def test_lookup_sees_new_packages(daemon):
+    """test changes on the volume reach the index without a rebuild"""
+    daemon, root = daemon
+    (root / "folder_A" / "nested").mkdir()
+    (root / "folder_A" / "nested" / "222222").mkdir()
+
+    assert wait_for(lambda: index_daemon.lookup(root, ["222222"], daemon.socket_path))
+
+
+def test_lookup_falls_back_for_unknown_volume(daemon, tmp_path):
+    """test None is returned for volumes the daemon doesn't watch"""
+    daemon, _ = daemon
+    assert index_daemon.lookup(tmp_path / "other", ["123456"], daemon.socket_path) is None
+
+
+def test_lookup_without_daemon(tmp_path):
+    """test None is returned when no daemon is listening"""
+    assert index_daemon.lookup(tmp_path, ["123456"], tmp_path / "missing.sock") is None
+
+
+def test_collapse():
+    """test nested paths are folded into their ancestors"""
+    paths = ["/v/a/b", "/v/a", "/v/ab", "/v/c/d"]
+    assert index_daemon.collapse(paths) == ["/v/a", "/v/ab", "/v/c/d"]
+
+
+def test_second_daemon_refuses_live_socket(daemon, tmp_path):
+    """test a daemon won't take over the socket of one that is still answering"""
+    daemon, root = daemon
+    other = index_daemon.IndexDaemon([root], socket_path=daemon.socket_path, index_dir=tmp_path / "other")
+
+    with pytest.raises(RuntimeError):
+        other.start()
+    assert index_daemon.lookup(root, ["123456"], daemon.socket_path) == {"123456": [str(root / "folder_A" / "123456")]}
+
+
+def test_stale_socket_is_replaced(tmp_path):
+    """test a socket left behind by a daemon that died is cleaned up on start"""
+    root = tmp_path / "volume"
+    (root / "folder_A" / "123456").mkdir(parents=True)
+    socket_path = tmp_path / "index.sock"
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(socket_path))
+    stale.close()
+
+    daemon = index_daemon.IndexDaemon([root], socket_path=socket_path, index_dir=tmp_path / "index")
+    daemon.start()
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    try:
+        assert index_daemon.lookup(root, ["123456"], socket_path) == {"123456": [str(root / "folder_A" / "123456")]}
+    finally:
+        daemon.shutdown()
+
+
+def test_new_dirs_are_watched_without_reloading_the_volume(daemon, mocker):
+    """test directories created under a changed subtree get watches from that subtree's records alone"""
+    daemon, root = daemon
+    (root / "folder_A" / "111111").mkdir()
+    assert wait_for(lambda: index_daemon.lookup(root, ["111111"], daemon.socket_path))
+
+    load_dirs = mocker.spy(index_daemon.IndexStore, "load_dirs")
+    deeper = root / "folder_A" / "nested" / "deeper"
+    deeper.mkdir(parents=True)
+    # once for the refresh of folder_A and once for the watches that follow it
+    assert wait_for(lambda: sum(c.kwargs.get("under") == str(root / "folder_A") for c in load_dirs.call_args_list) >= 2)
+
+    # only seen if deeper was watched after the refresh of folder_A
+    (deeper / "333333").mkdir()
+    assert wait_for(lambda: index_daemon.lookup(root, ["333333"], daemon.socket_path))
+    assert all(c.kwargs.get("under") for c in load_dirs.call_args_list)
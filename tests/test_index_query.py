@@ -0,0 +1,123 @@
+import argparse
+import sys
+
+import pytest
+
+from repair_tools import duplicates, index_query, volume_index, walker
+from repair_tools.index_query import Location
+
+
+@pytest.fixture
+def volumes(tmp_path, monkeypatch):
+    """creates two volumes sharing one package, with shards in a temp dir"""
+    monkeypatch.setattr(volume_index, "INDEX_DIR", tmp_path / "index")
+
+    one = tmp_path / "one"
+    two = tmp_path / "two"
+    (one / "a" / "123456").mkdir(parents=True)
+    (one / "a" / "M1234_ER_5").mkdir(parents=True)
+    (two / "b" / "123456").mkdir(parents=True)
+    (two / "b" / "234567").mkdir(parents=True)
+    return one, two
+
+
+def test_lookup_reports_every_location(volumes):
+    """test a package on two volumes is reported at both"""
+    one, two = volumes
+    found = index_query.lookup([one, two], ["123456", "234567", "000000"])
+
+    assert found == {
+        "123456": [
+            Location(str(one), str(one / "a" / "123456")),
+            Location(str(two), str(two / "b" / "123456")),
+        ],
+        "234567": [Location(str(two), str(two / "b" / "234567"))],
+    }
+
+
+def test_items_are_merged_in_name_order(volumes):
+    """test streaming every shard yields one sorted listing"""
+    one, two = volumes
+    with index_query.load_shards([one, two]) as index:
+        names = [name for name, _ in index.items()]
+
+    assert names == ["123456", "123456", "234567", "M1234_ER_5"]
+
+
+def test_adding_a_volume_keeps_other_shards(volumes, tmp_path, mocker):
+    """test existing shards are refreshed, not rebuilt, when a volume is added"""
+    one, two = volumes
+    index_query.load_shards([one]).close()
+    spy = mocker.spy(walker, "scan_dir")
+
+    with index_query.load_shards([one, two], refresh_index=True) as index:
+        assert "234567" in index
+
+    listed = {c.args[0] for c in spy.call_args_list}
+    assert not any(path.startswith(str(one)) for path in listed)
+
+
+def test_search(volumes):
+    """test ID queries are merged across shards"""
+    one, two = volumes
+    with index_query.load_shards([one, two]) as index:
+        assert [name for name, _ in index_query.search(index, "123000-234999")] == ["123456", "123456", "234567"]
+        assert [name for name, _ in index_query.search(index, "M1234_*")] == ["M1234_ER_5"]
+        assert [loc.volume for _, loc in index_query.search(index, "234567")] == [str(two)]
+        for short_range in ("1-99", "123-125", "1-2", "12300-12399"):
+            with pytest.raises(ValueError):
+                index_query.search(index, short_range)
+
+
+def test_bloom_rules_out_volumes(volumes, mocker):
+    """test a cached lookup skips volumes whose filter rules out every name"""
+    one, two = volumes
+    index_query.load_shards([one, two]).close()
+    spy = mocker.spy(volume_index, "load_index")
+
+    found = index_query.lookup([one, two], ["234567"], refresh_index=False)
+
+    assert list(found) == ["234567"]
+    assert [c.args[0] for c in spy.call_args_list] == [two]
+
+
+def test_bloom_is_ignored_once_the_store_changes(volumes):
+    """test packages written to the store after the filter, e.g. by the daemon, are still found"""
+    one, two = volumes
+    index_query.load_shards([one, two]).close()
+    new_path = str(one / "a" / "345678")
+    with volume_index.IndexStore(volume_index.index_path(one)) as store:
+        store.upsert([("345678", str(one), new_path)])
+
+    assert volume_index.load_bloom(one) is None
+    assert volume_index.load_bloom(two) is not None
+    found = index_query.lookup([one, two], ["345678"], refresh_index=False)
+    assert found == {"345678": [Location(str(one), new_path)]}
+
+
+def test_daemon_is_asked_before_the_bloom(volumes, mocker):
+    """test a watched volume's answer isn't ruled out by a filter written before the daemon indexed it"""
+    one, two = volumes
+    index_query.load_shards([one]).close()
+    new_path = str(one / "a" / "345678")
+    mocker.patch.object(index_query.index_daemon, "lookup", return_value={"345678": [new_path]})
+    spy = mocker.spy(volume_index, "load_bloom")
+
+    found = index_query.lookup([one], ["345678"], refresh_index=False)
+
+    assert found == {"345678": [Location(str(one), new_path)]}
+    spy.assert_not_called()
+
+
+def test_malformed_range_is_a_usage_error(tmp_path, monkeypatch, capsys):
+    """test a range whose ends aren't full IDs is reported by argparse, not as a traceback"""
+    with pytest.raises(argparse.ArgumentTypeError):
+        index_query.query_arg("12300-123999")
+    assert index_query.query_arg("123000-123999") == "123000-123999"
+
+    for module in (index_query, duplicates):
+        monkeypatch.setattr(sys, "argv", [module.__name__, "12300-123999", "--volume", str(tmp_path)])
+        with pytest.raises(SystemExit) as exit_info:
+            module.parse_args()
+        assert exit_info.value.code == 2
+        assert "full 6-digit IDs" in capsys.readouterr().err
@@ -0,0 +1,95 @@
+import sqlite3
+
+import pytest
+
+from repair_tools import index_store
+from repair_tools.index_store import IndexStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    """creates a store with a few packages on two volumes"""
+    with IndexStore(tmp_path / "index.sqlite") as store:
+        store.upsert(
+            [
+                ("123456", "/Volumes/one", "/Volumes/one/a/123456"),
+                ("123456", "/Volumes/two", "/Volumes/two/b/123456"),
+                ("789012", "/Volumes/one", "/Volumes/one/c/789012"),
+            ]
+        )
+        yield store
+
+
+def test_get_returns_every_path(store):
+    """test point lookups return all locations of a name"""
+    assert store.get("123456") == ["/Volumes/one/a/123456", "/Volumes/two/b/123456"]
+    assert store.get("000000") == []
+
+
+def test_get_many_only_returns_found_names(store):
+    """test batch lookups skip names that are not indexed"""
+    names = [f"{i:06d}" for i in range(2000)] + ["789012"]
+    found = store.get_many(names)
+
+    assert found == {"789012": ["/Volumes/one/c/789012"]}
+
+
+def test_upsert_keeps_discovery_time(store):
+    """test re-adding a known row does not reset its discovery time"""
+    query = "SELECT discovered FROM packages WHERE path = '/Volumes/one/c/789012'"
+    first = store.conn.execute(query).fetchone()[0]
+
+    store.upsert([("789012", "/Volumes/one", "/Volumes/one/c/789012")])
+
+    assert store.conn.execute(query).fetchone()[0] == first
+    assert store.count() == 3
+
+
+def test_apply_dirs_syncs_packages(store):
+    """test directory changes add and remove the matching package rows"""
+    previous = {"/Volumes/three/x": {"mtime": 1, "subdirs": [], "packages": ["111111"]}}
+    store.apply_dirs("/Volumes/three", {}, previous, [])
+    assert store.get("111111") == ["/Volumes/three/x/111111"]
+
+    changed = {"/Volumes/three/x": {"mtime": 2, "subdirs": [], "packages": ["222222"]}}
+    store.apply_dirs("/Volumes/three", previous, changed, [])
+    assert "111111" not in store
+    assert store.get("222222") == ["/Volumes/three/x/222222"]
+
+    store.apply_dirs("/Volumes/three", changed, {}, ["/Volumes/three/x"])
+    assert "222222" not in store
+    assert store.load_dirs("/Volumes/three") == {}
+
+
+def test_rows_are_tagged_with_kind(store):
+    """test every row records the package kind and collection"""
+    store.upsert([("M1234_ER_5", "/Volumes/one", "/Volumes/one/d/M1234_ER_5")])
+
+    assert [name for name, _ in store.items(kind="AMI")] == ["123456", "123456", "789012"]
+    assert store.get_collection("M1234") == {"M1234_ER_5": ["/Volumes/one/d/M1234_ER_5"]}
+
+
+def test_old_index_is_migrated(tmp_path):
+    """test an index without kind columns gets them filled in"""
+    db_path = tmp_path / "old.sqlite"
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE packages (name TEXT NOT NULL, volume TEXT NOT NULL, path TEXT NOT NULL, "
+        "discovered REAL NOT NULL, PRIMARY KEY (name, path)) WITHOUT ROWID"
+    )
+    conn.execute("INSERT INTO packages VALUES ('M12_DI_1', '/v', '/v/M12_DI_1', 0)")
+    conn.commit()
+    conn.close()
+
+    with IndexStore(db_path) as store:
+        assert store.get_collection("M12") == {"M12_DI_1": ["/v/M12_DI_1"]}
+
+
+def test_generation_is_read_without_writing(tmp_path, store):
+    """test the generation is read from a read-only connection, and nothing is created for a missing store"""
+    store.upsert([("M1234_ER_6", "/Volumes/one", "/Volumes/one/d/M1234_ER_6")])
+    assert index_store.read_generation(store.db_path) == store.generation()
+
+    missing = tmp_path / "missing" / "index.sqlite"
+    assert index_store.read_generation(missing) is None
+    assert not missing.parent.exists()
@@ -89,3 +89,21 @@ class TestMoveScript(unittest.TestCase):
 
 if __name__ == '__main__':
     unittest.main(argv=['first-arg-is-ignored'], exit=False)
+
+
+def test_unindexed_names_are_walked_for_without_entering_packages(tmp_path, monkeypatch, mocker):
+    """test only names that aren't package IDs start a walk, and the walk skips package payloads"""
+    monkeypatch.setattr(move_reingest.index_query.volume_index, "INDEX_DIR", tmp_path / "index")
+    source = tmp_path / "source"
+    (source / "a" / "123456" / "data" / "odd_name").mkdir(parents=True)
+    (source / "b" / "odd_name").mkdir(parents=True)
+    monkeypatch.setattr(move_reingest, "DIRS_TO_FIND", ["123456", "654321"])
+    walk = mocker.spy(move_reingest.walker, "find_packages")
+
+    # a package ID missing from the index is missing, nothing is walked for it
+    assert move_reingest.get_index([source]) == {"123456": [str(source / "a" / "123456")]}
+    walk.assert_not_called()
+
+    monkeypatch.setattr(move_reingest, "DIRS_TO_FIND", ["odd_name"])
+    assert move_reingest.get_index([source], refresh_index=False) == {"odd_name": [str(source / "b" / "odd_name")]}
+    assert walk.call_count == 1
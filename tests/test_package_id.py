@@ -0,0 +1,34 @@
+import pytest
+
+from repair_tools import package_id
+from repair_tools.package_id import PackageID
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("123456", PackageID("123456", "AMI", None)),
+        ("M1234_ER_5", PackageID("M1234_ER_5", "ER", "M1234")),
+        ("M24468_DI_12", PackageID("M24468_DI_12", "DI", "M24468")),
+        ("M99_EM_1", PackageID("M99_EM_1", "EM", "M99")),
+    ],
+)
+def test_classify_packages(name, expected):
+    """test each package kind is tagged with its type and collection"""
+    assert package_id.classify(name) == expected
+    assert package_id.is_package(name)
+
+
+@pytest.mark.parametrize(
+    "name", ["12345", "1234567", "M1234_XX_5", "M1234_ER_", "x123456", "123456_old", "data"]
+)
+def test_classify_rejects_other_names(name):
+    """test names that only look like packages are not matched"""
+    assert package_id.classify(name) is None
+    assert not package_id.is_package(name)
+
+
+def test_is_ami():
+    """test only six-digit AMI IDs count as AMI"""
+    assert package_id.is_ami("123456")
+    assert not package_id.is_ami("M1234_ER_5")
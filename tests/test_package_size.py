@@ -0,0 +1,61 @@
+import os
+
+from repair_tools import index_query, package_size, volume_index
+from repair_tools.index_store import IndexStore
+from repair_tools.package_size import PackageSize
+
+
+def make_package(path):
+    (path / "data" / "nested").mkdir(parents=True)
+    (path / "data" / "a.mkv").write_bytes(b"x" * 100)
+    (path / "data" / "nested" / "b.mkv").write_bytes(b"x" * 50)
+    (path / "bagit.txt").write_bytes(b"x" * 10)
+
+
+def test_package_sizes(tmp_path):
+    """test files and bytes are summed across every subdirectory"""
+    make_package(tmp_path / "123456")
+    with IndexStore(tmp_path / "index.sqlite") as store:
+        sizes = package_size.package_sizes(store, str(tmp_path), [tmp_path / "123456", tmp_path / "missing"])
+
+    assert sizes == {tmp_path / "123456": PackageSize(3, 160)}
+
+
+def test_unchanged_dirs_are_not_rescanned(tmp_path, mocker):
+    """test only directories whose mtime changed are listed again"""
+    package = tmp_path / "123456"
+    make_package(package)
+    with IndexStore(tmp_path / "index.sqlite") as store:
+        package_size.package_sizes(store, str(tmp_path), [package])
+
+        (package / "data" / "nested" / "c.mkv").write_bytes(b"x" * 5)
+        nested = package / "data" / "nested"
+        os.utime(nested, ns=(0, nested.stat().st_mtime_ns + 1_000_000_000))
+        spy = mocker.spy(package_size, "scan_sizes")
+        sizes = package_size.package_sizes(store, str(tmp_path), [package])
+
+    assert sizes[package] == PackageSize(4, 165)
+    assert [c.args[0] for c in spy.call_args_list] == [str(nested)]
+
+
+def test_progress():
+    """test the ETA follows the rate so far"""
+    progress = package_size.Progress(1000)
+    assert progress.eta() is None
+
+    progress.advance(500)
+    assert progress.eta() is not None
+    assert progress.report().startswith("500 B of 1000 B")
+
+
+def test_measuring_first_doesnt_hide_the_index(tmp_path, monkeypatch):
+    """test size records written before the index was built don't stand in for a built index"""
+    monkeypatch.setattr(volume_index, "INDEX_DIR", tmp_path / "index")
+    root = tmp_path / "volume"
+    make_package(root / "a" / "123456")
+    make_package(root / "b" / "234567")
+
+    package_size.measure_packages(root, [root / "a" / "123456"])
+    found = index_query.lookup([root], ["123456", "234567"], refresh_index=False)
+
+    assert sorted(found) == ["123456", "234567"]
@@ -0,0 +1,42 @@
+from repair_tools import prsv_api
+from tests.prsv_fakes import FakeClient
+
+
+def test_search_titles_batches_and_maps_hits(monkeypatch):
+    """test titles share searches and every hit is mapped back to its title"""
+    monkeypatch.setattr(prsv_api, "PAGE_SIZE", 2)
+    uuid = "00000000-0000-0000-0000-00000000000{}"
+    client = FakeClient(
+        [(uuid.format(1), "M1_ER_1", "parent"), (uuid.format(2), "M1_ER_2", "parent"), (uuid.format(3), "M1_ER_2", "parent")]
+    )
+    titles = [f"M1_ER_{i}" for i in range(1, 6)]
+
+    found = prsv_api.search_titles(client, titles, "parent", batch_size=3)
+
+    assert found == {
+        "M1_ER_1": [uuid.format(1)],
+        "M1_ER_2": [uuid.format(2), uuid.format(3)],
+        "M1_ER_3": [],
+        "M1_ER_4": [],
+        "M1_ER_5": [],
+    }
+    assert client.queries[0] == ["M1_ER_1", "M1_ER_2", "M1_ER_3"]
+    assert client.queries[-1] == ["M1_ER_4", "M1_ER_5"]
+
+
+def test_iter_search_pages_lazily(monkeypatch):
+    """test pages are only requested as hits are used, and stop with the consumer"""
+    monkeypatch.setattr(prsv_api, "MAX_PAGE_SIZE", 3)
+    uuids = [f"00000000-0000-0000-0000-{i:012d}" for i in range(10)]
+    client = FakeClient([(uuid, "M1_ER_1", "parent") for uuid in uuids])
+    query = {"q": "", "fields": [{"name": "xip.title", "values": ["M1_ER_1"]}]}
+
+    hits = prsv_api.iter_search(client, query, "parent", page_size=50)
+    assert next(hits) == (uuids[0], [{"name": "xip.title", "value": "M1_ER_1"}])
+    assert len(client.queries) == 1
+    hits.close()
+
+    assert [hit.uuid for hit in prsv_api.iter_search(client, query, "parent", limit=4)] == uuids[:4]
+    assert len(client.queries) == 3
+    assert len(list(prsv_api.iter_search(client, query, "parent"))) == 10
+    assert len(client.queries) == 7
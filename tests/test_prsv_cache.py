@@ -0,0 +1,71 @@
+import json
+import sqlite3
+from types import SimpleNamespace
+
+from repair_tools import prsv_api, prsv_cache
+from repair_tools.prsv_cache import LookupCache
+
+PROD = SimpleNamespace(base_url="https://nypl.preservica.com/api")
+MOCK = SimpleNamespace(base_url="http://127.0.0.1:8080/api")
+
+
+def test_answers_are_cached_with_ttl(tmp_path, mocker):
+    """test found and not found answers are reused until they age out"""
+    search = mocker.patch.object(
+        prsv_api, "search_titles", side_effect=lambda client, titles, *args: {t: (["uuid-a"] if t == "A" else []) for t in titles}
+    )
+    cache = LookupCache(tmp_path / "lookups.sqlite", ttl=100, negative_ttl=10)
+    clock = mocker.patch.object(prsv_cache.time, "time", return_value=1000)
+
+    assert prsv_cache.search_titles(PROD, cache, ["A", "B"], "parent") == {"A": ["uuid-a"], "B": []}
+    assert prsv_cache.search_titles(PROD, cache, ["B", "A"], "parent") == {"B": [], "A": ["uuid-a"]}
+    assert search.call_count == 1
+
+    # only the stale negative answer is asked again
+    clock.return_value = 1050
+    prsv_cache.search_titles(PROD, cache, ["A", "B"], "parent")
+    assert search.call_args.args[1] == ["B"]
+
+    # other parents and other filters are separate answers
+    prsv_cache.search_titles(PROD, cache, ["A"], "other")
+    prsv_cache.search_titles(PROD, cache, ["A"], "parent", [{"name": "x", "values": ["y"]}])
+    assert search.call_count == 4
+
+    # answers from another server, e.g. the mock, are never served for production and back
+    assert prsv_cache.search_titles(MOCK, cache, ["A"], "parent") == {"A": ["uuid-a"]}
+    assert search.call_count == 5
+
+
+def test_caches_without_servers_are_dropped(tmp_path):
+    """test answers cached before they were kept per server are not trusted"""
+    db_path = tmp_path / "lookups.sqlite"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE lookups (parent TEXT, query TEXT, title TEXT, uuids TEXT, checked REAL)")
+    conn.execute("INSERT INTO lookups VALUES ('parent', '', 'A', '[]', 0)")
+    conn.commit()
+    conn.close()
+
+    with LookupCache(db_path) as cache:
+        assert cache.counts() == {}
+
+
+def test_invalidate(tmp_path):
+    """test answers are dropped per parent hierarchy and per title"""
+    query = prsv_cache.query_key()
+    with LookupCache(tmp_path / "lookups.sqlite") as cache:
+        cache.put_many(PROD.base_url, "p1", query, {"A": ["uuid-a"], "B": []})
+        cache.put_many(PROD.base_url, "p2", query, {"A": []})
+        cache.put_many(MOCK.base_url, "p1", query, {"A": []})
+        assert cache.counts() == {
+            (MOCK.base_url, "p1"): (0, 1),
+            (PROD.base_url, "p1"): (1, 1),
+            (PROD.base_url, "p2"): (0, 1),
+        }
+
+        assert cache.invalidate("p1", ["A"], server=MOCK.base_url) == 1
+        assert cache.invalidate("p1", ["A"]) == 1
+        assert cache.get_many(PROD.base_url, "p1", query, ["A", "B"]) == {"B": []}
+        assert cache.invalidate("p2") == 1
+        assert cache.get_many(PROD.base_url, "p2", query, ["A"]) == {}
+        assert cache.invalidate() == 1
+        assert json.loads(prsv_cache.query_key([{"name": "x"}], "%"))["q"] == "%"
@@ -0,0 +1,86 @@
+import pytest
+import requests
+
+from repair_tools import prsv_api, prsv_client
+from repair_tools.prsv_client import PreservicaClient
+from repair_tools.prsv_tokens import TokenManager
+from tests.prsv_fakes import make_response
+
+
+@pytest.fixture
+def client(mocker, tmp_path):
+    """client with tokens handed out without credentials and sleeps skipped"""
+    tokens = iter(["token-1", "token-2", "token-3"])
+    mocker.patch.object(prsv_api, "request_token", side_effect=lambda *args: next(tokens))
+    sleep = mocker.patch.object(prsv_client.time, "sleep")
+    manager = TokenManager(tmp_path / "tokens.json")
+    client = PreservicaClient("test-ingest", base_url="https://prsv.test/api", retries=3, tokens=manager)
+    client.sleep = sleep
+    return client
+
+
+def test_retries_transient_errors(client, mocker):
+    """test 5xx responses and connection errors are retried with backoff"""
+    send = mocker.patch.object(
+        client.session,
+        "request",
+        side_effect=[make_response(503), requests.ConnectionError("reset"), make_response(200)],
+    )
+
+    response = client.get("content/search-within", params={"q": "x"})
+
+    assert response.status_code == 200
+    assert send.call_count == 3
+    assert client.sleep.call_count == 2
+    assert send.call_args.args == ("GET", "https://prsv.test/api/content/search-within")
+
+
+def test_gives_up_after_retries(client, mocker):
+    """test the last response is returned once retries run out"""
+    mocker.patch.object(client.session, "request", return_value=make_response(502))
+
+    assert client.get("admin/schemas").status_code == 502
+    assert client.sleep.call_count == 3
+
+
+def test_reauthenticates_once_on_401(client, mocker):
+    """test an expired token is replaced and the request sent again"""
+    send = mocker.patch.object(
+        client.session, "request", side_effect=[make_response(401), make_response(200), make_response(401), make_response(401)]
+    )
+
+    assert client.get("admin/schemas").status_code == 200
+    tokens = [c.kwargs["headers"]["Preservica-Access-Token"] for c in send.call_args_list]
+    assert tokens == ["token-1", "token-2"]
+
+    # a token that is still refused is not renewed forever
+    assert client.get("admin/schemas").status_code == 401
+    assert prsv_api.request_token.call_count == 3
+
+
+def test_backoff_is_capped(client):
+    """test jittered delays stay within the exponential cap"""
+    client.max_backoff = 5
+    assert all(0 <= client.delay(attempt) <= min(5, 2**attempt) for attempt in range(10))
+
+
+def test_put_is_not_retried(client, mocker):
+    """test a failed PUT is not sent again, the server may already have acted on it"""
+    send = mocker.patch.object(client.session, "request", side_effect=[make_response(503), make_response(202)])
+
+    assert client.put("entity/structural-objects/x/parent-ref", data="y").status_code == 503
+    assert send.call_count == 1
+    assert client.sleep.call_count == 0
+
+    send = mocker.patch.object(client.session, "request", side_effect=requests.Timeout("read timed out"))
+    with pytest.raises(requests.Timeout):
+        client.put("entity/structural-objects/x/parent-ref", data="y")
+    assert send.call_count == 1
+
+
+def test_post_retries_when_asked(client, mocker):
+    """test a request marked safe to retry is retried whatever its method"""
+    send = mocker.patch.object(client.session, "request", side_effect=[make_response(502), make_response(200)])
+
+    assert client.post(prsv_api.TOKEN_PATH, auth=False, retry=True).status_code == 200
+    assert send.call_count == 2
@@ -0,0 +1,79 @@
+import logging
+import sqlite3
+
+from repair_tools import compare_sources
+from repair_tools.prsv_mirror import Mirror, fetch_objects
+from tests.prsv_fakes import UUID, FakeClient
+
+
+def test_snapshot_and_lookup(tmp_path):
+    """test every page is fetched and titles are answered from the mirror"""
+    objects = [(UUID.format(i), f"M1_ER_{i}", "digarch", []) for i in range(25)]
+    objects.append((UUID.format(99), "M1_ER_1", "digarch", ["other"]))
+    client = FakeClient(objects)
+
+    assert sorted(fetch_objects(client, "digarch", concurrency=4, page_size=10)) == sorted(objects)
+    assert sorted(client.starts) == [0, 10, 20]
+
+    with Mirror(tmp_path / "mirror.sqlite") as mirror:
+        assert mirror.snapshot(client, "digarch", page_size=10) == 26
+        found = mirror.search_titles(["M1_ER_1", "M1_ER_3", "M9_ER_1"], "digarch")
+        assert found == {"M1_ER_1": [UUID.format(1), UUID.format(99)], "M1_ER_3": [UUID.format(3)], "M9_ER_1": []}
+
+        # a move into an unmirrored folder takes the object out of the mirror
+        mirror.record_move(UUID.format(3), "deletion-folder")
+        assert mirror.search_titles(["M1_ER_3"], "digarch") == {"M1_ER_3": []}
+
+        # a move within the hierarchy keeps it there
+        mirror.record_move(UUID.format(4), UUID.format(5))
+        assert mirror.search_titles(["M1_ER_4"], "digarch") == {"M1_ER_4": [UUID.format(4)]}
+
+
+def test_check_mirror(tmp_path):
+    """test packages are checked against their folder's snapshot, and unmirrored folders reported"""
+    with Mirror(tmp_path / "mirror.sqlite") as mirror:
+        mirror.replace("digarch", [(UUID.format(1), "M1_ER_1", "digarch", [])])
+
+        found, errors = compare_sources.check_mirror(
+            mirror, ["M1_ER_1", "M1_ER_2", "123456"], "digarch", "ami", logging.getLogger()
+        )
+
+    assert found == {"M1_ER_1": [UUID.format(1)], "M1_ER_2": []}
+    assert errors == {"123456": "no mirror of ami"}
+
+
+def test_check_mirror_filters_ami_containers(tmp_path):
+    """test AMI packages only count as found when the object is a DigitizedAMIContainer, as in the API search"""
+    objects = [
+        (UUID.format(1), "123456", "ami", [compare_sources.AMI_CONTAINER]),
+        (UUID.format(2), "234567", "ami", ["other"]),
+    ]
+    with Mirror(tmp_path / "mirror.sqlite") as mirror:
+        mirror.snapshot(FakeClient(objects), "ami")
+
+        found, errors = compare_sources.check_mirror(mirror, ["123456", "234567"], "digarch", "ami", logging.getLogger())
+
+    assert found == {"123456": [UUID.format(1)], "234567": []}
+    assert errors == {}
+
+
+def test_check_mirror_refuses_snapshots_without_identifiers(tmp_path):
+    """test a mirror taken before identifiers were stored can't answer for AMI packages"""
+    db_path = tmp_path / "mirror.sqlite"
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        CREATE TABLE objects (hierarchy TEXT NOT NULL, uuid TEXT NOT NULL, title TEXT, parent TEXT, PRIMARY KEY (hierarchy, uuid));
+        CREATE TABLE snapshots (hierarchy TEXT PRIMARY KEY, taken REAL NOT NULL, objects INTEGER NOT NULL);
+        INSERT INTO objects VALUES ('ami', 'uuid-1', '123456', 'ami');
+        INSERT INTO snapshots VALUES ('ami', 0, 1);
+        """
+    )
+    conn.close()
+
+    with Mirror(db_path) as mirror:
+        found, errors = compare_sources.check_mirror(mirror, ["123456"], "digarch", "ami", logging.getLogger())
+        assert mirror.search_titles(["123456"], "ami") == {"123456": ["uuid-1"]}
+
+    assert found == {}
+    assert list(errors) == ["123456"]
@@ -0,0 +1,101 @@
+import pytest
+
+from repair_tools import compare_sources, prsv_api, prsv_benchmark, prsv_mirror, prsv_mock, prsv_move, prsv_progress
+from repair_tools.prsv_benchmark import mock_client
+from repair_tools.prsv_mock import MockPreservica
+
+
+@pytest.fixture
+def mock():
+    with MockPreservica(seed=0) as mock:
+        mock.base_url = mock.start()
+        mock.ingest = mock.add_object("INGEST")
+        mock.deletion = mock.add_object("DELETION")
+        mock.add_packages(mock.ingest, [f"M1_ER_{i}" for i in range(30)])
+        yield mock
+
+
+def test_lookup_and_move_flows(mock):
+    """test the client resolves, moves and tracks packages against the mock"""
+    client = mock_client(mock, mock.base_url, 4)
+    assert prsv_api.find_apiversion(client) == "7.0"
+
+    resolved = prsv_move.resolve_all(client, ["M1_ER_1", "M1_ER_2", "M9_ER_1"], mock.ingest, mock.deletion, concurrency=2)
+    assert resolved["M9_ER_1"] is None
+    assert mock.objects[resolved["M1_ER_1"]][0] == "M1_ER_1"
+
+    to_move = {title: uuid for title, uuid in resolved.items() if uuid}
+    started = prsv_move.move_all(client, to_move, mock.deletion, concurrency=2)
+    assert all(move.token for move in started.values())
+
+    results = prsv_progress.track(client, started.values())
+    assert sorted(m.title for m in results[prsv_progress.COMPLETED]) == ["M1_ER_1", "M1_ER_2"]
+    assert prsv_move.resolve_all(client, ["M1_ER_1"], mock.ingest, mock.deletion) == {"M1_ER_1": True}
+
+
+def test_expired_tokens_and_errors_are_survived(mock):
+    """test 401s from expired tokens and injected 503s are handled by the client"""
+    mock.token_ttl = 0
+    client = mock_client(mock, mock.base_url, 4)
+    client.backoff = 0.001
+
+    response = client.get("admin/schemas")
+    assert response.status_code == 401
+    assert mock.requests["POST accesstoken/login"] == 2
+
+    mock.token_ttl = 500
+    mock.error_rate = 0.3
+    found = prsv_api.search_titles(client, [f"M1_ER_{i}" for i in range(30)], mock.ingest, batch_size=5)
+    assert all(len(uuids) == 1 for uuids in found.values())
+
+
+def test_identifier_filters_are_applied(mock, tmp_path):
+    """test searches filtered on identifiers and collections only return the matching objects"""
+    ami = mock.add_object("AMI")
+    containers = mock.add_packages(ami, ["100001", "100002"], ["DigitizedAMIContainer"])
+    mock.add_packages(ami, ["100001"], ["DigitizedAMIMaster"])
+    client = mock_client(mock, mock.base_url, 4)
+
+    fields = [{"name": "xip.identifier", "values": ["DigitizedAMIContainer"]}]
+    found = prsv_api.search_titles(client, ["100001", "100002", "100003"], ami, fields, q="%")
+    assert found == {"100001": [containers[0]], "100002": [containers[1]], "100003": []}
+
+    fields = [{"name": "spec.specCollectionID", "values": ["M2"]}]
+    assert prsv_api.search_titles(client, ["M1_ER_1"], mock.ingest, fields) == {"M1_ER_1": []}
+
+    # the mirror records the identifiers and filters on them the same way
+    with prsv_mirror.Mirror(tmp_path / "mirror.db") as mirror:
+        mirror.snapshot(client, ami)
+        assert mirror.search_titles(["100001"], ami, "DigitizedAMIContainer") == {"100001": [containers[0]]}
+
+
+def test_populated_folders_are_the_ones_the_tools_search(mock):
+    """test packages are filed under the folder uuids compare_sources and prsv_move search"""
+    prsv_mock.populate(mock, 40)
+    client = mock_client(mock, mock.base_url, 4)
+
+    found = compare_sources.get_amipackages_uuids(client, ["100001"], prsv_mirror.HIERARCHIES["digami"])
+    assert len(found["100001"]) == 1
+    found = compare_sources.get_packages_uuids(client, ["M1001_ER_3"], prsv_mirror.HIERARCHIES["digarch"])
+    assert len(found["M1001_ER_3"]) == 1
+    resolved = prsv_move.resolve_all(client, ["M1000_ER_1"], prsv_mirror.HIERARCHIES["ingest"], mock.deletion)
+    assert isinstance(resolved["M1000_ER_1"], str)
+
+
+def test_benchmark_skips_unresolved_titles(mock, mocker):
+    """test titles that didn't resolve, or are already moved, are counted as skipped instead of moved"""
+    resolve_all = prsv_move.resolve_all
+
+    def partly_resolved(*args, **kwargs):
+        resolved = resolve_all(*args, **kwargs)
+        for title, outcome in (("M1_ER_0", None), ("M1_ER_1", True)):
+            if title in resolved:
+                resolved[title] = outcome
+        return resolved
+
+    mocker.patch.object(prsv_move, "resolve_all", side_effect=partly_resolved)
+    results = {r.flow: r for r in prsv_benchmark.benchmark(mock, mock.base_url, mock.ingest, 5, 2)}
+
+    assert (results["move, serial"].items, results["move, serial"].skipped) == (3, 2)
+    assert (results["move, 2 workers"].items, results["move, 2 workers"].skipped) == (25, 0)
+    assert mock.requests["PUT entity/structural-objects"] == 28
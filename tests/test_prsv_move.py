@@ -0,0 +1,63 @@
+import pytest
+import requests
+
+from repair_tools import prsv_api, prsv_move
+from tests.prsv_fakes import UUID, FakeClient
+
+INGEST = "ingest"
+DELETION = "deletion"
+
+
+@pytest.fixture
+def objects():
+    """five packages in the ingest folder and two already in the deletion folder"""
+    return [(UUID.format(i), f"M1_ER_{i}", INGEST) for i in range(5)] + [
+        (UUID.format(10 + i), f"M2_ER_{i}", DELETION) for i in range(2)
+    ]
+
+
+def test_resolve_all(objects, monkeypatch):
+    """test titles resolve to their uuid, True when already moved and None when in neither folder"""
+    monkeypatch.setattr(prsv_api, "TITLE_BATCH", 3)
+    client = FakeClient(objects)
+    titles = [f"M1_ER_{i}" for i in range(5)] + ["M2_ER_0", "M2_ER_1", "M9_ER_1", "M1_ER_0"]
+
+    resolved = prsv_move.resolve_all(client, titles, INGEST, DELETION, concurrency=3)
+
+    assert resolved == {
+        **{f"M1_ER_{i}": UUID.format(i) for i in range(5)},
+        "M2_ER_0": True,
+        "M2_ER_1": True,
+        "M9_ER_1": None,
+    }
+
+
+def test_resolve_all_keeps_failed_batches(objects, monkeypatch):
+    """test a batch whose search raises comes back as None for each of its titles, not dropped"""
+    monkeypatch.setattr(prsv_api, "TITLE_BATCH", 2)
+    client = FakeClient(objects, failing_titles={"M1_ER_2"})
+    titles = [f"M1_ER_{i}" for i in range(5)]
+
+    resolved = prsv_move.resolve_all(client, titles, INGEST, DELETION, concurrency=2)
+
+    assert list(resolved) == titles
+    assert resolved["M1_ER_2"] is None and resolved["M1_ER_3"] is None
+    assert [resolved[f"M1_ER_{i}"] for i in (0, 1, 4)] == [UUID.format(0), UUID.format(1), UUID.format(4)]
+
+
+def test_move_all(objects):
+    """test moves that are refused or raise are None while the rest still start"""
+    failing = {
+        UUID.format(1): 500,
+        UUID.format(2): requests.exceptions.ConnectionError("reset"),
+        UUID.format(3): RuntimeError("unexpected"),
+    }
+    client = FakeClient(objects, failing_moves=failing)
+    to_move = {f"M1_ER_{i}": UUID.format(i) for i in range(5)}
+
+    started = prsv_move.move_all(client, to_move, DELETION, concurrency=3)
+
+    assert {title for title, move in started.items() if move is None} == {"M1_ER_1", "M1_ER_2", "M1_ER_3"}
+    assert started["M1_ER_0"] == prsv_move.prsv_progress.Move("M1_ER_0", UUID.format(0), DELETION, "token-00")
+    assert started["M1_ER_4"].token == "token-04"
+    assert sorted(client.moved) == [(UUID.format(0), DELETION), (UUID.format(4), DELETION)]
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import requests
+
+from repair_tools import prsv_progress
+from repair_tools.prsv_progress import COMPLETED, FAILED, RUNNING, Move
+from tests.prsv_fakes import make_response
+
+
+class FakeClient:
+    """progress and entity answers from fixed queues per path"""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.paths = []
+
+    def get(self, path, **kwargs):
+        self.paths.append(path)
+        return self.answers[path].pop(0)
+
+
+def progress(status: str) -> requests.Response:
+    return make_response(200, f'<ProgressResponse xmlns="http://preservica.com/EntityAPI/v7.0"><Status>{status}</Status></ProgressResponse>')
+
+
+def test_track_polls_until_settled(mocker):
+    """test moves are polled with backoff until done, and each outcome reported"""
+    sleep = mocker.patch.object(prsv_progress.time, "sleep")
+    moves = [
+        Move("M1_ER_1", "uuid-1", "new", "token-1"),
+        Move("M1_ER_2", "uuid-2", "new", "token-2"),
+        Move("M1_ER_3", "uuid-3", "new", None),
+        Move("M1_ER_4", "uuid-4", "new", "token-4"),
+    ]
+    client = FakeClient(
+        {
+            "entity/progress/token-1": [progress("ACTIVE"), progress("COMPLETED")],
+            "entity/progress/token-2": [progress("FAILED")],
+            "entity/structural-objects/uuid-3": [make_response(200, "<StructuralObject><Parent>new</Parent></StructuralObject>")],
+            "entity/progress/token-4": [progress("ACTIVE"), progress("ACTIVE"), progress("ACTIVE")],
+        }
+    )
+
+    results = prsv_progress.track(client, moves, concurrency=2, timeout=5, backoff=2, max_backoff=10)
+
+    assert [m.title for m in results[COMPLETED]] == ["M1_ER_3", "M1_ER_1"]
+    assert [m.title for m in results[FAILED]] == ["M1_ER_2"]
+    assert [m.title for m in results[RUNNING]] == ["M1_ER_4"]
+    # backoff doubles, polling stops once the next pause would overrun the timeout (sleeps are skipped here)
+    assert [c.args[0] for c in sleep.call_args_list] == [2, 4]
+
+
+def test_moves_file_round_trip(tmp_path):
+    """test recorded moves are loaded back and settled ones dropped"""
+    moves_file = tmp_path / "moves.jsonl"
+    moves = [Move("M1_ER_1", "uuid-1", "new", "token-1"), Move("M1_ER_2", "uuid-2", "new", None)]
+    prsv_progress.save_moves(moves_file, moves[:1])
+    prsv_progress.save_moves(moves_file, moves[1:])
+    assert prsv_progress.load_moves(moves_file) == moves
+
+    prsv_progress.settle(moves_file, {COMPLETED: moves[:1], FAILED: [], RUNNING: moves[1:]})
+    assert prsv_progress.load_moves(moves_file) == moves[1:]
+
+
+def test_expired_token_falls_back_to_parent_ref():
+    """test a move whose progress token is gone is judged by the package's parent"""
+    moves = [Move("M1_ER_1", "uuid-1", "new", "token-1"), Move("M1_ER_2", "uuid-2", "new", "token-2")]
+    client = FakeClient(
+        {
+            "entity/progress/token-1": [make_response(404, "not found")],
+            "entity/structural-objects/uuid-1": [make_response(200, "<StructuralObject><Parent>new</Parent></StructuralObject>")],
+            "entity/progress/token-2": [make_response(404, "not found")],
+            "entity/structural-objects/uuid-2": [make_response(200, "<StructuralObject><Parent>old</Parent></StructuralObject>")],
+        }
+    )
+
+    results = prsv_progress.track(client, moves)
+
+    assert results[COMPLETED] == moves[:1]
+    assert results[RUNNING] == moves[1:]
+    assert results[FAILED] == []
+
+
+def test_settle_keeps_moves_appended_while_it_waits(tmp_path):
+    """test settle waits for the lock, and keeps moves another process appended meanwhile"""
+    moves_file = tmp_path / "moves.jsonl"
+    done = Move("M1_ER_1", "uuid-1", "new", "token-1")
+    prsv_progress.save_moves(moves_file, [done])
+    appended = Move("M1_ER_2", "uuid-2", "new", "token-2")
+
+    with prsv_progress.moves_lock(moves_file):
+        settling = threading.Thread(target=prsv_progress.settle, args=(moves_file, {COMPLETED: [done], FAILED: [], RUNNING: []}))
+        settling.start()
+        time.sleep(0.1)
+        assert settling.is_alive()
+        with open(moves_file, "a") as f:
+            f.write('{"title": "M1_ER_2", "uuid": "uuid-2", "new_parent": "new", "token": "token-2"}\n')
+    settling.join(timeout=5)
+
+    assert prsv_progress.load_moves(moves_file) == [appended]
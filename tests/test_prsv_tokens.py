@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+
+from repair_tools.prsv_tokens import TokenManager
+
+
+def counter(prefix: str = "token"):
+    """a request_token stand-in handing out numbered tokens"""
+    issued = []
+
+    def request_token():
+        issued.append(f"{prefix}-{len(issued) + 1}")
+        return issued[-1]
+
+    request_token.issued = issued
+    return request_token
+
+
+def test_token_is_reused_across_threads(tmp_path):
+    """test concurrent callers share one requested token"""
+    manager = TokenManager(tmp_path / "tokens.json")
+    request_token = counter()
+    manager.register("test-ingest", request_token)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get("test-ingest"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["token-1"] * 8
+    assert request_token.issued == ["token-1"]
+
+
+def test_token_is_shared_through_cache_file(tmp_path):
+    """test a second manager, as in another process, adopts the cached token"""
+    cache_file = tmp_path / "tokens.json"
+    first = TokenManager(cache_file)
+    first.register("test-ingest", counter("first"))
+    assert first.get("test-ingest") == "first-1"
+    assert cache_file.stat().st_mode & 0o777 == 0o600
+
+    second = TokenManager(cache_file)
+    request_token = counter("second")
+    second.register("test-ingest", request_token)
+    assert second.get("test-ingest") == "first-1"
+    assert request_token.issued == []
+
+    # a refused token is replaced once, and the replacement is shared back
+    assert second.renew("test-ingest", "first-1") == "second-1"
+    assert second.renew("test-ingest", "first-1") == "second-1"
+    assert first.renew("test-ingest", "first-1") == "second-1"
+    assert json.loads(cache_file.read_text())["test-ingest"]["token"] == "second-1"
+
+
+def test_stale_tokens_are_renewed_early(tmp_path):
+    """test tokens close to expiry are replaced, by callers and in the background"""
+    manager = TokenManager(tmp_path / "tokens.json", lifetime=500, margin=60)
+    request_token = counter()
+    manager.register("test-ingest", request_token)
+    assert manager.get("test-ingest") == "token-1"
+
+    # 450 seconds old is inside the refresh margin
+    manager._tokens["test-ingest"] = ("token-1", time.time() - 450)
+    manager._write_cache("test-ingest", "token-1", time.time() - 450)
+    assert manager.get("test-ingest") == "token-2"
+
+    manager.stop()
+
+
+def test_background_renewal_keeps_callers_from_renewing(tmp_path):
+    """test the refresh thread replaces tokens before get() would have to"""
+    background = TokenManager(None, lifetime=1.5, margin=0.3)
+    request_token = counter()
+    renewed_by = []
+
+    def tracked():
+        renewed_by.append(threading.current_thread().name)
+        return request_token()
+
+    background.register("test-ingest", tracked)
+    background.get("test-ingest")
+    deadline = time.time() + 2.5
+    while time.time() < deadline:
+        background.get("test-ingest")
+        time.sleep(0.01)
+    background.stop()
+
+    assert len(renewed_by) >= 2
+    # only the first token was requested by a caller
+    assert renewed_by[1:] == ["prsv-token-refresh"] * (len(renewed_by) - 1)
@@ -0,0 +1,58 @@
+from repair_tools import volume_diff
+
+
+def make_package(path, manifest: str):
+    path.mkdir(parents=True)
+    (path / "manifest-md5.txt").write_text(manifest)
+
+
+def test_merge_join():
+    """test names are joined across both sorted streams"""
+    source = [("111111", "/s/111111"), ("222222", "/s/a/222222"), ("222222", "/s/b/222222")]
+    target = [("222222", "/t/222222"), ("333333", "/t/333333")]
+
+    assert list(volume_diff.merge_join(source, target)) == [
+        ("111111", ["/s/111111"], []),
+        ("222222", ["/s/a/222222", "/s/b/222222"], ["/t/222222"]),
+        ("333333", [], ["/t/333333"]),
+    ]
+
+
+def test_diff(tmp_path):
+    """test every package is classified by presence and fingerprint"""
+    for side in ("s", "t"):
+        make_package(tmp_path / side / "222222", "abc  data/file.mkv\n")
+    make_package(tmp_path / "s" / "333333", "abc  data/file.mkv\n")
+    make_package(tmp_path / "t" / "333333", "def  data/file.mkv\n")
+    make_package(tmp_path / "s" / "111111", "")
+    make_package(tmp_path / "t" / "444444", "")
+
+    def listing(side):
+        return [(p.name, str(p)) for p in sorted((tmp_path / side).iterdir())]
+
+    entries = list(volume_diff.diff(listing("s"), listing("t"), num_threads=1))
+
+    assert [(e.name, e.status) for e in entries] == [
+        ("111111", volume_diff.ONLY_SOURCE),
+        ("222222", volume_diff.IDENTICAL),
+        ("333333", volume_diff.DIFFERING),
+        ("444444", volume_diff.ONLY_TARGET),
+    ]
+
+
+def test_diff_names_only():
+    """test packages on both sides are matched without touching them"""
+    entries = list(volume_diff.diff([("111111", "/s/111111")], [("111111", "/t/111111")], fingerprint=False))
+
+    assert entries == [volume_diff.DiffEntry("111111", volume_diff.IN_BOTH, ["/s/111111"], ["/t/111111"])]
+
+
+def test_unreadable_copy_is_not_differing(tmp_path):
+    """test a copy that can't be fingerprinted is reported with its error instead of as differing"""
+    make_package(tmp_path / "s" / "111111", "abc  data/file.mkv\n")
+    gone = str(tmp_path / "t" / "111111")
+
+    entries = list(volume_diff.diff([("111111", str(tmp_path / "s" / "111111"))], [("111111", gone)], num_threads=1))
+
+    assert [(e.name, e.status) for e in entries] == [("111111", volume_diff.UNREADABLE)]
+    assert isinstance(entries[0].error, FileNotFoundError)
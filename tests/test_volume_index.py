@@ -0,0 +1,203 @@
+import errno
+import os
+from pathlib import Path
+
+import pytest
+
+from repair_tools import volume_index, walker
+
+
+@pytest.fixture
+def volume(tmp_path):
+    """creates a small volume with AMI and DigArch packages"""
+    root = tmp_path / "volume"
+    (root / "folder_A" / "123456" / "data").mkdir(parents=True)
+    (root / "folder_B" / "nested" / "789012").mkdir(parents=True)
+    (root / "folder_B" / "M1234_ER_5").mkdir(parents=True)
+    (root / "folder_B" / "not_a_match").mkdir()
+    (root / "12345").mkdir()  # name too short
+    (root / "a_file.txt").touch()
+    return root
+
+
+def test_open_index_finds_packages(volume, tmp_path):
+    """test index maps package names to their paths"""
+    with volume_index.open_index(volume, index_file=tmp_path / "index.sqlite") as store:
+        assert {name for name, _ in store.items()} == {"123456", "789012", "M1234_ER_5"}
+        assert store.get("789012") == [str(volume / "folder_B" / "nested" / "789012")]
+
+
+def test_open_index_does_not_descend_into_packages(volume, tmp_path):
+    """test dirs inside a package are not walked"""
+    (volume / "folder_A" / "123456" / "data" / "654321").mkdir()
+    with volume_index.open_index(volume, index_file=tmp_path / "index.sqlite") as store:
+        assert "654321" not in store
+
+
+def test_refresh_only_lists_changed_dirs(volume, tmp_path, mocker):
+    """test unchanged directories are reused from the cached index"""
+    index_file = tmp_path / "index.sqlite"
+    volume_index.open_index(volume, index_file=index_file).close()
+
+    new_pkg = volume / "folder_A" / "222222"
+    new_pkg.mkdir()
+    spy = mocker.spy(walker, "scan_dir")
+
+    with volume_index.open_index(volume, index_file=index_file) as store:
+        assert store.get("222222") == [str(new_pkg)]
+    assert [c.args[0] for c in spy.call_args_list] == [str(volume / "folder_A")]
+
+
+def test_refresh_drops_removed_packages(volume, tmp_path):
+    """test packages removed since the last run leave the index"""
+    index_file = tmp_path / "index.sqlite"
+    volume_index.open_index(volume, index_file=index_file).close()
+
+    os.rmdir(volume / "folder_B" / "M1234_ER_5")
+    os.rmdir(volume / "folder_B" / "nested" / "789012")
+    os.rmdir(volume / "folder_B" / "nested")
+
+    with volume_index.open_index(volume, index_file=index_file) as store:
+        assert "M1234_ER_5" not in store
+        assert "789012" not in store
+        assert store.count() == 1
+
+
+def test_cached_index_is_not_refreshed(volume, tmp_path):
+    """test refresh_index=False reads the index as it was saved"""
+    index_file = tmp_path / "index.sqlite"
+    volume_index.open_index(volume, index_file=index_file).close()
+    (volume / "folder_A" / "222222").mkdir()
+
+    with volume_index.open_index(volume, refresh_index=False, index_file=index_file) as store:
+        assert "222222" not in store
+
+
+def test_rebuild_ignores_cache(volume, tmp_path, mocker):
+    """test rebuild lists every directory again"""
+    index_file = tmp_path / "index.sqlite"
+    volume_index.open_index(volume, index_file=index_file).close()
+    spy = mocker.spy(walker, "scan_dir")
+
+    volume_index.open_index(volume, rebuild=True, index_file=index_file).close()
+
+    assert spy.call_count == 6
+
+
+def test_index_path_is_per_volume(tmp_path):
+    """test two volumes with the same name get different index files"""
+    first = volume_index.index_path(Path("/Volumes/one/_reingest"), tmp_path)
+    second = volume_index.index_path(Path("/Volumes/two/_reingest"), tmp_path)
+
+    assert first != second
+    assert first.name.startswith("_reingest_")
+
+
+def test_validate_rewalks_only_moved_package_parent(volume, tmp_path, mocker):
+    """test a moved package is re-resolved by listing its old parent only"""
+    index_file = tmp_path / "index.sqlite"
+    volume_index.open_index(volume, index_file=index_file).close()
+
+    moved = volume / "folder_A" / "moved"
+    moved.mkdir()
+    os.rename(volume / "folder_A" / "123456", moved / "123456")
+    (volume / "folder_B" / "222222").mkdir()  # not validated, stays unknown
+    spy = mocker.spy(walker, "scan_dir")
+
+    with volume_index.open_index(volume, index_file=index_file, validate_names=["123456"]) as store:
+        assert store.get("123456") == [str(moved / "123456")]
+        assert "222222" not in store
+    assert {c.args[0] for c in spy.call_args_list} == {str(volume / "folder_A"), str(moved)}
+
+
+def test_validate_finds_package_moved_across_folders(volume, tmp_path):
+    """test a package moved out of its cached folder is found again by a full refresh"""
+    index_file = tmp_path / "index.sqlite"
+    volume_index.open_index(volume, index_file=index_file).close()
+
+    os.rename(volume / "folder_A" / "123456", volume / "folder_B" / "123456")
+
+    with volume_index.open_index(volume, index_file=index_file, validate_names=["123456"]) as store:
+        assert store.get("123456") == [str(volume / "folder_B" / "123456")]
+
+
+def test_validate_leaves_valid_entries_alone(volume, tmp_path, mocker):
+    """test nothing is listed when the cached paths are still current"""
+    index_file = tmp_path / "index.sqlite"
+    volume_index.open_index(volume, index_file=index_file).close()
+    spy = mocker.spy(walker, "scan_dir")
+
+    with volume_index.open_index(
+        volume, index_file=index_file, validate_names=["789012", "M1234_ER_5", "000000"]
+    ) as store:
+        assert store.get("789012") == [str(volume / "folder_B" / "nested" / "789012")]
+    spy.assert_not_called()
+
+
+def test_interrupted_build_resumes(volume, tmp_path, monkeypatch, mocker):
+    """test a build stopped after a checkpoint only lists what was left on restart"""
+    index_file = tmp_path / "index.sqlite"
+    monkeypatch.setattr(volume_index, "CHECKPOINT_DIRS", 1)
+    scan_dir = walker.scan_dir
+    listed = []
+
+    def interrupt(path, *args):
+        if len(listed) == 3:
+            raise KeyboardInterrupt
+        listed.append(path)
+        return scan_dir(path, *args)
+
+    mocker.patch.object(walker, "scan_dir", side_effect=interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        volume_index.open_index(volume, index_file=index_file, rebuild=True)
+    with volume_index.IndexStore(index_file) as store:
+        frontier, was_rebuild = store.load_frontier(str(volume))
+    assert frontier and was_rebuild
+
+    spy = mocker.patch.object(walker, "scan_dir", side_effect=scan_dir)
+    with volume_index.open_index(volume, index_file=index_file) as store:
+        assert {name for name, _ in store.items()} == {"123456", "789012", "M1234_ER_5"}
+        assert store.load_frontier(str(volume)) == ([], False)
+    assert len(listed) + spy.call_count <= 7
+
+
+def test_unreadable_dir_keeps_its_packages(volume, tmp_path, mocker):
+    """test a directory that can't be listed keeps its records and stays on the frontier"""
+    index_file = tmp_path / "index.sqlite"
+    volume_index.open_index(volume, index_file=index_file).close()
+    folder_b = volume / "folder_B"
+    (folder_b / "M1234_ER_6").mkdir()
+    scandir = os.scandir
+
+    def failing(path):
+        if str(path) == str(folder_b):
+            raise OSError(errno.EIO, "Input/output error", path)
+        return scandir(path)
+
+    mocker.patch.object(os, "scandir", side_effect=failing)
+    with volume_index.open_index(volume, index_file=index_file) as store:
+        assert {name for name, _ in store.items()} == {"123456", "789012", "M1234_ER_5"}
+        assert store.load_frontier(str(volume)) == ([str(folder_b)], False)
+
+    # still unreadable, so the rest of the volume is walked again instead of only retrying it
+    (volume / "folder_A" / "222222").mkdir()
+    with volume_index.open_index(volume, index_file=index_file) as store:
+        assert "222222" in store and "789012" in store
+        assert store.load_frontier(str(volume)) == ([str(folder_b)], False)
+
+    mocker.patch.object(os, "scandir", side_effect=scandir)
+    with volume_index.open_index(volume, index_file=index_file) as store:
+        assert "M1234_ER_6" in store and "789012" in store
+        assert store.load_frontier(str(volume)) == ([], False)
+
+
+def test_unreadable_root_is_not_refreshed(volume, tmp_path, mocker):
+    """test a volume that can't be listed raises without touching its index"""
+    index_file = tmp_path / "index.sqlite"
+    volume_index.open_index(volume, index_file=index_file).close()
+
+    mocker.patch.object(os, "scandir", side_effect=OSError(errno.EIO, "Input/output error"))
+    with volume_index.IndexStore(index_file) as store:
+        with pytest.raises(OSError):
+            volume_index.refresh(store, volume)
+        assert {name for name, _ in store.items()} == {"123456", "789012", "M1234_ER_5"}
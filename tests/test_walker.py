@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+from repair_tools import walker
+
+
+def is_ami(name: str) -> bool:
+    return len(name) == 6 and name.isdigit()
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """creates nested dirs with AMI packages at different depths"""
+    root = tmp_path / "source"
+    (root / "folder_A" / "123456" / "data" / "654321").mkdir(parents=True)
+    (root / "folder_B" / "nested" / "deeper" / "789012").mkdir(parents=True)
+    (root / "folder_C" / "789012").mkdir(parents=True)
+    (root / "folder_C" / "a_file.txt").touch()
+    return root
+
+
+def test_find_packages(tree):
+    """test every package is found, including duplicates"""
+    index = walker.find_packages(tree, is_ami, num_threads=4)
+
+    assert set(index) == {"123456", "789012"}
+    assert index["789012"] == sorted(
+        [
+            str(tree / "folder_B" / "nested" / "deeper" / "789012"),
+            str(tree / "folder_C" / "789012"),
+        ]
+    )
+
+
+def test_walk_prunes_packages(tree):
+    """test package directories are recorded but not descended into"""
+    walked = {path for path, _, _ in walker.walk(tree, is_ami)}
+
+    assert str(tree / "folder_A") in walked
+    assert str(tree / "folder_A" / "123456") not in walked
+    assert not any("654321" in path for path in walked)
+
+
+def test_walk_reuses_unchanged_listings(tree):
+    """test directories with a matching mtime are not listed again"""
+    previous = {path: record for path, record, _ in walker.walk(tree, is_ami, {})}
+    (tree / "folder_C" / "222222").mkdir()
+
+    listed = {path for path, _, was_listed in walker.walk(tree, is_ami, previous) if was_listed}
+
+    assert listed == {str(tree / "folder_C")}
+
+
+def test_walk_skips_missing_root(tmp_path):
+    """test a missing root yields nothing instead of raising"""
+    assert list(walker.walk(tmp_path / "missing", is_ami)) == []
+
+
+def test_scan_dir_ignores_symlinks(tree):
+    """test symlinked directories are not followed"""
+    os.symlink(tree / "folder_A", tree / "folder_C" / "link")
+    record = walker.scan_dir(str(tree / "folder_C"), 0, is_ami)
+
+    assert record["subdirs"] == []
+    assert record["packages"] == ["789012"]
+
+
+def test_walk_stats(tmp_path, mocker):
+    """test every directory is counted once and timed, and an uncached walk never stats them"""
+    (tmp_path / "a" / "123456").mkdir(parents=True)
+    (tmp_path / "b" / "789012").mkdir(parents=True)
+    stats = walker.WalkStats()
+    spy = mocker.spy(walker.os, "stat")
+
+    walker.find_packages(tmp_path, is_ami, stats=stats)
+
+    assert (stats.dirs, stats.listed, stats.packages, stats.stat_calls) == (3, 3, 2, 0)
+    assert "walk" in stats.phases
+    spy.assert_not_called()
+
+    stats = walker.WalkStats()
+    list(walker.walk(tmp_path, is_ami, {}, stats=stats))
+    assert (stats.dirs, stats.listed, stats.stat_calls) == (3, 3, 3)